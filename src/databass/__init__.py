@@ -37,9 +37,12 @@ def create_app():
     js_bundle.build()
 
     with app.app_context():
-        from .db.models import Base, Release, Artist, Label, Genre, Review, Goal
+        from .db.models import Base, Release, Artist, Label, Genre, Review, Goal, EntityRollup, create_search_indexes
         Base.metadata.bind = app_db.engine
         Base.metadata.create_all(app_db.engine)
+        create_search_indexes(app_db.engine)
+        if EntityRollup.rebuild_if_empty():
+            print('Artist/label rollups calculated from the existing releases')
         # app_db.create_all()
         app_db.session.commit()
         from .releases.routes import release_bp
@@ -56,6 +59,19 @@ def create_app():
 
         register_routes(app)
 
+        from .image_index import ImageIndex
+        ImageIndex.warm()
+
+        from .image_backfill import backfill_images
+        app.cli.add_command(backfill_images)
+        from .image_store import migrate_images, verify_images
+        app.cli.add_command(migrate_images)
+        app.cli.add_command(verify_images)
+        from .db.models import rebuild_rollups
+        app.cli.add_command(rebuild_rollups)
+        from .api.cache import prune_api_cache
+        app.cli.add_command(prune_api_cache)
+
         @app.before_request
         def before_request():
             g.app_version = VERSION
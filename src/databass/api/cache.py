@@ -0,0 +1,175 @@
+"""
+Persistent cache for external API responses, stored in the application database
+"""
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Any, Dict, Tuple
+import click
+from dotenv import load_dotenv
+from flask import has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import select, delete, insert
+from ..db.base import app_db
+from ..db.models import ApiResponse
+
+load_dotenv()
+# Minimum seconds between deletions of expired responses when storing a response
+API_CACHE_PRUNE_INTERVAL: float = float(getenv('API_CACHE_PRUNE_INTERVAL', '3600'))
+
+
+class ResponseCache:
+    """
+    Stores API responses in the api_response table, keyed by source, endpoint and call arguments.
+
+    The cache uses its own connection rather than the ORM session, so storing a response never
+    commits (or rolls back) changes pending in the request's session. Outside of an application
+    context, or if the database is unavailable, every lookup is a miss and nothing is stored.
+
+    Hit and miss counters are kept per source for monitoring; see info().
+    Expired responses are deleted by prune(), which set() runs at most once every prune_interval seconds.
+    """
+    hits: Dict[str, int] = {}
+    misses: Dict[str, int] = {}
+    prune_interval: float = API_CACHE_PRUNE_INTERVAL
+    _last_prune: float = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def make_key(source: str, endpoint: str, params: Any) -> str:
+        """
+        Build the cache key for an API call.
+
+        Args:
+            source (str): The API, e.g. "musicbrainz"
+            endpoint (str): The API call, e.g. "get_release_by_id"
+            params: JSON-serializable call arguments
+
+        Returns:
+            str: SHA-256 hex digest identifying the call
+        """
+        raw = json.dumps([source, endpoint, params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @classmethod
+    def get(cls, source: str, endpoint: str, params: Any) -> Tuple[bool, Any]:
+        """
+        Look up a cached response.
+
+        Args:
+            source (str): The API, e.g. "musicbrainz"
+            endpoint (str): The API call, e.g. "get_release_by_id"
+            params: JSON-serializable call arguments
+
+        Returns:
+            tuple: (True, response) on a hit; (False, None) on a miss or if the entry has expired
+        """
+        response = None
+        if has_app_context():
+            key = cls.make_key(source, endpoint, params)
+            try:
+                with app_db.engine.connect() as connection:
+                    response = connection.execute(
+                        select(ApiResponse.response)
+                        .where(ApiResponse.key == key, ApiResponse.expires > datetime.now())
+                    ).scalar_one_or_none()
+            except Exception as err:
+                print(f'Response cache lookup failed: {err}')
+                response = None
+        with cls._lock:
+            counter = cls.misses if response is None else cls.hits
+            counter[source] = counter.get(source, 0) + 1
+        if response is None:
+            return False, None
+        return True, json.loads(response)
+
+    @classmethod
+    def set(cls, source: str, endpoint: str, params: Any, response: Any, ttl: float) -> None:
+        """
+        Store a response, replacing any existing entry for the same call.
+
+        Args:
+            source (str): The API, e.g. "musicbrainz"
+            endpoint (str): The API call, e.g. "get_release_by_id"
+            params: JSON-serializable call arguments
+            response: JSON-serializable response
+            ttl (float): Seconds until the response must be fetched again; not stored if <= 0
+        """
+        if ttl <= 0 or not has_app_context():
+            return
+        key = cls.make_key(source, endpoint, params)
+        try:
+            with app_db.engine.begin() as connection:
+                connection.execute(delete(ApiResponse).where(ApiResponse.key == key))
+                connection.execute(insert(ApiResponse).values(
+                    key=key,
+                    source=source,
+                    endpoint=endpoint,
+                    response=json.dumps(response, default=str),
+                    expires=datetime.now() + timedelta(seconds=ttl)
+                ))
+        except Exception as err:
+            print(f'Response cache store failed: {err}')
+            return
+        with cls._lock:
+            now = time.monotonic()
+            due = now - cls._last_prune >= cls.prune_interval
+            if due:
+                cls._last_prune = now
+        if due:
+            cls.prune()
+
+    @classmethod
+    def prune(cls) -> int:
+        """
+        Delete the responses that have expired.
+
+        Returns:
+            int: Number of deleted responses
+        """
+        try:
+            with app_db.engine.begin() as connection:
+                return connection.execute(
+                    delete(ApiResponse).where(ApiResponse.expires <= datetime.now())
+                ).rowcount
+        except Exception as err:
+            print(f'Response cache prune failed: {err}')
+            return 0
+
+    @classmethod
+    def reset_counters(cls) -> None:
+        """Reset the hit/miss counters"""
+        with cls._lock:
+            cls.hits.clear()
+            cls.misses.clear()
+
+    @classmethod
+    def info(cls, source: str) -> dict:
+        """
+        Cache counters for monitoring.
+
+        Args:
+            source (str): The API, e.g. "musicbrainz"
+
+        Returns:
+            dict: hits, misses and hit_ratio for the source since the process started
+        """
+        with cls._lock:
+            hits = cls.hits.get(source, 0)
+            misses = cls.misses.get(source, 0)
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+@click.command("prune-api-cache")
+@with_appcontext
+def prune_api_cache():
+    """Delete expired API responses from the cache."""
+    click.echo(f"{ResponseCache.prune()} expired responses deleted")
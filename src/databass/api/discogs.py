@@ -2,23 +2,37 @@
 Implements Discogs API-related functions via Discogs class methods
 """
 
-from os import getenv
+from os import getenv, makedirs, path, replace
 from typing import Dict, Optional, Any
 from urllib.parse import urljoin, urlencode
+import hashlib
+import json
+import tempfile
 import time
 import re
 import requests
 from dotenv import load_dotenv
+from .http_client import HttpClient
+from .rate_limit import TokenBucket
 
 
 load_dotenv()
 DISCOGS_KEY = getenv("DISCOGS_KEY")
 DISCOGS_SECRET = getenv("DISCOGS_SECRET")
 VERSION = getenv("VERSION")
-RATE_LIMIT_THRESHOLD: float = 1.1
 DIMENSIONS_PATTERN = r'/h:\d+/w:\d+/'
 HEIGHT_PATTERN = r'/h:(\d+)/.*'
 WIDTH_PATTERN = r'.*/w:(\d+)/.*'
+# Directory holding cached Discogs responses, one JSON file per endpoint
+DISCOGS_CACHE_DIR = getenv("DISCOGS_CACHE_DIR", "./cache/discogs")
+# Seconds a cached response is used without contacting Discogs; 0 disables the cache
+DISCOGS_CACHE_TTL: float = float(getenv("DISCOGS_CACHE_TTL", str(7 * 86400)))
+# Requests per minute allowed until Discogs reports its own limit (60 for authenticated clients)
+DISCOGS_RATE_LIMIT: int = int(getenv("DISCOGS_RATE_LIMIT", "60"))
+# Requests that may be sent back to back before they are spaced out to the rate limit
+DISCOGS_RATE_BURST: int = int(getenv("DISCOGS_RATE_BURST", "5"))
+# Rate limiter state, shared by all worker processes
+DISCOGS_RATE_LIMIT_FILE = getenv("DISCOGS_RATE_LIMIT_FILE", "./cache/discogs.ratelimit")
 
 
 class Discogs:
@@ -28,6 +42,9 @@ class Discogs:
         url (str): The base URL for the Discogs API
         headers (dict): The headers to use for the requests
         remaining_requests (int): The number of remaining requests
+        rate_limiter (TokenBucket): Spaces out requests to stay within the Discogs rate limit
+        cache_dir (str): Directory of the on-disk response cache
+        cache_ttl (float): Seconds a cached response is used before it is revalidated
     """
     url: str = 'https://api.discogs.com'
     headers: Dict[str, str] = {
@@ -35,36 +52,106 @@ class Discogs:
         "Authorization": f"Discogs key={DISCOGS_KEY}, secret={DISCOGS_SECRET}"
     }
     remaining_requests: Optional[int] = None
+    rate_limiter: TokenBucket = TokenBucket(
+        DISCOGS_RATE_LIMIT_FILE, limit=DISCOGS_RATE_LIMIT, window=60, burst=DISCOGS_RATE_BURST
+    )
+    cache_dir: str = DISCOGS_CACHE_DIR
+    cache_ttl: float = DISCOGS_CACHE_TTL
 
     @classmethod
     def update_rate_limit(cls, response: requests.Response):
         """
         Updates rate limit remaining requests based on response header
+        and reconciles the rate limiter with the limits reported by Discogs
         """
-        limit = response.headers.get("x-discogs-ratelimit-remaining")
-        cls.remaining_requests = int(limit)
+        limit = response.headers.get("x-discogs-ratelimit")
+        remaining = response.headers.get("x-discogs-ratelimit-remaining")
+        if remaining is not None:
+            cls.remaining_requests = int(remaining)
+            cls.rate_limiter.observe(int(limit) if limit is not None else None, cls.remaining_requests)
 
     @classmethod
-    def is_throttled(cls) -> bool:
+    def cache_path(cls, endpoint: str) -> str:
         """
-        Checks if we have enough remaining requests to make new request per rate limiting guidelines
-        If remaining_requests is None, no requests have been sent yet and thus we are not throttled
-        If we have 1.1 or fewer remaining requests, we are throttled
+        Path of the cache file for an endpoint
         """
-        return cls.remaining_requests is not None and cls.remaining_requests <= RATE_LIMIT_THRESHOLD
+        return path.join(cls.cache_dir, hashlib.sha256(endpoint.encode()).hexdigest() + ".json")
+
+    @classmethod
+    def load_cached(cls, endpoint: str) -> Optional[Dict[str, Any]]:
+        """
+        Load the cached response for an endpoint, if any.
+
+        Returns:
+            dict: The cache entry with the keys fetched (epoch seconds), etag, last_modified and body;
+                  None if the endpoint is not cached or caching is disabled.
+        """
+        if cls.cache_ttl <= 0:
+            return None
+        try:
+            with open(cls.cache_path(endpoint), encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def store_cached(cls, endpoint: str, entry: Dict[str, Any]) -> None:
+        """
+        Write the cache entry for an endpoint. The file is replaced atomically,
+        so concurrent readers never see a partially written entry.
+        """
+        if cls.cache_ttl <= 0:
+            return
+        try:
+            makedirs(cls.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=cls.cache_dir, suffix=".tmp", delete=False, encoding="utf-8"
+            ) as tmp_file:
+                json.dump(entry, tmp_file)
+            replace(tmp_file.name, cls.cache_path(endpoint))
+        except (OSError, TypeError, ValueError) as err:
+            print(f'Could not write Discogs cache entry for {endpoint}: {err}')
 
     @staticmethod
     def request(endpoint: str) -> Dict[str, Any]:
         """
         Sends request to an endpoint then updates rate limit count
         Returns json if response code is 200
+
+        Requests wait for a token from Discogs.rate_limiter, so they are spaced out to the
+        Discogs rate limit across all threads and worker processes.
+
+        Responses are cached on disk. A cached response younger than Discogs.cache_ttl is returned
+        without contacting Discogs; an older one is revalidated with its ETag/Last-Modified
+        validators, and reused if Discogs answers 304 Not Modified.
         """
-        resp = requests.get(urljoin(Discogs.url, endpoint), headers=Discogs.headers, timeout=60)
+        cached = Discogs.load_cached(endpoint)
+        if cached is not None and time.time() - cached["fetched"] < Discogs.cache_ttl:
+            return cached["body"]
+
+        headers = dict(Discogs.headers)
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        Discogs.rate_limiter.acquire()
+        resp = HttpClient.get(urljoin(Discogs.url, endpoint), headers=headers)
         Discogs.update_rate_limit(resp)
-        if Discogs.is_throttled() is True:
-            time.sleep(5)   # Sleep for 5s to avoid exceeding rate limit
+        if resp.status_code == 304 and cached is not None:
+            cached["fetched"] = time.time()
+            Discogs.store_cached(endpoint, cached)
+            return cached["body"]
         if resp.status_code == 200:
-            return resp.json()
+            body = resp.json()
+            Discogs.store_cached(endpoint, {
+                "fetched": time.time(),
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "body": body
+            })
+            return body
 
         raise requests.exceptions.RequestException(f'Status code != 200: {resp}')
 
@@ -0,0 +1,165 @@
+"""
+Shared HTTP session for outgoing requests (Discogs API, image downloads)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookiejar import DefaultCookiePolicy
+from os import getenv
+from typing import Iterator, Optional
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+load_dotenv()
+VERSION = getenv("VERSION")
+USER_AGENT = f"databass/{VERSION} (https://github.com/chunned/databass)"
+# Connections kept open per host
+HTTP_POOL_SIZE: int = int(getenv("HTTP_POOL_SIZE", "10"))
+# Retries for connection errors and 429/5xx responses, with exponential backoff between attempts
+HTTP_RETRIES: int = int(getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF: float = float(getenv("HTTP_BACKOFF", "0.5"))
+HTTP_TIMEOUT: float = float(getenv("HTTP_TIMEOUT", "60"))
+
+# time.monotonic() value by which requests made in the current thread/context must finish; see HttpClient.deadline()
+_deadline: ContextVar[Optional[float]] = ContextVar("http_deadline", default=None)
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry policy that gives up rather than wait past the current deadline (see HttpClient.deadline()).
+    A retried 429/5xx response is then returned as it is, and a connection error is raised.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None) -> Retry:
+        retry = super().increment(method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+        remaining = HttpClient.remaining()
+        if remaining is None:
+            return retry
+        # Same wait as Retry.sleep(): a non-zero Retry-After header, otherwise the backoff
+        wait = None
+        if response is not None and retry.respect_retry_after_header:
+            wait = retry.get_retry_after(response)
+        if not wait:
+            wait = retry.get_backoff_time()
+        if wait >= remaining:
+            reason = error or ResponseError(f"retry after {wait:.1f}s would pass the deadline in {remaining:.1f}s")
+            raise MaxRetryError(_pool, url, reason)
+        return retry
+
+
+def build_session() -> requests.Session:
+    """
+    Create a requests.Session with a connection pool, retries with backoff and the default headers.
+    Within a deadline, a retry is only made if its wait ends before the deadline.
+
+    Cookies are disabled so the session holds no per-request state and can be shared between threads.
+
+    Returns:
+        requests.Session: The configured session
+    """
+    session = requests.Session()
+    retry = DeadlineRetry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retry
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+class HttpClient:
+    """
+    Process-wide HTTP client; every outgoing request reuses the pooled keep-alive connections of one session.
+
+    Requests made within a deadline() block have their timeout capped at the time left, and fail
+    with requests.exceptions.Timeout once it has run out. Retries and rate limiters (see
+    rate_limit.TokenBucket) do not wait past it either. The deadline is stored in a context
+    variable, so it applies to the current thread only.
+
+    Attributes:
+        session (requests.Session): The shared session
+    """
+    session: requests.Session = build_session()
+
+    @staticmethod
+    @contextmanager
+    def deadline(seconds: float) -> Iterator[None]:
+        """
+        Limit the total time of the requests made within the block. Nested deadlines can only shorten the outer one.
+
+        Args:
+            seconds (float): Seconds from now by which all requests must have finished
+        """
+        expires = time.monotonic() + seconds
+        outer = _deadline.get()
+        if outer is not None:
+            expires = min(expires, outer)
+        token = _deadline.set(expires)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    @staticmethod
+    def remaining() -> Optional[float]:
+        """
+        Seconds left until the current deadline, or None outside of a deadline() block
+        """
+        expires = _deadline.get()
+        if expires is None:
+            return None
+        return expires - time.monotonic()
+
+    @classmethod
+    def get(cls, url: str, **kwargs) -> requests.Response:
+        """
+        Send a GET request through the shared session.
+
+        Args:
+            url (str): The URL to request
+            **kwargs: Passed to requests.Session.get; `timeout` defaults to HTTP_TIMEOUT
+                      and is capped at the time left until the current deadline
+
+        Returns:
+            requests.Response: The response
+
+        Raises:
+            requests.exceptions.Timeout: If the current deadline has already passed
+        """
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        remaining = cls.remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(f"Deadline passed before request to {url}")
+            kwargs["timeout"] = min(kwargs["timeout"], remaining)
+        return cls.session.get(url, **kwargs)
+
+    @classmethod
+    def iter_content(cls, response: requests.Response, chunk_size: int) -> Iterator[bytes]:
+        """
+        Read a streamed response (see get(..., stream=True)) in chunks.
+
+        The timeout of get() only limits each read, so the current deadline is checked between chunks.
+
+        Raises:
+            requests.exceptions.Timeout: If the current deadline passes before the body has been read
+        """
+        for chunk in response.iter_content(chunk_size):
+            remaining = cls.remaining()
+            if remaining is not None and remaining <= 0:
+                raise requests.exceptions.Timeout(f"Deadline passed while reading {response.url}")
+            yield chunk
@@ -3,23 +3,64 @@ from dateutil import parser as dateparser
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
 import musicbrainzngs as mbz
-import musicbrainzngs.musicbrainz
+import requests
 from .util import Util
+from .http_client import HttpClient
+from .cache import ResponseCache
+from .rate_limit import RequestScheduler
 from .types import ArtistInfo, LabelInfo, ReleaseInfo, EntityInfo, SearchResult
 
 load_dotenv()
 VERSION = getenv("VERSION")
+# Seconds a cached MusicBrainz response is used for, per entity type; 0 disables caching for that type
+CACHE_TTL = {
+    "release": float(getenv("MUSICBRAINZ_CACHE_TTL_RELEASE", str(30 * 86400))),
+    "artist": float(getenv("MUSICBRAINZ_CACHE_TTL_ARTIST", str(7 * 86400))),
+    "label": float(getenv("MUSICBRAINZ_CACHE_TTL_LABEL", str(7 * 86400))),
+    "search": float(getenv("MUSICBRAINZ_CACHE_TTL_SEARCH", str(86400))),
+}
+CAA_URL = "https://coverartarchive.org"
+# Minimum seconds between two MusicBrainz requests, across all worker processes
+MUSICBRAINZ_INTERVAL: float = float(getenv("MUSICBRAINZ_INTERVAL", "1.0"))
+# Request queue shared by all worker processes
+MUSICBRAINZ_QUEUE_FILE = getenv("MUSICBRAINZ_QUEUE_FILE", "./cache/musicbrainz.queue")
 
 
 class MusicBrainz:
     init = False
+    # Spaces out requests across all workers; musicbrainzngs' own limiter only covers one process
+    scheduler: RequestScheduler = RequestScheduler(MUSICBRAINZ_QUEUE_FILE, interval=MUSICBRAINZ_INTERVAL)
 
     @classmethod
     def initialize(cls):
         if not cls.init:
             mbz.set_useragent('Databass', f'v{VERSION}', contact='https://github.com/chunned/databass')
+            mbz.set_rate_limit(False)
             cls.init = True
 
+    @staticmethod
+    def cached(entity_type: str, endpoint: str, *args, **kwargs) -> Any:
+        """
+        Call musicbrainzngs.<endpoint>(*args, **kwargs), consulting the persistent response cache first.
+        Successful responses are stored for CACHE_TTL[entity_type] seconds; errors are not cached.
+        On a cache miss, the call waits for its turn in MusicBrainz.scheduler.
+
+        Args:
+            entity_type (str): Key of CACHE_TTL: 'release', 'artist', 'label' or 'search'
+            endpoint (str): Name of the musicbrainzngs function, e.g. 'get_release_by_id'
+
+        Returns:
+            The musicbrainzngs response
+        """
+        params = {"args": args, "kwargs": kwargs}
+        hit, response = ResponseCache.get('musicbrainz', endpoint, params)
+        if hit:
+            return response
+        MusicBrainz.scheduler.acquire()
+        response = getattr(mbz, endpoint)(*args, **kwargs)
+        ResponseCache.set('musicbrainz', endpoint, params, response, ttl=CACHE_TTL[entity_type])
+        return response
+
     @staticmethod
     def release_search(
             release: str = None,
@@ -40,7 +81,9 @@ class MusicBrainz:
         if MusicBrainz.init:
             if all(search_term is None for search_term in (release, artist, label)):
                 raise ValueError("At least one query term is required")
-            results = mbz.search_releases(
+            results = MusicBrainz.cached(
+                'search',
+                'search_releases',
                 artist=artist,
                 label=label,
                 release=release
@@ -135,14 +178,14 @@ class MusicBrainz:
             if mbid is not None:
                 try:
                     # If we have MBID, we can query the label directly
-                    label_result = mbz.get_label_by_id(mbid, includes=['area-rels'])["label"]
+                    label_result = MusicBrainz.cached('label', 'get_label_by_id', mbid, includes=['area-rels'])["label"]
                     label = MusicBrainz.parse_search_result(label_result)
                     return label
                 except Exception as e:
                     raise e
             else:
                 # No MBID, have to search. Assume first result is correct
-                label_results = mbz.search_labels(query=name)
+                label_results = MusicBrainz.cached('search', 'search_labels', query=name)
                 try:
                     label_id = label_results["label-list"][0]["id"]
                     # Now that we have an MBID, recursively call this function using that ID to grab the label data
@@ -176,14 +219,14 @@ class MusicBrainz:
             if mbid is not None:
                 try:
                     # If we have MBID, we can query the label directly
-                    artist_result = mbz.get_artist_by_id(mbid, includes=['area-rels'])["artist"]
+                    artist_result = MusicBrainz.cached('artist', 'get_artist_by_id', mbid, includes=['area-rels'])["artist"]
                     artist = MusicBrainz.parse_search_result(artist_result)
                     return artist
                 except KeyError:
                     return None
             else:
                 # No MBID, have to search. Assume first result is correct
-                artist_results = mbz.search_artists(query=name)
+                artist_results = MusicBrainz.cached('search', 'search_artists', query=name)
                 try:
                     artist_id = artist_results["artist-list"][0]["id"]
                     # Now that we have an MBID, recursively call this function using that ID to grab the label data
@@ -267,8 +310,8 @@ class MusicBrainz:
             return 0
         if MusicBrainz.init:
             try:
-                release_data = mbz.get_release_by_id(mbid,
-                                                     includes=["recordings", "media", "recording-level-rels"])
+                release_data = MusicBrainz.cached('release', 'get_release_by_id', mbid,
+                                                  includes=["recordings", "media", "recording-level-rels"])
                 tracks = [
                     track
                     for disc in release_data["release"]["medium-list"]
@@ -290,6 +333,25 @@ class MusicBrainz:
             except RecursionError:
                 return 0
 
+    @staticmethod
+    def caa_request(path: str) -> requests.Response:
+        """
+        Send a GET request to CoverArtArchive through the shared HTTP session, so it is bounded
+        by the caller's HttpClient.deadline() (musicbrainzngs' CAA functions have no timeout).
+
+        Args:
+            path (str): Path below the CoverArtArchive URL, e.g. 'release-group/<mbid>/front-250'
+
+        Returns:
+            requests.Response: The response
+
+        Raises:
+            requests.exceptions.HTTPError: If CoverArtArchive returned an error status
+        """
+        response = HttpClient.get(f"{CAA_URL}/{path}")
+        response.raise_for_status()
+        return response
+
     @staticmethod
     def get_image(mbid: str, size: str = '250') -> Optional[bytes]:
         """
@@ -307,17 +369,17 @@ class MusicBrainz:
         if not mbid or not isinstance(mbid, str):
             return None
         try:
-            return mbz.get_release_group_image_front(mbid, size=size)
-        except musicbrainzngs.musicbrainz.ResponseError:
+            return MusicBrainz.caa_request(f"release-group/{mbid}/front-{size}").content
+        except requests.exceptions.HTTPError:
             try:
-                covers: Dict[str, Any] = mbz.get_image_list(mbid)
+                covers: Dict[str, Any] = MusicBrainz.caa_request(f"release/{mbid}").json()
                 if covers:
                     try:
                         coverid = covers['images'][0]['id']
-                        return mbz.get_image(mbid, coverid=coverid, size=size)
+                        return MusicBrainz.caa_request(f"release/{mbid}/{coverid}-{size}").content
                     except (KeyError, IndexError):
                         pass
-            except musicbrainzngs.musicbrainz.ResponseError:
+            except (requests.exceptions.RequestException, ValueError):
                 return None
         except Exception:
             return None
@@ -0,0 +1,311 @@
+"""
+Rate limiting for external APIs, shared between threads and worker processes
+"""
+import copy
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import makedirs, path
+from typing import Any, Dict, Iterator, Optional
+import requests
+from .http_client import HttpClient
+try:
+    import fcntl
+except ImportError:     # Not available on Windows; state is then only shared between threads
+    fcntl = None
+
+
+class SharedState:
+    """
+    JSON state file held under an exclusive file lock while it is read and updated,
+    so that every thread and gunicorn worker sees the same state. Read-only callers use read(),
+    which takes a shared lock and does not rewrite the file.
+
+    If the file cannot be opened, the state is kept in this process only.
+
+    Attributes:
+        state_file (str): Path of the state file
+    """
+
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._local_state: Dict[str, Any] = {}
+
+    @contextmanager
+    def update(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the current state, and writes it back when the block exits without an error.
+        Other threads and processes wait until the block exits.
+        """
+        with self._lock:
+            try:
+                makedirs(path.dirname(self.state_file) or ".", exist_ok=True)
+                state_file = open(self.state_file, "a+", encoding="utf-8")
+            except OSError as err:
+                print(f'Shared state file unavailable, using state of this process only: {err}')
+                yield self._local_state
+                return
+            with state_file:
+                if fcntl is not None:
+                    fcntl.flock(state_file, fcntl.LOCK_EX)
+                state_file.seek(0)
+                try:
+                    state = json.load(state_file)
+                except ValueError:
+                    state = {}
+                yield state
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(state, state_file)
+                state_file.flush()
+
+    def read(self) -> Dict[str, Any]:
+        """
+        Returns a copy of the current state; changes to it are not written back.
+        Readers only wait for an update() in progress, not for each other.
+        """
+        try:
+            state_file = open(self.state_file, "r", encoding="utf-8")
+        except OSError:
+            # No state written yet, or the file is unavailable and update() keeps the state in this process
+            with self._lock:
+                return copy.deepcopy(self._local_state)
+        with state_file:
+            if fcntl is not None:
+                fcntl.flock(state_file, fcntl.LOCK_SH)
+            try:
+                return json.load(state_file)
+            except ValueError:
+                return {}
+
+
+class TokenBucket:
+    """
+    Token bucket whose state is kept in a SharedState file, so that every thread and gunicorn
+    worker draws from the same bucket.
+
+    Up to `burst` requests are sent back to back; after that, requests are spaced out so that no
+    more than `limit` requests are sent in any `window` seconds.
+
+    Attributes:
+        state_file (str): Path of the shared state file
+        limit (int): Requests allowed per window, until the API reports its own limit
+        window (float): Length of the rate limit window in seconds
+        burst (int): Requests that may be sent without waiting when the bucket is full
+    """
+
+    def __init__(self, state_file: str, limit: int, window: float = 60, burst: int = 5):
+        self.state_file = state_file
+        self.limit = limit
+        self.window = window
+        self.burst = burst
+        self._shared = SharedState(state_file)
+
+    def capacity(self, limit: int) -> int:
+        """Maximum number of tokens in the bucket for a given limit"""
+        return max(1, min(self.burst, limit - 1))
+
+    def rate(self, limit: int) -> float:
+        """
+        Tokens added per second for a given limit. The burst is subtracted from the limit so
+        that a full bucket plus the tokens added over one window never exceed the limit.
+        """
+        return max(limit - self.capacity(limit), 1) / self.window
+
+    def acquire(self) -> float:
+        """
+        Take a token, sleeping until it is available.
+
+        A token is reserved even if the bucket is empty (the count goes negative), so concurrent
+        callers queue up behind each other instead of all waking at the same time.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            requests.exceptions.Timeout: If the wait would pass the current HttpClient deadline;
+                                         no token is taken
+        """
+        remaining = HttpClient.remaining()
+        with self._shared.update() as state:
+            self._refill(state, time.time())
+            wait = max(0.0, (1 - state["tokens"]) / self.rate(state["limit"]))
+            if remaining is not None and wait >= remaining:
+                raise requests.exceptions.Timeout(
+                    f"Rate limit wait of {wait:.1f}s would pass the deadline in {remaining:.1f}s"
+                )
+            state["tokens"] -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def observe(self, limit: Optional[int], remaining: Optional[int]) -> None:
+        """
+        Reconcile the bucket with the rate limit reported by the API.
+
+        Args:
+            limit (int): Requests allowed per window, or None if not reported
+            remaining (int): Requests left in the current window, or None if not reported;
+                             the bucket never holds more tokens than this, minus one to spare
+        """
+        with self._shared.update() as state:
+            if limit:
+                state["limit"] = limit
+            self._refill(state, time.time())
+            if remaining is not None:
+                state["tokens"] = min(state["tokens"], remaining - 1)
+
+    def _refill(self, state: Dict[str, Any], now: float) -> None:
+        limit = state.setdefault("limit", self.limit)
+        capacity = self.capacity(limit)
+        tokens = state.get("tokens", capacity)
+        elapsed = max(0.0, now - state.get("updated", now))
+        state["tokens"] = min(capacity, tokens + elapsed * self.rate(limit))
+        state["updated"] = now
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class RequestScheduler:
+    """
+    Serializes requests to an API across all threads and gunicorn workers, starting at most one
+    request every `interval` seconds. Waiting requests are registered in a SharedState file and
+    served by priority (interactive before background), then in the order they arrived.
+
+    The priority of requests is set with the priority() context manager and defaults to BACKGROUND.
+    Waiters that stop polling (e.g. because their worker was killed) are dropped after `stale_after`
+    seconds, so they cannot block the queue.
+
+    Attributes:
+        state_file (str): Path of the shared state file
+        interval (float): Minimum seconds between the start of two requests
+        poll (float): Seconds between checks while other requests are ahead in the queue
+        stale_after (float): Seconds after which a waiter that stopped polling is dropped
+    """
+
+    def __init__(self, state_file: str, interval: float = 1.0, poll: float = 0.05, stale_after: float = 30):
+        self.state_file = state_file
+        self.interval = interval
+        self.poll = poll
+        self.stale_after = stale_after
+        self._shared = SharedState(state_file)
+        self._priority: ContextVar[str] = ContextVar(f"priority:{state_file}", default=BACKGROUND)
+        self._metrics_lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def priority(self, priority: str) -> Iterator[None]:
+        """
+        Use the given priority for requests made within the block.
+
+        Args:
+            priority (str): INTERACTIVE or BACKGROUND
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        token = self._priority.set(priority)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    def acquire(self) -> float:
+        """
+        Wait until this request is first in the queue and the interval since the previous request
+        has passed, then claim the slot.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            requests.exceptions.Timeout: If the wait would pass the current HttpClient deadline
+        """
+        priority = self._priority.get()
+        ticket = uuid.uuid4().hex
+        start = time.time()
+        acquired = False
+        try:
+            while not acquired:
+                with self._shared.update() as state:
+                    now = time.time()
+                    waiters = self._live_waiters(state, now)
+                    since = waiters.get(ticket, {}).get("since", start)
+                    waiters[ticket] = {"priority": priority, "since": since, "seen": now}
+                    position = self._position(ticket, waiters[ticket])
+                    ahead = any(self._position(key, waiter) < position for key, waiter in waiters.items())
+                    next_slot = state.get("next_slot", 0)
+                    if not ahead and now >= next_slot:
+                        state["next_slot"] = now + self.interval
+                        del waiters[ticket]
+                        acquired = True
+                    else:
+                        delay = max(next_slot - now, self.poll if ahead else 0.0)
+                if not acquired:
+                    remaining = HttpClient.remaining()
+                    if remaining is not None and delay >= remaining:
+                        raise requests.exceptions.Timeout(
+                            f"Request queue wait would pass the deadline in {remaining:.1f}s"
+                        )
+                    time.sleep(delay)
+        finally:
+            if not acquired:
+                with self._shared.update() as state:
+                    state.get("waiters", {}).pop(ticket, None)
+        wait = time.time() - start
+        self._record(priority, wait)
+        return wait
+
+    def info(self) -> dict:
+        """
+        Scheduler metrics for monitoring.
+
+        Returns:
+            dict: queue_depth: requests currently waiting in all workers, per priority;
+                  and per priority for this process since it started: requests,
+                  wait_avg and wait_max (seconds)
+        """
+        waiters = self._live_waiters(self._shared.read(), time.time())
+        depth = {priority: 0 for priority in PRIORITIES}
+        for waiter in waiters.values():
+            depth[waiter["priority"]] = depth.get(waiter["priority"], 0) + 1
+        info: Dict[str, Any] = {"queue_depth": depth}
+        with self._metrics_lock:
+            for priority in PRIORITIES:
+                metrics = self._metrics.get(priority, {"requests": 0, "wait_total": 0.0, "wait_max": 0.0})
+                requests = metrics["requests"]
+                info[priority] = {
+                    "requests": requests,
+                    "wait_avg": round(metrics["wait_total"] / requests, 4) if requests else 0.0,
+                    "wait_max": round(metrics["wait_max"], 4),
+                }
+        return info
+
+    def reset_metrics(self) -> None:
+        """Reset the wait time metrics of this process"""
+        with self._metrics_lock:
+            self._metrics.clear()
+
+    def _live_waiters(self, state: Dict[str, Any], now: float) -> Dict[str, Dict[str, Any]]:
+        waiters = state.setdefault("waiters", {})
+        for key in [key for key, waiter in waiters.items() if now - waiter["seen"] > self.stale_after]:
+            del waiters[key]
+        return waiters
+
+    @staticmethod
+    def _position(ticket: str, waiter: Dict[str, Any]) -> tuple:
+        # Queue order: priority, then arrival time; the ticket breaks ties
+        return PRIORITIES.index(waiter["priority"]), waiter["since"], ticket
+
+    def _record(self, priority: str, wait: float) -> None:
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(priority, {"requests": 0, "wait_total": 0.0, "wait_max": 0.0})
+            metrics["requests"] += 1
+            metrics["wait_total"] += wait
+            metrics["wait_max"] = max(metrics["wait_max"], wait)
@@ -1,15 +1,21 @@
 import datetime
-import signal
 from os import getenv
+from os.path import basename
 from pathlib import Path
 from typing import Optional, Literal
 from dotenv import load_dotenv
+from .http_client import HttpClient
+from ..image_index import ImageIndex
+from ..image_store import ImageStore
 
 load_dotenv()
 VERSION = getenv('VERSION')
 
 JPEG_HEADER = b'\xff\xd8\xff'
 PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+# RIFF container with the WEBP form type at bytes 8-12
+WEBP_HEADER = b'RIFF'
+WEBP_FORMAT = b'WEBP'
 
 VALID_TYPES = frozenset(["release", "artist", "label"])
 VALID_DATE_TYPES = frozenset(['begin', 'end'])
@@ -18,12 +24,14 @@ YEAR_FORMAT = "%Y"
 MONTH_FORMAT = "%Y-%m"
 DAY_FORMAT = "%Y-%m-%d"
 
-class TimeoutException(Exception):
-    pass
-
-def timeout_handler(signum, frame):
-    raise TimeoutException("Request timed out")
-
+# Seconds allowed for fetching one image from all sources, including the download
+IMAGE_FETCH_TIMEOUT: float = float(getenv('IMAGE_FETCH_TIMEOUT', '60'))
+# Seconds allowed for CoverArtArchive before falling back to Discogs
+CAA_TIMEOUT: float = float(getenv('CAA_TIMEOUT', '5'))
+# Largest image that will be downloaded, in bytes
+IMAGE_MAX_BYTES: int = int(getenv('IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+# Bytes read from the network at a time while downloading an image
+IMAGE_CHUNK_SIZE: int = int(getenv('IMAGE_CHUNK_SIZE', str(64 * 1024)))
 
 # Collection of generic utility functions used by other parts of the app
 class Util:
@@ -71,35 +79,6 @@ class Util:
         """Returns current day formatted as YYYY-MM-DD string"""
         return datetime.datetime.today().strftime('%Y-%m-%d')
 
-    @staticmethod
-    def get_image_type_from_url(url: str) -> str:
-        """
-        Determine the image file extension from the URL of an image file.
-
-        This function extracts the image format from a URL, supporting common web image formats
-        and handling various URL patterns. The extension can appear anywhere in the URL path.
-
-        Args:
-            url (str): The URL of an image file.
-
-        Returns:
-            str: The file extension of the image (e.g. '.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff').
-
-        Raises:
-            ValueError: If no supported image extension is found in the URL.
-        """
-        # List of supported image extensions
-        extensions = {
-            '.jpg', '.jpeg', '.png', '.webp',
-        }
-
-        url = url.lower()
-        for ext in extensions:
-            if ext in url:
-                return ext
-
-        raise ValueError(f'ERROR: No supported image type found in URL: {url}')
-
     @staticmethod
     def get_image_type_from_bytes(bytestr: bytes) -> str:
         """
@@ -112,11 +91,11 @@ class Util:
             bytestr (bytes): The byte representation of an image file.
 
         Returns:
-            str: The file extension of the image, either '.jpg' or '.png'.
+            str: The file extension of the image: '.jpg', '.png' or '.webp'.
 
         Raises:
             ValueError: If the input byte string does not match the expected header for a
-                supported image type (JPEG or PNG).
+                supported image type (JPEG, PNG or WebP).
         """
         if len(bytestr) < 8:
             raise ValueError("bytestr must be at least 8 bytes.")
@@ -124,8 +103,10 @@ class Util:
             return '.jpg'
         if bytestr.startswith(PNG_HEADER):
             return '.png'
+        if bytestr.startswith(WEBP_HEADER) and bytestr[8:12] == WEBP_FORMAT:
+            return '.webp'
         else:
-            raise ValueError(f"Unsupported file type (signature: {bytestr[:8].hex()}). Supported types: jpg, png")
+            raise ValueError(f"Unsupported file type (signature: {bytestr[:8].hex()}). Supported types: jpg, png, webp")
 
     @staticmethod
     def get_image(
@@ -136,23 +117,32 @@ class Util:
             artist_name: str = None,
             label_name: str = None,
             url: str = None,
+    ):
+        # All requests made while fetching the image share one deadline. It is tracked per thread,
+        # so images can be fetched concurrently from thread pools and request handlers.
+        with HttpClient.deadline(IMAGE_FETCH_TIMEOUT):
+            return Util._get_image(item_type, item_id, mbid, release_name, artist_name, label_name, url)
+
+    @staticmethod
+    def _get_image(
+            item_type: str,
+            item_id: str | int,
+            mbid: str = None,
+            release_name: str = None,
+            artist_name: str = None,
+            label_name: str = None,
+            url: str = None,
     ):
         # TODO: refactor
         if url:
             # if we are provided the url, just grab it, don't check APIs
-            import requests
-            response = requests.get(url, headers={
-                "User-Agent": f"databass/{VERSION} (https://github.com/chunned/databass)"
-            })
-            if response:
-                ext = Util.get_image_type_from_url(url)
-                base_path = './databass/static/img'
-                img_filepath = base_path + '/release/' + str(item_id) + ext
-                with open(img_filepath, 'wb') as img_file:
-                    img_file.write(response.content)
+            img_filepath = Util.download_image(url, item_type, item_id)
+            if img_filepath:
+                from ..image_queue import ImageQueue
+                ImageQueue.generate_thumbnails(item_type, item_id)
                 return img_filepath.replace('databass/', '')
         img = img_type = img_url = None
-        base_path = "./databass/static/img"
+        base_path = ImageIndex.img_dir
         subdir = item_type
         try:
             # Create image subdirectory
@@ -169,13 +159,8 @@ class Util:
             print(f'Item is a release and MBID is populated; attempting to fetch image from CoverArtArchive: {mbid}')
             from .musicbrainz import MusicBrainz
             try:
-
-                # Number of seconds to wait before raising a TimeoutException
-                timeout_duration = 5
-                signal.signal(signal.SIGALRM, timeout_handler)
-                signal.alarm(timeout_duration)
-
-                img = MusicBrainz.get_image(mbid)
+                with HttpClient.deadline(CAA_TIMEOUT):
+                    img = MusicBrainz.get_image(mbid)
                 if img is not None:
                     print('CoverArtArchive image found')
                     # CAA returns the raw image data
@@ -197,29 +182,58 @@ class Util:
                 img_url = Discogs.get_artist_image_url(name=artist_name)
             elif item_type == 'label':
                 img_url = Discogs.get_label_image_url(name=label_name)
-        response = ''
-        if img_url is not None and img_url is not False:
-            import requests
+        file_path = None
+        if img is not None and img_type is not None:
+            file_path = ImageStore.save(item_type, item_id, img, img_type)
+        elif img_url is not None and img_url is not False:
             print(f'Discogs image URL: {img_url}')
-            response = requests.get(
-                img_url,
-                headers={
-                    "Accept": "application/json",
-                    "User-Agent": f"databass/{VERSION} (https://github.com/chunned/databass)"
-                },
-                timeout=60
-            )
-            img = response.content
-            img_type = Util.get_image_type_from_bytes(img)
+            file_path = Util.download_image(img_url, item_type, item_id, headers={"Accept": "application/json"})
 
-        if img is not None and img_type is not None:
-            file_name = str(item_id) + img_type
-            file_path = base_path + '/' + subdir + '/' + file_name
-            with open(file_path, 'wb') as img_file:
-                img_file.write(img)
+        if file_path:
+            from ..image_queue import ImageQueue
+            ImageQueue.generate_thumbnails(item_type, item_id)
             print(f'Image saved to {file_path}')
             return file_path.replace('databass/', '')
-        print(f'Discogs response: {response}')
+        print(f'No image found for {item_type} {item_id}')
+
+    @staticmethod
+    def download_image(url: str, item_type: str, item_id: str | int, **kwargs) -> Optional[str]:
+        """
+        Stream an image to the ImageStore in chunks and point the item at it, so that the image
+        is never held in memory as a whole.
+
+        The type is detected from the first bytes, and the download is aborted as soon as it
+        exceeds IMAGE_MAX_BYTES (or the server announces a larger Content-Length).
+
+        Args:
+            url (str): URL of the image
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (str | int): ID of the item
+            **kwargs: Passed to HttpClient.get, e.g. headers
+
+        Returns:
+            str: Path of the item's image, or None if the server returned an error status
+
+        Raises:
+            ValueError: If the image is too large or not a JPEG, PNG or WebP image
+            requests.exceptions.Timeout: If the current HttpClient deadline passes during the download
+        """
+        response = HttpClient.get(url, stream=True, **kwargs)
+        try:
+            if not response:
+                print(f'Could not download image from {url}: HTTP {response.status_code}')
+                return None
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit() and int(length) > IMAGE_MAX_BYTES:
+                raise ValueError(f'Image at {url} is {length} bytes; the limit is {IMAGE_MAX_BYTES}')
+            blob = ImageStore.put_stream(
+                HttpClient.iter_content(response, IMAGE_CHUNK_SIZE),
+                Util.get_image_type_from_bytes,
+                max_bytes=IMAGE_MAX_BYTES
+            )
+        finally:
+            response.close()
+        return ImageStore.link(item_type, item_id, blob)
 
     @staticmethod
     def img_exists(
@@ -253,8 +267,6 @@ class Util:
             raise ValueError(f"Invalid item_type: {item_type}. "
                          f"Must be one of the following strings: {', '.join(VALID_TYPES)}")
 
-        base_path = Path("static/img")
-        result = list(base_path.joinpath(item_type).glob(f"{item_id}.*"))
-        if result:
-            url = '/' + str(result[0]).replace('databass/', '')
-            return url
+        img_path = ImageIndex.get(item_type, item_id)
+        if img_path:
+            return f'/static/img/{item_type}/{basename(img_path)}'
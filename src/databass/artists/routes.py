@@ -40,18 +40,20 @@ def artists():
 @artist_bp.route('/artist_search', methods=['POST'])
 def artist_search():
     data = request.get_json()
-    search_results = Artist.dynamic_search(data)
+    search_query = Artist.search_query(data)
     page = Pager.get_page_param(request)
-    paged_data, flask_pagination = Pager.paginate(
+    paged_data, flask_pagination, cursors = Pager.paginate_keyset(
         per_page=15,
         current_page=page,
-        data=search_results
+        query=search_query,
+        sort_key=Artist.id,
+        cursor=request.args.get('cursor')
     )
     return render_template(
         'artist_search.html',
         data=paged_data,
-        data_full=search_results,
-        pagination=flask_pagination
+        pagination=flask_pagination,
+        cursors=cursors
     )
 
 @artist_bp.route('/artist/<string:artist_id>/edit', methods=['GET', 'POST'])
@@ -96,15 +98,19 @@ def edit_artist(artist_id):
                 if "http" and "://" in image:
                     # If image is a URL, download it
                     new_image = Util.get_image(
-                        item_type='release',
+                        item_type='artist',
                         item_id=artist_id,
                         url=image
                     )
-                    artist_data.image = image
+                    artist_data.image = new_image
                 else:
                     print("Image not a URL. Skipping.")
         except KeyError:
             pass
+        except ValueError as err:
+            # Raised by Util.download_image for oversized or non-image downloads
+            flash(f"Could not use image from {image}: {err}")
+            return redirect('/error', code=302)
 
         try:
             country = edit_data["country"]
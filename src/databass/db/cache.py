@@ -0,0 +1,110 @@
+"""
+Process-wide cache for computed statistics, invalidated by writes through databass.db.operations
+"""
+import threading
+import time
+from os import getenv
+from typing import Any, Callable, Dict, NamedTuple
+from dotenv import load_dotenv
+
+load_dotenv()
+# Upper bound on staleness; covers writes made by other worker processes and the date rolling over
+STATS_CACHE_TTL: float = float(getenv('STATS_CACHE_TTL', '300'))
+# Tables whose writes change the statistics
+STATS_TABLES = frozenset(["release", "artist", "label", "goal"])
+
+
+class CacheEntry(NamedTuple):
+    version: int
+    created: float
+    value: Any
+
+
+class StatsCache:
+    """
+    Versioned in-memory cache for statistics.
+
+    Every entry records the cache version it was computed under. A write to one of the
+    STATS_TABLES bumps the version, which invalidates all entries at once; entries also
+    expire after `ttl` seconds.
+
+    Attributes:
+        ttl (float): Maximum age of an entry in seconds
+        version (int): Current cache version
+        hits (int): Number of lookups served from the cache
+        misses (int): Number of lookups that had to compute the value
+    """
+    ttl: float = STATS_CACHE_TTL
+    version: int = 0
+    hits: int = 0
+    misses: int = 0
+    _entries: Dict[str, CacheEntry] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for `key`, calling `compute()` to (re)calculate it on a miss.
+
+        Args:
+            key (str): Name of the cached value, e.g. 'all'
+            compute (Callable): Zero-argument function that calculates the value
+
+        Returns:
+            The cached or freshly computed value. Callers must not mutate it.
+        """
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None and entry.version == cls.version and now - entry.created < cls.ttl:
+                cls.hits += 1
+                return entry.value
+            cls.misses += 1
+            version = cls.version
+
+        # Computed outside the lock so a slow query does not block other keys
+        value = compute()
+        with cls._lock:
+            # Only store the value if no write happened while it was being computed
+            if version == cls.version:
+                cls._entries[key] = CacheEntry(version, now, value)
+        return value
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """Invalidate every cached entry by bumping the cache version"""
+        with cls._lock:
+            cls.version += 1
+            cls._entries.clear()
+
+    @classmethod
+    def invalidate_for(cls, table_name: str) -> None:
+        """Invalidate the cache if a write to `table_name` affects the statistics"""
+        if table_name in STATS_TABLES:
+            cls.invalidate()
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop all entries and reset the hit/miss counters"""
+        with cls._lock:
+            cls._entries.clear()
+            cls.hits = cls.misses = 0
+
+    @classmethod
+    def info(cls) -> dict:
+        """
+        Cache counters for monitoring.
+
+        Returns:
+            dict: hits, misses, hit_ratio, version, size (number of entries) and ttl
+        """
+        with cls._lock:
+            lookups = cls.hits + cls.misses
+            return {
+                "hits": cls.hits,
+                "misses": cls.misses,
+                "hit_ratio": round(cls.hits / lookups, 4) if lookups else 0.0,
+                "version": cls.version,
+                "size": len(cls._entries),
+                "ttl": cls.ttl,
+            }
@@ -2,17 +2,47 @@ from __future__ import annotations
 from datetime import datetime, date
 from typing import Any, Optional, List
 
+import click
+from flask.cli import with_appcontext
 import sqlalchemy.exc
 from sqlalchemy import (
-    String, Integer, ForeignKey, DateTime, Date,
-    func, extract, distinct,
-    Table, Column, CheckConstraint
+    String, Text, Integer, BigInteger, Float, ForeignKey, DateTime, Date,
+    func, extract, distinct, select, and_, cast,
+    Table, Column, CheckConstraint, UniqueConstraint, Index, DDL, event
+)
+from sqlalchemy.orm import (
+    DeclarativeBase, Mapped, mapped_column, relationship, declared_attr,
+    joinedload, selectinload
 )
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.engine.row import Row
+from sqlalchemy.dialects import postgresql, sqlite
 from .operations import construct_item, insert
 from .base import app_db
 
+def name_contains(column, value: str):
+    """
+    Case-insensitive substring match, i.e. `column ILIKE '%value%'`.
+    LIKE wildcards (%, _) in `value` are escaped so that they match literally.
+    On PostgreSQL this is served by the trigram index on the name column (see trigram_index()).
+    """
+    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return column.ilike(f'%{escaped}%', escape='\\')
+
+
+def trigram_index(table_name: str) -> Index:
+    """
+    GIN index using pg_trgm's gin_trgm_ops on the name column of `table_name`,
+    which lets PostgreSQL answer ILIKE '%...%' searches without a sequential scan.
+    The index is only created on PostgreSQL; other engines fall back to scanning the table.
+    """
+    return Index(
+        f'ix_{table_name}_name_trgm',
+        'name',
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'}
+    ).ddl_if(dialect='postgresql')
+
+
 class Base(DeclarativeBase):
     """Base class which all other database model classes are built from"""
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -73,11 +103,11 @@ class Base(DeclarativeBase):
             return None
         try:
             result = app_db.session.query(cls).filter(
-                cls.name.ilike(f'%{name}%')
+                name_contains(cls.name, name)
             ).one_or_none()
         except sqlalchemy.exc.MultipleResultsFound:
             result = app_db.session.query(cls).filter(
-                cls.name.ilike(f'%{name}%')
+                name_contains(cls.name, name)
             ).first()
         return result
 
@@ -116,6 +146,11 @@ class MusicBrainzEntity(Base):
     image: Mapped[str | None] = mapped_column(String(), nullable=True)
     country: Mapped[str | None] = mapped_column(String(), nullable=True)
 
+    @declared_attr.directive
+    def __table_args__(cls) -> tuple:
+        # Every Release, Artist and Label table gets a trigram index for name searches
+        return (trigram_index(cls.__tablename__),)
+
     @classmethod
     def get_all(cls) -> list[Any]:
         # Return all database entries for this class
@@ -221,7 +256,7 @@ class MusicBrainzEntity(Base):
         """
         if not isinstance(name, str):
             return []
-        result = app_db.session.query(cls.id).filter(cls.name.ilike(f'%{name}%')).all()
+        result = app_db.session.query(cls.id).filter(name_contains(cls.name, name)).all()
         # .all() returns a list of tuples like [(1,), (2,)]
         # below list comprehension unpacks it to [1, 2]
         return [r[0] for r in result]
@@ -251,6 +286,22 @@ class Release(MusicBrainzEntity):
         for key, value in kwargs.items():
             setattr(self, key, value)
 
+    @classmethod
+    def listing_options(cls) -> tuple:
+        """
+        Loader options for queries that list releases along with their artist, main genre and genres
+        (i.e. the home page table), so a page of releases is loaded in a constant number of queries
+        instead of lazy-loading the relationships row by row.
+
+        Returns:
+            tuple: SQLAlchemy loader options to pass to Query.options()
+        """
+        return (
+            joinedload(cls.artist),
+            joinedload(cls.main_genre),
+            selectinload(cls.genres),
+        )
+
     @classmethod
     def average_runtime(cls) -> float:
         """
@@ -360,19 +411,35 @@ class Release(MusicBrainzEntity):
         return result
 
     @classmethod
-    def home_data(cls) -> list[Row]:
+    def home_data(cls, page: int = 1, per_page: int = 5) -> list[Release]:
         """
-        Retrieves a list of data for the home page, including artist information,
+        Retrieves one page of data for the home page, including artist information,
         release information, and associated genres.
 
+        Only the rows for the requested page are fetched (LIMIT/OFFSET); use
+        `total_count()` for the total number of releases.
+
+        Args:
+            page (int, optional): The page to retrieve (1-indexed). Defaults to 1.
+            per_page (int, optional): The number of releases per page. Defaults to 5.
+
         Returns:
-            list[Row]: A list of Release database entries
+            list[Release]: A list of Release database entries
+
+        Raises:
+            ValueError: If `page` or `per_page` is not a positive integer.
 
         The data is ordered by the release ID in descending order.
         """
+        if not isinstance(page, int) or not isinstance(per_page, int) or page <= 0 or per_page <= 0:
+            raise ValueError("page and per_page must be positive integers")
         try:
             results = (
-                app_db.session.query(cls).order_by(cls.id.desc())
+                app_db.session.query(cls)
+                .options(*cls.listing_options())
+                .order_by(cls.id.desc())
+                .limit(per_page)
+                .offset((page - 1) * per_page)
             ).all()
         except Exception:
             return []
@@ -412,6 +479,31 @@ class Release(MusicBrainzEntity):
         Returns:
             list[Release]: A list of Release objects representing the matching releases.
         """
+        results = (
+            cls.search_query(data)
+            .options(*cls.listing_options())
+            .order_by(cls.id)
+            .all()
+        )
+        return results
+
+    @classmethod
+    def search_query(
+            cls,
+            data: dict
+    ):
+        """
+        Build the (unordered, unexecuted) query used by dynamic_search, so that it can be paginated in SQL.
+
+        Args:
+            data (dict): A dictionary containing the search criteria.
+
+        Returns:
+            Query: SQLAlchemy query selecting the matching releases.
+
+        Raises:
+            ValueError: If `data` is not a dict
+        """
         if not isinstance(data, dict):
             raise ValueError("Search criteria must be a dictionary")
         from .util import apply_comparison_filter
@@ -425,14 +517,13 @@ class Release(MusicBrainzEntity):
                 pass # Empty value or key not meant for searching, do nothing
             elif key == 'name':
                 query = query.filter(
-                    cls.name.ilike(f'%{value}%')
+                    name_contains(cls.name, value)
                 )
             elif key == 'artist':
-                artist_ids = Artist.id_by_matching_name(name=value)
-                query = query.filter(cls.artist_id.in_(artist_ids))
+                # EXISTS subquery; keeps the search a single statement however many artists match
+                query = query.filter(cls.artist.has(name_contains(Artist.name, value)))
             elif key == 'label':
-                label_ids = Label.id_by_matching_name(name=value)
-                query = query.filter(cls.label_id.in_(label_ids))
+                query = query.filter(cls.label.has(name_contains(Label.name, value)))
             elif key == 'rating':
                 operator = data["rating_comparison"]   # <, ==, or >
                 query = apply_comparison_filter(
@@ -458,8 +549,7 @@ class Release(MusicBrainzEntity):
                 query = query.filter(
                     getattr(cls, key) == value
                 )
-        results = query.order_by(cls.id).all()
-        return results
+        return query
 
     @classmethod
     def get_reviews(
@@ -503,36 +593,23 @@ class Release(MusicBrainzEntity):
         if not isinstance(data, dict):
             raise ValueError("data argument must be a dictionary")
         from .operations import insert, construct_item
-        from ..api import Util
+        from ..image_queue import ImageQueue
         new_release = construct_item('release', data)
         release_id = insert(new_release)
 
-        if data["image"] is not None:
-            Util.get_image(
-                item_type="release", item_id=release_id, url=data["image"]
-            )
+        # The image is fetched in the background; pages show a placeholder until it is saved
+        if data.get("image"):
+            ImageQueue.enqueue("release", release_id, url=data["image"])
         else:
-            Util.get_image(
-                item_type='release',
-                item_id=release_id,
-                release_name=data["name"],
-                artist_name=data["artist_name"],
-                label_name=data["label_name"],
-                mbid=data["release_group_mbid"]
+            ImageQueue.enqueue(
+                "release",
+                release_id,
+                release_name=data.get("name"),
+                artist_name=data.get("artist_name"),
+                label_name=data.get("label_name"),
+                mbid=data.get("release_group_mbid")
             )
 
-        try:
-            Util.get_image(
-                item_type='release',
-                item_id=release_id,
-                release_name=data["name"],
-                artist_name=data["artist_name"],
-                label_name=data["label_name"],
-                mbid=data["release_group_mbid"]
-            )
-        except KeyError:
-            pass
-
         return release_id
 
 
@@ -564,6 +641,16 @@ class ArtistOrLabel(MusicBrainzEntity):
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(id={self.id}, name='{self.name}')"
 
+    @classmethod
+    def rollup_condition(cls):
+        # Join condition between this model and its rows in EntityRollup
+        return and_(EntityRollup.entity_type == cls.__tablename__, EntityRollup.entity_id == cls.id)
+
+    @staticmethod
+    def rollup_average():
+        # Average release rating from EntityRollup; cast so integer division is not used
+        return cast(EntityRollup.rating_sum, Float) / EntityRollup.release_count
+
     @classmethod
     def frequency_highest(
             cls,
@@ -574,6 +661,7 @@ class ArtistOrLabel(MusicBrainzEntity):
         along with the count of their associated Releases and their image file paths.
 
         This method is a class method, so it can be called on either the Artist or Label model classes.
+        The counts are read from EntityRollup rather than counted from the release table.
 
         Args:
             limit (int): The maximum number of results to return, defaults to 10.
@@ -589,19 +677,17 @@ class ArtistOrLabel(MusicBrainzEntity):
         """
         if not isinstance(limit, int) or limit <= 0:
             raise ValueError("Limit must be a positive integer.")
-        relation_id = Release.artist_id if cls.__tablename__ == "artist" else Release.label_id
-
         try:
             query = (
                 app_db.session.query(
                     cls.name,
-                    func.count(relation_id).label('count'),
+                    EntityRollup.release_count.label('count'),
                     cls.image
                 )
-                .join(Release, relation_id == cls.id)
+                .join(EntityRollup, cls.rollup_condition())
                 .where(cls.name.notin_(["[NONE]", "Various Artists"]))
-                .group_by(cls.name, cls.image)
-                .order_by(func.count(relation_id).desc())
+                .where(EntityRollup.release_count > 0)
+                .order_by(EntityRollup.release_count.desc(), cls.id)
                 .limit(limit)
                 .all()
             )
@@ -621,7 +707,8 @@ class ArtistOrLabel(MusicBrainzEntity):
             cls,
     ) -> list[Row]:
         """
-        Calculates the average ratings and total release counts for entities (Artists or Labels) in the database.
+        Calculates the average ratings and total release counts for entities (Artists or Labels) in the database,
+        from the aggregates kept in EntityRollup.
 
         Returns:
             list[Row]: A list of database rows containing the following fields:
@@ -634,26 +721,22 @@ class ArtistOrLabel(MusicBrainzEntity):
         Raises:
             TypeError: If the method is called on a class that is not either the Artist or Label class.
         """
-        if cls.__tablename__ == "artist":
-            relation_id = Release.artist_id
-        elif cls.__tablename__ == "label":
-            relation_id= Release.label_id
-        else:
+        if cls.__tablename__ not in EntityRollup.ENTITY_TYPES:
             raise TypeError("Method only supported by Artist and Label classes.")
+        average_rating = cls.rollup_average()
         try:
             entities = (
                 app_db.session.query(
                     cls.id,
                     cls.name,
-                    func.avg(Release.rating).label('average_rating'),
-                    func.count(Release.id).label('release_count'),
+                    average_rating.label('average_rating'),
+                    EntityRollup.release_count.label('release_count'),
                     cls.image
                 )
-                .join(Release, relation_id == cls.id)
+                .join(EntityRollup, cls.rollup_condition())
                 .where(cls.name.notin_(["[NONE]", "Various Artists"]))
-                .having(func.count(Release.id) > 1)
-                .group_by(cls.name, cls.id)
-                .order_by(func.avg(Release.rating).desc())
+                .where(EntityRollup.release_count > 1)
+                .order_by(average_rating.desc(), cls.id)
                 .all()
             )
         except Exception:
@@ -664,14 +747,18 @@ class ArtistOrLabel(MusicBrainzEntity):
     def average_ratings_bayesian(
             cls,
             sort_order: str = 'desc',
+            limit: int | None = None
     ) -> list[dict]:
         """
         Calculates the Bayesian average rating for entities (Artists or Labels) in the database, taking into account both the average rating and the number of releases for each entity.
 
         The Bayesian average is calculated as a weighted average between the entity's average rating and the overall mean average rating, with the weight determined by the number of releases for that entity.
+        The calculation is shared with the stats page leaderboards (see stats.ranked_entities());
+        the ordering and the optional limit are applied in the same query.
 
         Args:
             sort_order (str, optional): The order to sort the results, either 'desc' (descending) or 'asc' (ascending). Defaults to 'desc'.
+            limit (int, optional): The maximum number of results to return, defaults to None (all entities).
 
         Returns:
             list[dict]: A list of dictionaries containing the following fields for each entity:
@@ -682,50 +769,41 @@ class ArtistOrLabel(MusicBrainzEntity):
                 - count: The total number of releases for the entity.
 
         Raises:
-            ValueError: If the `sort_order` parameter is not 'desc' or 'asc'.
+            ValueError: If the `sort_order` parameter is not 'desc' or 'asc', or `limit` is not a positive integer.
+            TypeError: If the method is called on a class that is not either the Artist or Label class.
         """
         if not isinstance(sort_order, str) or sort_order not in ["desc", "asc"]:
             raise ValueError(f"Unrecognized sort order: {sort_order}. Valid orders are: 'desc', 'asc'")
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            raise ValueError("Limit must be a positive integer.")
+        if cls.__tablename__ not in EntityRollup.ENTITY_TYPES:
+            raise TypeError("Method only supported by Artist and Label classes.")
 
-        entities = cls.average_ratings_and_total_counts()
-        entity_count = len(entities)
-        if entity_count == 0:
+        from .stats import ranked_entities
+        ranked = ranked_entities(cls, limit=None).subquery('ranked')
+        order = ranked.c.bayesian_rating.desc() if sort_order == 'desc' else ranked.c.bayesian_rating.asc()
+        statement = (
+            select(ranked)
+            .where(ranked.c.release_count > 1)
+            .order_by(order, ranked.c.id)
+        )
+        if limit is not None:
+            statement = statement.limit(limit)
+        try:
+            entities = app_db.session.execute(statement).all()
+        except Exception:
+            app_db.session.rollback()
             return []
 
-        from .util import mean_avg_and_count, bayesian_avg
-        mean_avg, mean_count = mean_avg_and_count(entities)
-        items = []
-        for entity in entities:
-            entity_avg = int(entity.average_rating)
-            entity_count = int(entity.release_count)
-
-            weight = entity_count / (entity_count + mean_count)
-            bayesian = bayesian_avg(
-                item_weight=weight,
-                item_avg=entity_avg,
-                mean_avg=mean_avg
-            )
-            items.append({
+        return [
+            {
                 "id": entity.id,
                 "name": entity.name,
-                "rating": round(bayesian),
+                "rating": round(entity.bayesian_rating),
                 "image": entity.image,
                 "count": entity.release_count
-            })
-
-        # Sort results by Bayesian average
-        # 'order' is used for sorted(reverse=..)
-        # Hence, order = True means descending; False means ascending
-        order = True
-        if sort_order == 'asc':
-            order = False
-
-        sorted_entities = sorted(
-            items,
-            key=lambda k: k['rating'],
-            reverse=order
-        )
-        return sorted_entities
+            } for entity in entities
+        ]
 
     @classmethod
     def statistic(
@@ -779,6 +857,24 @@ class ArtistOrLabel(MusicBrainzEntity):
         Returns:
             A list of model instances that match the provided filters.
 
+        Raises:
+            ValueError: If `filters` is not a dict
+        """
+        results = cls.search_query(filters).all()
+        return results
+
+    @classmethod
+    def search_query(
+            cls,
+            filters: dict
+    ):
+        """
+        Build the (unexecuted) query used by dynamic_search, so that it can be paginated in SQL.
+        Accepts the same `filters` dictionary as dynamic_search.
+
+        Returns:
+            Query: SQLAlchemy query selecting the matching Artists or Labels.
+
         Raises:
             ValueError: If `filters` is not a dict
         """
@@ -792,7 +888,7 @@ class ArtistOrLabel(MusicBrainzEntity):
                 pass # Empty value or key not meant from searching, pass
             elif key == 'name':
                 query = query.filter(
-                    cls.name.ilike(f'%{value}%')
+                    name_contains(cls.name, value)
                 )
             elif key == 'begin_date':
                 operator = filters["begin_comparison"]
@@ -821,52 +917,75 @@ class ArtistOrLabel(MusicBrainzEntity):
                     getattr(cls, key) == value
                 )
         # Filter out names that do not refer to a specific real-world entity
-        results = query.where(
+        query = query.where(
             cls.name != "[NONE]"
         ).where(
             cls.name != "[no label]"
         ).where(
             cls.name != "Various Artists"
-        ).all()
-        return results
+        )
+        return query
 
     @classmethod
-    def create_if_not_exist(cls, name: str, mbid: str = None) -> int:
+    def lookup(cls, name: str, mbid: str = None) -> dict:
+        """
+        Search MusicBrainz for the start/end date, type and other details of an item.
+        Only does network requests, so it can run outside of the request thread.
+
+        Args:
+            name (str): The name of the item to search for.
+            mbid (str): [optional] The MusicBrainz ID of the item.
+
+        Returns:
+            dict: The search result, or just the name if MusicBrainz returned nothing.
+        """
+        from ..api import MusicBrainz
+        if cls.__name__ == 'Label':
+            item_search = MusicBrainz.label_search(name=name, mbid=mbid)
+        elif cls.__name__ == 'Artist':
+            item_search = MusicBrainz.artist_search(name=name, mbid=mbid)
+        else:
+            raise ValueError(f"Unsupported class: {cls} - supported classes are Label and Artist")
+        if item_search is None:
+            item_search = {"name": name}
+        return item_search
+
+    @classmethod
+    def exists_by_mbid_or_name(cls, name: str, mbid: str = None):
+        """
+        Find an existing item by MusicBrainz ID, then by name.
+
+        Returns:
+            The matching item, or None.
+        """
+        return cls.exists_by_mbid(mbid) or cls.exists_by_name(name)
+
+    @classmethod
+    def create_if_not_exist(cls, name: str, mbid: str = None, item_search: dict = None) -> int:
         """
         Create a new instance of the model if it does not already exist in the database.
 
         Args:
             name (str): The name of the item to create.
             mbid (str): [optional] The MusicBrainz ID of the item to create.
+            item_search (dict): [optional] Result of lookup(), if it was already fetched.
 
         Returns:
             int: The ID of the created or existing item.
         """
-        from ..api import MusicBrainz, Util
+        from ..image_queue import ImageQueue
         from .operations import insert, construct_item
-        item_exists = cls.exists_by_mbid(mbid)
-        if item_exists:
-            return item_exists.id
-        item_exists = cls.exists_by_name(name)
+        item_exists = cls.exists_by_mbid_or_name(name, mbid)
         if item_exists:
             return item_exists.id
         else:
             # Grab image, start/end date, type, and insert
-            if cls.__name__ == 'Label':
-                item_search = MusicBrainz.label_search(name=name, mbid=mbid)
-                if item_search is None:
-                    item_search = {"name": name}
-                new_item = construct_item(model_name='label', data_dict=item_search)
-            elif cls.__name__ == 'Artist':
-                item_search = MusicBrainz.artist_search(name=name, mbid=mbid)
-                if item_search is None:
-                    item_search = {"name": name}
-                new_item = construct_item(model_name='artist', data_dict=item_search)
-            else:
-                raise ValueError(f"Unsupported class: {cls} - supported classes are Label and Artist")
+            if item_search is None:
+                item_search = cls.lookup(name=name, mbid=mbid)
+            new_item = construct_item(model_name=cls.__name__.lower(), data_dict=item_search)
 
             # check if we got a mbid from the above search
-            if item_search["mbid"]:
+            if item_search.get("mbid"):
                 item_exists = cls.exists_by_mbid(item_search["mbid"])
                 if item_exists:
                     return item_exists.id
@@ -874,17 +993,9 @@ class ArtistOrLabel(MusicBrainzEntity):
             item_id = insert(new_item)
             # TODO: see if Util.get_image() can be refactored; instead of label_name and artist_name use item_name
             if cls.__name__ == 'Label':
-                Util.get_image(
-                    item_type='label',
-                    item_id=item_id,
-                    label_name=name
-            )
+                ImageQueue.enqueue('label', item_id, label_name=name)
             elif cls.__name__ == 'Artist':
-                Util.get_image(
-                    item_type='artist',
-                    item_id=item_id,
-                    artist_name=name
-                )
+                ImageQueue.enqueue('artist', item_id, artist_name=name)
             # TODO: figure out a way to call Util.get_image() upon any insertion so it doesn't need to be manually called
         return item_id
 
@@ -1075,3 +1186,246 @@ class Genre(Base):
             cls.name == name
         ).one_or_none()
         return result
+
+
+class EntityRollup(Base):
+    """
+    Per-artist and per-label aggregates of their releases (release count, rating sum, runtime sum).
+
+    The rows are adjusted incrementally by databass.db.operations whenever a release is inserted,
+    updated or deleted, so the leaderboards read one row per entity instead of grouping the release table.
+    The rows are calculated from the release table at startup if there are none yet (see rebuild_if_empty()).
+    Writes that bypass databass.db.operations must not change a release's artist, label, rating or runtime;
+    if they do, run `flask rebuild-rollups` to recalculate the rows.
+
+    Attributes:
+        entity_type: "artist" or "label"
+        entity_id: ID of the artist or label
+        release_count: Number of releases
+        rating_sum: Sum of the release ratings
+        runtime_sum: Sum of the release runtimes, in milliseconds
+    """
+    __tablename__ = "entity_rollup"
+    __table_args__ = (UniqueConstraint("entity_type", "entity_id"),)
+
+    entity_type: Mapped[str] = mapped_column(String)
+    entity_id: Mapped[int] = mapped_column(Integer)
+    release_count: Mapped[int] = mapped_column(Integer, default=0)
+    rating_sum: Mapped[int] = mapped_column(Integer, default=0)
+    runtime_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+
+    ENTITY_TYPES = ("artist", "label")
+    # Dialect-specific INSERT constructs, which support ON CONFLICT DO UPDATE
+    UPSERT = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+    # Key of the PostgreSQL advisory lock that serializes the startup rebuild across workers
+    REBUILD_LOCK_KEY = 1_801_545_068
+
+    @staticmethod
+    def snapshot(item: Any, include_releases: bool = False) -> list[dict]:
+        """
+        Capture the values that contribute to the rollups for a database item.
+
+        Args:
+            item: Instance of a database model class.
+            include_releases (bool): For an Artist or Label, capture its releases;
+                used when deleting it, as its releases are deleted with it.
+
+        Returns:
+            list[dict]: One dictionary per affected release with the keys
+                artist_id, label_id, rating and runtime. Empty for items that do not affect the rollups.
+        """
+        if isinstance(item, Release):
+            releases = [item]
+        elif include_releases and isinstance(item, ArtistOrLabel):
+            releases = list(item.releases)
+        else:
+            return []
+        return [
+            {
+                "artist_id": release.artist_id,
+                "label_id": release.label_id,
+                # Forms submit the rating as a string, and it is not converted until the row is reloaded
+                "rating": int(release.rating or 0),
+                "runtime": int(release.runtime or 0)
+            } for release in releases
+        ]
+
+    @classmethod
+    def apply_change(
+            cls,
+            before: list[dict],
+            after: list[dict]
+    ) -> None:
+        """
+        Adjust the rollups for releases changing from the `before` values to the `after` values,
+        as captured by snapshot(). An insert has no `before` values; a delete has no `after` values.
+        The changes are added to the current session and committed with the write that caused them.
+
+        Each rollup is adjusted with a single INSERT ... ON CONFLICT DO UPDATE, so concurrent writes
+        for an entity without a rollup row cannot both insert one and fail the caller's transaction.
+
+        Args:
+            before (list[dict]): Release values prior to the write.
+            after (list[dict]): Release values following the write.
+        """
+        deltas = {}
+        for releases, sign in ((before, -1), (after, 1)):
+            for release in releases:
+                for entity_type in cls.ENTITY_TYPES:
+                    entity_id = release[f"{entity_type}_id"]
+                    if entity_id is None:
+                        continue
+                    count, rating, runtime = deltas.get((entity_type, entity_id), (0, 0, 0))
+                    deltas[(entity_type, entity_id)] = (
+                        count + sign,
+                        rating + sign * release["rating"],
+                        runtime + sign * release["runtime"]
+                    )
+
+        rows = [
+            {
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "release_count": count,
+                "rating_sum": rating,
+                "runtime_sum": runtime
+            } for (entity_type, entity_id), (count, rating, runtime) in deltas.items()
+            if not count == rating == runtime == 0
+        ]
+        if not rows:
+            return
+        dialect = app_db.session.get_bind().dialect.name
+        statement = cls.UPSERT[dialect](cls).values(rows)
+        app_db.session.execute(statement.on_conflict_do_update(
+            index_elements=[cls.entity_type, cls.entity_id],
+            set_={
+                "release_count": cls.release_count + statement.excluded.release_count,
+                "rating_sum": cls.rating_sum + statement.excluded.rating_sum,
+                "runtime_sum": cls.runtime_sum + statement.excluded.runtime_sum
+            }
+        ))
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """
+        Recalculate every rollup from the release table, e.g. for a database that predates the rollups.
+        """
+        app_db.session.query(cls).delete()
+        for entity_type, relation_id in (("artist", Release.artist_id), ("label", Release.label_id)):
+            grouped = (
+                app_db.session.query(
+                    relation_id.label('entity_id'),
+                    func.count(Release.id).label('release_count'),
+                    func.coalesce(func.sum(Release.rating), 0).label('rating_sum'),
+                    func.coalesce(func.sum(Release.runtime), 0).label('runtime_sum')
+                )
+                .where(relation_id.isnot(None))
+                .group_by(relation_id)
+                .all()
+            )
+            app_db.session.add_all([
+                cls(
+                    entity_type=entity_type,
+                    entity_id=row.entity_id,
+                    release_count=row.release_count,
+                    rating_sum=row.rating_sum,
+                    runtime_sum=row.runtime_sum
+                ) for row in grouped
+            ])
+        app_db.session.commit()
+
+    @classmethod
+    def rebuild_if_empty(cls) -> bool:
+        """
+        Rebuild the rollups if there are none but there are releases, i.e. on the first start after
+        upgrading from a version without rollups.
+
+        On PostgreSQL the check and the rebuild run in one transaction holding an advisory lock, so workers
+        starting together wait for the first one and then find the rollups populated. On SQLite the database
+        write lock serializes the rebuilds, and a repeated rebuild replaces the rows with the same values.
+
+        Returns:
+            bool: Whether the rollups were rebuilt
+        """
+        if app_db.session.get_bind().dialect.name == "postgresql":
+            # Released when the transaction commits or rolls back
+            app_db.session.execute(select(func.pg_advisory_xact_lock(cls.REBUILD_LOCK_KEY)))
+        needed = (
+            app_db.session.execute(select(cls.id).limit(1)).first() is None
+            and app_db.session.execute(select(Release.id).limit(1)).first() is not None
+        )
+        if not needed:
+            app_db.session.rollback()
+            return False
+        cls.rebuild()
+        return True
+
+
+@click.command("rebuild-rollups")
+@with_appcontext
+def rebuild_rollups():
+    """Recalculate the artist/label rollups from the release table."""
+    EntityRollup.rebuild()
+    click.echo(f"{app_db.session.query(EntityRollup).count()} rollups rebuilt")
+
+
+class ApiResponse(Base):
+    """
+    Cached response of an external API call; see databass.api.cache.ResponseCache.
+
+    Attributes:
+        key: Hash of the source, endpoint and call arguments
+        source: The API the response came from, e.g. "musicbrainz"
+        endpoint: The API call, e.g. "get_release_by_id"
+        response: The response, serialized as JSON
+        expires: When the response must be fetched again
+    """
+    __tablename__ = "api_response"
+
+    key: Mapped[str] = mapped_column(String(64), unique=True)
+    source: Mapped[str] = mapped_column(String)
+    endpoint: Mapped[str] = mapped_column(String)
+    response: Mapped[str] = mapped_column(Text)
+    expires: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class SearchResultSet(Base):
+    """
+    Search results kept for paging; see databass.result_sets.ResultSets.
+
+    Attributes:
+        key: Random id of the result set, sent by the client when changing pages
+        results: The full list of results, serialized as JSON
+        last_used: When the result set was stored or last read
+    """
+    __tablename__ = "result_set"
+
+    key: Mapped[str] = mapped_column(String(32), unique=True)
+    results: Mapped[str] = mapped_column(Text)
+    last_used: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+# pg_trgm provides the gin_trgm_ops operator class used by the name indexes
+event.listen(
+    Base.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+
+
+def create_search_indexes(bind) -> None:
+    """
+    Create the trigram name indexes if they are missing, i.e. on a database whose tables
+    were created before the indexes were declared; create_all() only creates indexes with new tables.
+    Does nothing on engines other than PostgreSQL.
+
+    Args:
+        bind: SQLAlchemy engine or connection.
+    """
+    if bind.dialect.name != 'postgresql':
+        return
+    with bind.begin() as connection:
+        connection.execute(DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        for model in (Release, Artist, Label):
+            for index in model.__table__.indexes:
+                if index.name.endswith('_name_trgm'):
+                    index.create(connection, checkfirst=True)
@@ -2,6 +2,7 @@ from os import getenv
 from sqlalchemy.exc import IntegrityError
 from dotenv import load_dotenv
 from .base import app_db
+from .cache import StatsCache
 
 
 load_dotenv()
@@ -24,7 +25,11 @@ def insert(item: app_db.Model) -> int:
     """
     try:
         app_db.session.add(item)
+        # Flush first so the rollups see the item's foreign keys; both are committed together
+        app_db.session.flush()
+        update_rollups(before=[], after=rollup_snapshot(item))
         app_db.session.commit()
+        StatsCache.invalidate_for(getattr(item, '__tablename__', None))
         return item.id
     except IntegrityError as err:
         app_db.session.rollback()
@@ -48,10 +53,13 @@ def update(item: app_db.Model) -> None:
         model_class = type(item)
         existing_item = app_db.session.query(model_class).get(item.id)
         if existing_item:
+            before = rollup_snapshot(existing_item)
             for key in item.__dict__:
                 if not key.startswith('_'): # Ignore private attributes
                     setattr(existing_item, key, getattr(item, key))
+            update_rollups(before=before, after=rollup_snapshot(existing_item))
             app_db.session.commit()
+            StatsCache.invalidate_for(getattr(model_class, '__tablename__', None))
         else:
             raise Exception(f"No entry found with ID {item.id}")
     except Exception as err:
@@ -76,8 +84,12 @@ def delete(item_type: str,
         model = get_model(item_type)
         to_delete = app_db.session.query(model).where(model.id == item_id).one()
         if to_delete:
+            # Deleting an artist or label also deletes its releases
+            before = rollup_snapshot(to_delete, include_releases=True)
             app_db.session.delete(to_delete)
+            update_rollups(before=before, after=[])
             app_db.session.commit()
+            StatsCache.invalidate_for(getattr(model, '__tablename__', None))
         else:
             raise Exception(f'No {item_type} entry found for {item_id}')
     except Exception as err:
@@ -85,6 +97,26 @@ def delete(item_type: str,
         raise Exception(f'Unexpected error: {err}')
 
 
+def rollup_snapshot(item: app_db.Model,
+                    include_releases: bool = False) -> list[dict]:
+    """
+    Capture the values of `item` that contribute to the artist/label rollups; see models.EntityRollup.snapshot()
+    """
+    from .models import EntityRollup
+    return EntityRollup.snapshot(item, include_releases=include_releases)
+
+
+def update_rollups(before: list[dict],
+                   after: list[dict]) -> None:
+    """
+    Adjust the artist/label rollups in the current transaction; see models.EntityRollup.apply_change()
+    """
+    if not before and not after:
+        return
+    from .models import EntityRollup
+    EntityRollup.apply_change(before, after)
+
+
 def get_model(model_name: str):
     """
     :param model_name: String corresponding to a database model class
@@ -0,0 +1,323 @@
+"""
+Computes the statistics shown on the home and stats pages.
+
+Rather than issuing one query per figure, the statistics are split into sections
+(global totals, yearly rates, artist leaderboards, label leaderboards) that are each
+gathered in a single aggregate statement, so a page only computes the sections it shows.
+"""
+from datetime import datetime, date
+from sqlalchemy import select, func, extract, case, literal, union_all, or_, and_
+from .base import app_db
+from .models import Release, Artist, Label, EntityRollup
+
+# Names that do not refer to a specific real-world entity; excluded from leaderboards
+EXCLUDED_NAMES = ("[NONE]", "Various Artists")
+LEADERBOARD_LIMIT = 10
+
+
+def global_totals() -> dict:
+    """
+    Calculate the release/artist/label totals and release averages in a single statement.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - total_listens, total_artists, total_labels
+            - average_rating: Average release rating, rounded to 2 decimal places
+            - average_runtime: Average release runtime in minutes, rounded to 2 decimal places
+            - total_runtime: Total release runtime in hours, rounded to 2 decimal places
+    """
+    statement = select(
+        func.count(Release.id).label('total_listens'),
+        select(func.count(Artist.id)).scalar_subquery().label('total_artists'),
+        select(func.count(Label.id)).scalar_subquery().label('total_labels'),
+        func.avg(Release.rating).label('average_rating'),
+        func.avg(Release.runtime).label('average_runtime'),
+        func.sum(Release.runtime).label('total_runtime'),
+    ).select_from(Release)
+
+    try:
+        row = app_db.session.execute(statement).one()
+    except Exception:
+        app_db.session.rollback()
+        return totals_from_row(None)
+    return totals_from_row(row)
+
+
+def totals_from_row(row) -> dict:
+    """
+    Convert the raw row returned by the global_totals() statement into the statistics dictionary.
+    A missing row (i.e. the query failed) produces zeroes, matching the per-model statistic methods.
+    """
+    def value(name):
+        return getattr(row, name, None) if row is not None else None
+
+    average_runtime = value('average_runtime')
+    total_runtime = value('total_runtime')
+    return {
+        "total_listens": value('total_listens') or 0,
+        "total_artists": value('total_artists') or 0,
+        "total_labels": value('total_labels') or 0,
+        "average_rating": round(value('average_rating') or 0, 2),
+        "average_runtime": round(average_runtime / 60000, 2) if average_runtime is not None else 0,
+        "total_runtime": round(total_runtime / 3600000, 2) if total_runtime is not None else 0,
+    }
+
+
+def yearly_rates() -> dict:
+    """
+    Calculate how many releases, artists and labels were added this year, and the daily rates,
+    in a single statement.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - releases_this_year, artists_this_year, labels_this_year
+            - releases_per_day, artists_per_day, labels_per_day: This year's count divided by
+              the number of days so far this year, rounded to 2 decimal places
+    """
+    current_year = datetime.now().year
+
+    def added_this_year(model):
+        return (
+            select(func.count(model.id))
+            .where(extract('year', model.date_added) == current_year)
+            .scalar_subquery()
+        )
+
+    statement = select(
+        added_this_year(Release).label('releases_this_year'),
+        added_this_year(Artist).label('artists_this_year'),
+        added_this_year(Label).label('labels_this_year'),
+    )
+
+    try:
+        row = app_db.session.execute(statement).one()
+    except Exception:
+        app_db.session.rollback()
+        return yearly_from_row(None)
+    return yearly_from_row(row)
+
+
+def yearly_from_row(row) -> dict:
+    """
+    Convert the raw row returned by the yearly_rates() statement into the statistics dictionary.
+    A missing row (i.e. the query failed) produces zeroes.
+    """
+    days_this_year = date.today().timetuple().tm_yday
+
+    def count(name):
+        return (getattr(row, name, None) if row is not None else None) or 0
+
+    def per_day(value):
+        return round(value / days_this_year, 2) if days_this_year else 0.0
+
+    releases_this_year = count('releases_this_year')
+    artists_this_year = count('artists_this_year')
+    labels_this_year = count('labels_this_year')
+    return {
+        "releases_this_year": releases_this_year,
+        "artists_this_year": artists_this_year,
+        "labels_this_year": labels_this_year,
+        "releases_per_day": per_day(releases_this_year),
+        "artists_per_day": per_day(artists_this_year),
+        "labels_per_day": per_day(labels_this_year),
+    }
+
+
+def ranked_entities(model, limit: int | None = LEADERBOARD_LIMIT):
+    """
+    Build a SELECT over the per-entity aggregates (average rating, release count) for Artist or Label,
+    read from EntityRollup, ranked three ways: by release count, by average rating and by Bayesian average rating.
+    Only rows that place within `limit` on at least one of the rankings are selected.
+    This is also the Bayesian calculation behind ArtistOrLabel.average_ratings_bayesian().
+
+    The average and Bayesian rankings only consider entities with more than one release,
+    matching ArtistOrLabel.average_ratings_and_total_counts().
+
+    Args:
+        model: The Artist or Label model class.
+        limit (int | None): The number of entries to keep per ranking; None keeps every entity.
+
+    Returns:
+        Select: SQLAlchemy select with the columns kind, id, name, image, average_rating,
+                release_count, bayesian_rating, frequency_rank, average_rank, bayesian_rank.
+    """
+    if model is not Artist and model is not Label:
+        raise TypeError("Leaderboards are only supported for Artist and Label classes.")
+    kind = model.__tablename__
+
+    grouped = (
+        select(
+            model.id,
+            model.name,
+            model.image,
+            model.rollup_average().label('average_rating'),
+            EntityRollup.release_count,
+        )
+        .join(EntityRollup, model.rollup_condition())
+        .where(model.name.notin_(EXCLUDED_NAMES))
+        .where(EntityRollup.release_count > 0)
+        .cte(f'{kind}_grouped')
+    )
+    repeat = grouped.c.release_count > 1
+    # The Bayesian average uses the average rating of each entity truncated to an integer
+    truncated_average = func.floor(grouped.c.average_rating)
+
+    with_means = select(
+        grouped,
+        func.avg(case((repeat, truncated_average))).over().label('mean_average'),
+        func.avg(case((repeat, grouped.c.release_count))).over().label('mean_count'),
+        func.row_number().over(
+            order_by=(grouped.c.release_count.desc(), grouped.c.id)
+        ).label('frequency_rank'),
+        func.row_number().over(
+            partition_by=repeat,
+            order_by=(grouped.c.average_rating.desc(), grouped.c.id)
+        ).label('average_rank'),
+    ).cte(f'{kind}_means')
+
+    weight = with_means.c.release_count / (with_means.c.release_count + with_means.c.mean_count)
+    bayesian = (
+        weight * func.floor(with_means.c.average_rating)
+        + (1 - weight) * with_means.c.mean_average
+    )
+    with_bayesian = select(
+        with_means,
+        bayesian.label('bayesian_rating'),
+    ).cte(f'{kind}_bayesian')
+
+    repeat = with_bayesian.c.release_count > 1
+    ranked = select(
+        with_bayesian,
+        func.row_number().over(
+            partition_by=repeat,
+            order_by=(with_bayesian.c.bayesian_rating.desc(), with_bayesian.c.id)
+        ).label('bayesian_rank'),
+    ).cte(f'{kind}_ranked')
+
+    repeat = ranked.c.release_count > 1
+    statement = select(
+        literal(kind).label('kind'),
+        ranked.c.id,
+        ranked.c.name,
+        ranked.c.image,
+        ranked.c.average_rating,
+        ranked.c.release_count,
+        ranked.c.bayesian_rating,
+        ranked.c.frequency_rank,
+        ranked.c.average_rank,
+        ranked.c.bayesian_rank,
+    )
+    if limit is None:
+        return statement
+    return statement.where(
+        or_(
+            ranked.c.frequency_rank <= limit,
+            and_(repeat, ranked.c.average_rank <= limit),
+            and_(repeat, ranked.c.bayesian_rank <= limit),
+        )
+    )
+
+
+def leaderboards(*models, limit: int = LEADERBOARD_LIMIT) -> dict:
+    """
+    Calculate the leaderboards (most frequent, highest average rating, highest Bayesian average rating)
+    for the given entity types in a single statement.
+
+    Args:
+        *models: Artist and/or Label model classes; defaults to both.
+        limit (int): The number of entries in each leaderboard, defaults to 10.
+
+    Returns:
+        dict: A dictionary with the keys top_frequent_<type>s, top_average_<type>s and
+              top_rated_<type>s for each requested type, e.g. top_frequent_artists.
+    """
+    if not isinstance(limit, int) or limit <= 0:
+        raise ValueError("Limit must be a positive integer.")
+    models = models or (Artist, Label)
+    statement = union_all(*(ranked_entities(model, limit) for model in models))
+    try:
+        rows = app_db.session.execute(statement).all()
+    except Exception:
+        app_db.session.rollback()
+        rows = []
+    return leaderboards_from_rows(rows, limit, kinds=[model.__tablename__ for model in models])
+
+
+def leaderboards_from_rows(rows, limit: int = LEADERBOARD_LIMIT, kinds=("artist", "label")) -> dict:
+    """
+    Split the rows returned by the leaderboards() statement into the individual leaderboards.
+    The dictionaries have the same keys as those returned by ArtistOrLabel.frequency_highest(),
+    ArtistOrLabel.average_ratings_and_total_counts() and ArtistOrLabel.average_ratings_bayesian().
+    """
+    boards = {}
+    for kind in kinds:
+        plural = f"{kind}s"
+        entities = [row for row in rows if row.kind == kind]
+        repeats = [row for row in entities if row.release_count > 1]
+
+        frequent = sorted(
+            (row for row in entities if row.frequency_rank <= limit),
+            key=lambda r: r.frequency_rank
+        )
+        average = sorted(
+            (row for row in repeats if row.average_rank <= limit),
+            key=lambda r: r.average_rank
+        )
+        rated = sorted(
+            (row for row in repeats if row.bayesian_rank <= limit),
+            key=lambda r: r.bayesian_rank
+        )
+
+        boards[f"top_frequent_{plural}"] = [
+            {
+                "name": row.name,
+                "count": row.release_count,
+                "image": row.image
+            } for row in frequent
+        ]
+        boards[f"top_average_{plural}"] = [
+            {
+                "id": row.id,
+                "name": row.name,
+                "average_rating": row.average_rating,
+                "release_count": row.release_count,
+                "image": row.image
+            } for row in average
+        ]
+        boards[f"top_rated_{plural}"] = [
+            {
+                "id": row.id,
+                "name": row.name,
+                "rating": round(row.bayesian_rating),
+                "image": row.image,
+                "count": row.release_count
+            } for row in rated
+        ]
+    return boards
+
+
+# Independently computable sections of the statistics, by name
+SECTIONS = {
+    "totals": global_totals,
+    "yearly": yearly_rates,
+    "artists": lambda: leaderboards(Artist),
+    "labels": lambda: leaderboards(Label),
+}
+
+
+def stats_section(name: str) -> dict:
+    """
+    Calculate a single section of the statistics.
+
+    Args:
+        name (str): One of the keys of SECTIONS: 'totals', 'yearly', 'artists' or 'labels'.
+
+    Returns:
+        dict: The statistics for that section.
+
+    Raises:
+        ValueError: If `name` is not a known section.
+    """
+    if name not in SECTIONS:
+        raise ValueError(f"Unknown stats section: {name}. Valid sections are: {', '.join(SECTIONS)}")
+    return SECTIONS[name]()
@@ -1,4 +1,8 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import getenv
 from typing import Type
+from flask import current_app, has_app_context
 from sqlalchemy.orm import query as sql_query
 from .models import *
 # above imports all of the below
@@ -6,6 +10,9 @@ from .models import *
 # from sqlalchemy.engine.row import Row
 # from .models import Artist, Release, Label, MusicBrainzEntity, Base, Goal, Genre
 
+# Seconds handle_submit_data waits for the MusicBrainz lookups of a new release before inserting it without them
+ENRICHMENT_DEADLINE: float = float(getenv("ENRICHMENT_DEADLINE", "30"))
+
 
 def get_valid_models():
     return [cls.__name__.lower() for cls in Base.__subclasses__()]
@@ -45,70 +52,64 @@ def apply_comparison_filter(query,
     return query
 
 
-# Utility function to calculate the mean average rating and total release count
-# for releases associated with a specific Label/Artist
-def mean_avg_and_count(entities: list[Row]) -> (int, int):
+def get_stats(*sections: str) -> dict:
     """
-    :param entities: List of SQLAlchemy Rows; returned from average_ratings_and_total_counts()
-    :return: A tuple representing the mean average release rating and mean release count
+    Gather the given sections of the statistics (see db.stats.SECTIONS), each computed
+    in a single aggregate statement. Every section is served from StatsCache until a write
+    invalidates it or the TTL expires.
+
+    Args:
+        *sections (str): Section names, i.e. 'totals', 'yearly', 'artists', 'labels'
+
+    Returns:
+        dict: The combined statistics of the requested sections
     """
-    avg = count = 0
-    total = len(entities)
-    for item in entities:
-        try:
-            avg += int(item.average_rating)
-            count += int(item.release_count)
-        except AttributeError:
-            # TODO: consider logging info about the erroring release
-            # Have not encountered this in practice, but if it is encountered it means there is a corrupt entry
-            total -= 1
-
-    mean_avg = avg / total
-    mean_count = count / total
-    return mean_avg, mean_count
-
-
-# Utility function used to calculate Bayesian average
-def bayesian_avg(
-        item_weight: float,
-        item_avg: float,
-        mean_avg: float
-) -> float:
+    from .stats import stats_section
+    from .cache import StatsCache
+    stats = {}
+    for section in sections:
+        stats.update(StatsCache.get(section, lambda name=section: stats_section(name)))
+    return stats
+
+
+def run_concurrently(calls: dict, deadline: float) -> dict:
     """
-    Calculates the Bayesian average rating for a given item weight and average
-    :param item_weight: Float representing the item's weight for the formula;
-                        calculated as: count / (count + mean count)
-    :param item_avg: Item's average rating
-    :param mean_avg: Mean average release rating for all database entries
-    :return: Float representing the Bayesian average rating for releases associated with this item
+    Run independent calls in a thread pool and collect the results of those finishing within the deadline.
+    Each call runs in the current application context (if any) and a copy of the caller's context variables,
+    so e.g. a MusicBrainz.scheduler priority set by the caller applies to the calls.
+    Calls only overlap where they do not wait on a shared limiter: calls that take turns in a RequestScheduler
+    or TokenBucket still run one per interval, in whichever thread gets the slot.
+    Calls still running at the deadline are left to finish in the background; their results are dropped.
+    :param calls: Mapping of name to a zero-argument callable
+    :param deadline: Seconds to wait for all calls to finish
+    :return: Mapping of name to result, for the calls that finished without raising an exception
     """
-    if not item_weight or not item_avg or not mean_avg:
-        raise ValueError("Input missing one of the required values")
-    return item_weight * item_avg + (1 - item_weight) * mean_avg
-
-
-def get_all_stats():
-    stats = {
-        "total_listens": Release.total_count(),
-        "total_artists": Artist.total_count(),
-        "total_labels": Label.total_count(),
-        "average_rating": Release.ratings_average(),
-        "average_runtime": Release.average_runtime(),
-        "total_runtime": Release.total_runtime(),
-        "releases_this_year": Release.added_this_year(),
-        "artists_this_year": Artist.added_this_year(),
-        "labels_this_year": Label.added_this_year(),
-        "releases_per_day": Release.added_per_day_this_year(),
-        "artists_per_day": Artist.added_per_day_this_year(),
-        "labels_per_day": Label.added_per_day_this_year(),
-        "top_rated_labels": Label.average_ratings_bayesian()[0:10],
-        "top_rated_artists": Artist.average_ratings_bayesian()[0:10],
-        "top_frequent_labels": Label.frequency_highest()[0:10],
-        "top_frequent_artists": Artist.frequency_highest()[0:10],
-        "top_average_artists": Artist.average_ratings_and_total_counts()[0:10],
-        "top_average_labels": Label.average_ratings_and_total_counts()[0:10],
+    if not calls:
+        return {}
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def in_context(call):
+        if app is None:
+            return call()
+        with app.app_context():
+            return call()
+
+    pool = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="enrichment")
+    futures = {
+        name: pool.submit(contextvars.copy_context().run, in_context, call)
+        for name, call in calls.items()
     }
-    return stats
+    wait(futures.values(), timeout=deadline)
+    pool.shutdown(wait=False, cancel_futures=True)
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            print(f'{name} lookup did not finish within {deadline}s; continuing without it')
+        elif future.exception() is not None:
+            print(f'{name} lookup failed: {future.exception()}')
+        else:
+            results[name] = future.result()
+    return results
 
 
 def handle_submit_data(submit_data: dict) -> None:
@@ -117,37 +118,52 @@ def handle_submit_data(submit_data: dict) -> None:
     - Fetches release runtime from MusicBrainz, if a MBID is provided
     - Checks if matching label/artist exists in the db, creates one if it doesn't
     - Inserts the new release and subgenres
+    The lookups for the runtime, label and artist are started together and the release is inserted once
+    they finish or ENRICHMENT_DEADLINE passes. Lookups answered from the response cache overlap; those
+    that reach MusicBrainz take turns in MusicBrainz.scheduler at interactive priority, one per interval.
     :param submit_data:
     :return:
     """
     from ..api import MusicBrainz
+    from ..api.rate_limit import INTERACTIVE
+    label_mbid = submit_data["label_mbid"] or None
+    label_name = submit_data["label_name"]
+    artist_mbid = submit_data["artist_mbid"] or None
+    artist_name = submit_data["artist_name"]
+
+    lookups = {}
     if submit_data["mbid"]:
-        runtime = MusicBrainz.get_release_length(submit_data["mbid"])
-        submit_data["runtime"] = runtime
+        lookups["runtime"] = lambda: MusicBrainz.get_release_length(submit_data["mbid"])
         # If we aren't handling a MusicBrainz release,
         # the user can optionally pass in the runtime and it's already in submit_data
-
-
-    if submit_data["label_mbid"]:
+    # Labels and artists already in the database need no lookup
+    if (label_mbid or label_name) and not Label.exists_by_mbid_or_name(label_name, label_mbid):
+        lookups["label"] = lambda: Label.lookup(name=label_name, mbid=label_mbid)
+    if (artist_mbid or artist_name) and not Artist.exists_by_mbid_or_name(artist_name, artist_mbid):
+        lookups["artist"] = lambda: Artist.lookup(name=artist_name, mbid=artist_mbid)
+    # The user is waiting on these, so they go ahead of queued background requests
+    with MusicBrainz.scheduler.priority(INTERACTIVE):
+        results = run_concurrently(lookups, ENRICHMENT_DEADLINE)
+
+    if "runtime" in lookups:
+        submit_data["runtime"] = results.get("runtime", 0)
+
+    if label_mbid or label_name:
         label_id = Label.create_if_not_exist(
-            mbid=submit_data["label_mbid"],
-            name=submit_data["label_name"],
+            mbid=label_mbid,
+            name=label_name,
+            item_search=results.get("label", {"name": label_name, "mbid": label_mbid})
         )
-    elif submit_data["label_name"]:
-        label_id = Label.create_if_not_exist(name=submit_data["label_name"])
     else:
         label_id = 0
 
     submit_data["label_id"] = label_id
 
-    if submit_data["artist_mbid"]:
-        artist_id = Artist.create_if_not_exist(
-            mbid=submit_data["artist_mbid"],
-            name=submit_data["artist_name"],
-        )
-    elif submit_data["artist_name"]:
+    if artist_mbid or artist_name:
         artist_id = Artist.create_if_not_exist(
-            name=submit_data["artist_name"]
+            mbid=artist_mbid,
+            name=artist_name,
+            item_search=results.get("artist", {"name": artist_name, "mbid": artist_mbid})
         )
     else:
         artist_id = 0
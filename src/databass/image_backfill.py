@@ -0,0 +1,301 @@
+"""
+Bulk download of missing release, artist and label images
+
+Run from the src directory with:
+    flask --app databass:create_app backfill-images [--dry-run] [--resume]
+or start it in the background from /fix_images.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+import click
+from dotenv import load_dotenv
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, literal, null, union_all
+from .api.rate_limit import SharedState
+from .db.base import app_db
+from .db.models import Release, Artist, Label
+from .db.operations import update
+from .image_index import ImageIndex, ITEM_TYPES
+from .image_queue import ImageQueue
+
+load_dotenv()
+# Items already attempted by earlier runs, so an interrupted run can be resumed
+BACKFILL_STATE_FILE = getenv("IMAGE_BACKFILL_STATE_FILE", "./cache/image_backfill.json")
+# Concurrent downloads per upstream. CoverArtArchive has no published rate limit;
+# Discogs requests are additionally spaced out by Discogs.rate_limiter
+BACKFILL_CAA_WORKERS: int = int(getenv("IMAGE_BACKFILL_CAA_WORKERS", "4"))
+BACKFILL_DISCOGS_WORKERS: int = int(getenv("IMAGE_BACKFILL_DISCOGS_WORKERS", "2"))
+# Attempted items are written to the state file in batches of this size
+BACKFILL_RECORD_EVERY: int = int(getenv("IMAGE_BACKFILL_RECORD_EVERY", "50"))
+MODELS = {"release": Release, "artist": Artist, "label": Label}
+
+
+class BackfillItem(NamedTuple):
+    item_type: str
+    item_id: int
+    name: str
+    mbid: Optional[str]
+    artist_name: Optional[str]
+
+    @property
+    def key(self) -> str:
+        return f"{self.item_type}/{self.item_id}"
+
+    @property
+    def upstream(self) -> str:
+        """The first source Util.get_image tries: CoverArtArchive for releases with a MBID, otherwise Discogs"""
+        return "caa" if self.item_type == "release" and self.mbid else "discogs"
+
+    def get_image_kwargs(self) -> dict:
+        kwargs = {"item_type": self.item_type, "item_id": self.item_id, "mbid": self.mbid}
+        if self.item_type == "release":
+            kwargs.update(release_name=self.name, artist_name=self.artist_name)
+        elif self.item_type == "artist":
+            kwargs.update(artist_name=self.name)
+        else:
+            kwargs.update(label_name=self.name)
+        return kwargs
+
+
+class ImageBackfill:
+    """
+    Finds every item without a local image and downloads the missing images concurrently.
+
+    Items are split by upstream, and each upstream gets its own bounded thread pool, so slow
+    Discogs lookups (which wait for the Discogs rate limiter) do not hold up CoverArtArchive downloads.
+    Attempted items are recorded in a SharedState file, in batches of `record_every`; with resume=True,
+    items attempted by an earlier run (including those for which no image was found) are skipped.
+    A run that is killed loses at most the last batch, whose items are attempted again when resuming.
+
+    Image paths are saved through databass.db.operations.update(), like any other edit.
+
+    Attributes:
+        state (SharedState): Keys of the items attempted so far
+        progress (dict): Counters of the current or last run, see progress_info()
+        record_every (int): Number of attempted items written to the state file at once
+    """
+    state: SharedState = SharedState(BACKFILL_STATE_FILE)
+    progress: Dict[str, float] = {}
+    record_every: int = BACKFILL_RECORD_EVERY
+    _attempted: List[str] = []
+    _lock = threading.Lock()
+    _thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def existing_images(cls) -> Dict[str, Set[int]]:
+        """
+        IDs of the items that have an image, from the image index.
+
+        Returns:
+            dict: Item type -> set of item IDs
+        """
+        return {item_type: ImageIndex.ids(item_type) for item_type in ITEM_TYPES}
+
+    @classmethod
+    def missing_images(cls, item_types=ITEM_TYPES) -> List[BackfillItem]:
+        """
+        All items of the given types without a local image, fetched in a single query.
+
+        Returns:
+            list[BackfillItem]: The items, ordered by type then ID
+        """
+        queries = {
+            "release": select(
+                literal("release").label("item_type"), Release.id, Release.name, Release.mbid,
+                Artist.name.label("artist_name")
+            ).outerjoin(Artist, Release.artist_id == Artist.id),
+            "artist": select(
+                literal("artist").label("item_type"), Artist.id, Artist.name, Artist.mbid,
+                null().label("artist_name")
+            ),
+            "label": select(
+                literal("label").label("item_type"), Label.id, Label.name, Label.mbid,
+                null().label("artist_name")
+            ),
+        }
+        statement = union_all(*(queries[item_type] for item_type in item_types))
+        existing = cls.existing_images()
+        items = [
+            BackfillItem(*row)
+            for row in app_db.session.execute(statement).all()
+            if row.id not in existing[row.item_type]
+        ]
+        items.sort(key=lambda item: (ITEM_TYPES.index(item.item_type), item.item_id))
+        return items
+
+    @classmethod
+    def run(
+            cls,
+            item_types=ITEM_TYPES,
+            dry_run: bool = False,
+            resume: bool = False,
+            caa_workers: int = BACKFILL_CAA_WORKERS,
+            discogs_workers: int = BACKFILL_DISCOGS_WORKERS,
+            report: Callable[[str], None] = print
+    ) -> dict:
+        """
+        Download all missing images. Must be called within an application context.
+
+        Args:
+            item_types: Types of item to backfill
+            dry_run (bool): Only report which items would be fetched from which upstream
+            resume (bool): Skip items attempted by an earlier run; otherwise the record of attempted items is reset
+            caa_workers (int): Concurrent downloads for releases with a MBID
+            discogs_workers (int): Concurrent downloads for all other items
+            report (callable): Receives a line of progress per item
+
+        Returns:
+            dict: The final progress counters
+        """
+        items = cls.missing_images(item_types)
+        with cls.state.update() as state:
+            if not resume and not dry_run:
+                state.clear()
+            attempted = set(state.get("attempted", [])) if resume else set()
+        skipped = sum(1 for item in items if item.key in attempted)
+        items = [item for item in items if item.key not in attempted]
+        cls._reset_progress(len(items))
+        report(f"{len(items)} items without an image" + (f", {skipped} skipped from earlier runs" if skipped else ""))
+
+        if dry_run:
+            for item in items:
+                report(f"{item.key} {item.name!r}: would fetch from {item.upstream}")
+            return cls.progress_info()
+
+        app = current_app._get_current_object()
+        pools = {
+            "caa": ThreadPoolExecutor(max_workers=max(1, caa_workers), thread_name_prefix="backfill-caa"),
+            "discogs": ThreadPoolExecutor(max_workers=max(1, discogs_workers), thread_name_prefix="backfill-discogs"),
+        }
+        try:
+            futures = [
+                pools[item.upstream].submit(cls._fetch, app, item, report)
+                for item in items
+            ]
+            for future in futures:
+                future.result()
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+            cls._save_attempts(flush=True)
+        info = cls.progress_info()
+        report(f"Done: {info['saved']} saved, {info['not_found']} not found, "
+               f"{info['failed']} failed in {info['elapsed']}s")
+        return info
+
+    @classmethod
+    def start(cls, **kwargs) -> bool:
+        """
+        Run the backfill in a background thread of this process.
+
+        Returns:
+            bool: False if a backfill is already running
+        """
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                return False
+            app = current_app._get_current_object()
+
+            def run():
+                with app.app_context():
+                    cls.run(**kwargs)
+
+            cls._thread = threading.Thread(target=run, name="image-backfill", daemon=True)
+            cls._thread.start()
+            return True
+
+    @classmethod
+    def running(cls) -> bool:
+        """Whether a background backfill started by this process is still running"""
+        return cls._thread is not None and cls._thread.is_alive()
+
+    @classmethod
+    def progress_info(cls) -> dict:
+        """
+        Progress counters of the current or last run.
+
+        Returns:
+            dict: total, done, saved, not_found, failed, elapsed (seconds) and eta (seconds, None until known)
+        """
+        with cls._lock:
+            info = dict(cls.progress)
+        if not info:
+            return {"total": 0, "done": 0, "saved": 0, "not_found": 0, "failed": 0, "elapsed": 0, "eta": None}
+        elapsed = time.monotonic() - info.pop("started")
+        done = info["done"]
+        info["elapsed"] = round(elapsed, 1)
+        info["eta"] = round(elapsed / done * (info["total"] - done), 1) if done else None
+        return info
+
+    @classmethod
+    def _reset_progress(cls, total: int) -> None:
+        with cls._lock:
+            cls.progress = {
+                "total": total, "done": 0, "saved": 0, "not_found": 0, "failed": 0, "started": time.monotonic()
+            }
+
+    @classmethod
+    def _save_attempts(cls, flush: bool = False) -> None:
+        # Appends the attempted keys to the state file once a batch is full, or all of them if flushing
+        with cls._lock:
+            if not cls._attempted or (not flush and len(cls._attempted) < cls.record_every):
+                return
+            keys, cls._attempted = cls._attempted, []
+        with cls.state.update() as state:
+            state.setdefault("attempted", []).extend(keys)
+
+    @classmethod
+    def _fetch(cls, app, item: BackfillItem, report: Callable[[str], None]) -> None:
+        from .api import Util
+        if ImageQueue.pending(item.item_type, item.item_id):
+            outcome = "already being fetched"
+        else:
+            try:
+                with app.app_context():
+                    img_path = Util.get_image(**item.get_image_kwargs())
+                    if img_path:
+                        # Only the image changes; a new model instance would carry its default
+                        # artist_id/label_id/mbid into update()
+                        stored = app_db.session.get(MODELS[item.item_type], item.item_id)
+                        stored.image = img_path
+                        update(stored)
+                outcome = "saved" if img_path else "not found"
+            except Exception as err:
+                print(f'Image backfill failed for {item.key}: {err}')
+                outcome = "failed"
+            with cls._lock:
+                cls._attempted.append(item.key)
+            cls._save_attempts()
+        with cls._lock:
+            cls.progress["done"] += 1
+            counter = outcome.replace(" ", "_")
+            if counter in cls.progress:
+                cls.progress[counter] += 1
+            done, total = cls.progress["done"], cls.progress["total"]
+        report(f"[{done}/{total}] {item.key} {item.name!r}: {outcome}")
+
+
+@click.command("backfill-images")
+@click.option("--type", "item_types", multiple=True, type=click.Choice(ITEM_TYPES),
+              help="Only backfill these item types (default: all)")
+@click.option("--dry-run", is_flag=True, help="List the items that would be fetched without downloading anything")
+@click.option("--resume", is_flag=True, help="Skip items attempted by an earlier, possibly interrupted, run")
+@click.option("--caa-workers", default=BACKFILL_CAA_WORKERS, show_default=True,
+              help="Concurrent CoverArtArchive downloads")
+@click.option("--discogs-workers", default=BACKFILL_DISCOGS_WORKERS, show_default=True,
+              help="Concurrent Discogs downloads")
+@with_appcontext
+def backfill_images(item_types, dry_run, resume, caa_workers, discogs_workers):
+    """Download the images of all releases, artists and labels that have none."""
+    ImageBackfill.run(
+        item_types=item_types or ITEM_TYPES,
+        dry_run=dry_run,
+        resume=resume,
+        caa_workers=caa_workers,
+        discogs_workers=discogs_workers,
+        report=click.echo
+    )
@@ -0,0 +1,182 @@
+"""
+In-memory index of the locally stored release, artist and label images
+"""
+import hashlib
+import threading
+from os import path, scandir, stat
+from typing import Dict, Optional, Set, Tuple
+
+# Directory Util.get_image saves images to, with one subdirectory per item type
+IMG_DIR = "./databass/static/img"
+ITEM_TYPES = ("release", "artist", "label")
+
+
+class ImageIndex:
+    """
+    Maps (item type, item ID) to the path of the image file, so that serving an image needs
+    neither a database query nor a directory listing.
+
+    The index is filled by listing each image directory once (warm(), called at startup) and kept
+    up to date by record(), which Util.get_image calls after saving an image. Images saved by other
+    worker processes are picked up on a lookup miss: the modification time of the directory is
+    compared with the one seen at the last listing, and the directory is listed again if it changed.
+
+    Each image also has a version, a hash of its content (see version()), used for ETags and
+    cache-busting image URLs. For images in the ImageStore it is taken from the blob name; for
+    other files it is computed on first use and kept until the file changes.
+
+    Attributes:
+        img_dir (str): Directory the images are saved to
+    """
+    img_dir: str = IMG_DIR
+    _paths: Dict[str, Dict[int, str]] = {}
+    _scanned: Dict[str, Optional[int]] = {}
+    # Image path -> (modification time, size, content hash)
+    _versions: Dict[str, Tuple[int, int, str]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def warm(cls) -> None:
+        """
+        (Re)build the index by listing every image directory.
+        """
+        for item_type in ITEM_TYPES:
+            cls._scan(item_type)
+
+    @classmethod
+    def clear(cls) -> None:
+        """Empty the index; it is rebuilt lazily on the next lookup"""
+        with cls._lock:
+            cls._paths = {}
+            cls._scanned = {}
+            cls._versions = {}
+
+    @classmethod
+    def get(cls, item_type: str, item_id: int) -> Optional[str]:
+        """
+        Path of the image of an item.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+
+        Returns:
+            str: Absolute path of the image file, or None if the item has no image
+        """
+        if item_type not in ITEM_TYPES:
+            return None
+        with cls._lock:
+            img_path = cls._paths.get(item_type, {}).get(item_id)
+        if img_path is None and cls._changed(item_type):
+            cls._scan(item_type)
+            with cls._lock:
+                img_path = cls._paths[item_type].get(item_id)
+        return img_path
+
+    @classmethod
+    def version(cls, item_type: str, item_id: int) -> Optional[str]:
+        """
+        Hash of the content of an item's image. It changes whenever the image is replaced,
+        so it can be used as a strong ETag and to build URLs that are safe to cache forever.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+
+        Returns:
+            str: Hex digest, or None if the item has no image
+        """
+        from .image_store import ImageStore
+        img_path = cls.get(item_type, item_id)
+        if img_path is None:
+            return None
+        digest = ImageStore.digest(img_path)
+        if digest is not None:
+            # Stored as a blob, which is named after its hash
+            return digest[:32]
+        try:
+            file_stat = stat(img_path)
+            with cls._lock:
+                cached = cls._versions.get(img_path)
+            if cached is not None and cached[:2] == (file_stat.st_mtime_ns, file_stat.st_size):
+                return cached[2]
+            with open(img_path, "rb") as img_file:
+                digest = hashlib.file_digest(img_file, "sha256").hexdigest()[:32]
+        except FileNotFoundError:
+            # Deleted since it was indexed
+            cls.discard(item_type, item_id)
+            return None
+        with cls._lock:
+            cls._versions[img_path] = (file_stat.st_mtime_ns, file_stat.st_size, digest)
+        return digest
+
+    @classmethod
+    def ids(cls, item_type: str) -> Set[int]:
+        """
+        IDs of all items of a type that have an image.
+        """
+        if cls._changed(item_type):
+            cls._scan(item_type)
+        with cls._lock:
+            return set(cls._paths.get(item_type, {}))
+
+    @classmethod
+    def record(cls, item_type: str, item_id: int, img_path: str) -> None:
+        """
+        Add a newly saved image to the index.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+            img_path (str): Path the image was saved to
+        """
+        with cls._lock:
+            cls._paths.setdefault(item_type, {})[int(item_id)] = path.abspath(img_path)
+
+    @classmethod
+    def discard(cls, item_type: str, item_id: int) -> None:
+        """Remove an item whose image file no longer exists"""
+        with cls._lock:
+            cls._paths.get(item_type, {}).pop(item_id, None)
+
+    @classmethod
+    def _changed(cls, item_type: str) -> bool:
+        with cls._lock:
+            if item_type not in cls._scanned:
+                return True
+            scanned = cls._scanned[item_type]
+        return cls._mtime(item_type) != scanned
+
+    @classmethod
+    def _mtime(cls, item_type: str) -> Optional[int]:
+        try:
+            return stat(path.join(cls.img_dir, item_type)).st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def _scan(cls, item_type: str) -> None:
+        # The modification time is read before listing, so that files added during the listing
+        # change it again and trigger another listing on the next miss
+        mtime = cls._mtime(item_type)
+        paths: Dict[int, str] = {}
+        modified: Dict[int, int] = {}
+        try:
+            with scandir(path.join(cls.img_dir, item_type)) as entries:
+                for entry in entries:
+                    stem = entry.name.split(".", 1)[0]
+                    if not stem.isdigit() or not entry.is_file():
+                        continue
+                    item_id = int(stem)
+                    if item_id in paths:
+                        # Several files for the same item (e.g. .jpg replaced by .png): use the newest
+                        entry_mtime = entry.stat().st_mtime_ns
+                        if entry_mtime <= modified.setdefault(item_id, stat(paths[item_id]).st_mtime_ns):
+                            continue
+                        modified[item_id] = entry_mtime
+                    paths[item_id] = path.abspath(entry.path)
+        except FileNotFoundError:
+            pass
+        with cls._lock:
+            cls._paths[item_type] = paths
+            cls._scanned[item_type] = mtime
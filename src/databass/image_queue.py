@@ -0,0 +1,130 @@
+"""
+Background queue for fetching release, artist and label images, so that submitting a release
+does not wait for CoverArtArchive, Discogs and the image download
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv
+from typing import Optional
+from dotenv import load_dotenv
+from flask import current_app, has_app_context
+from .api.rate_limit import SharedState
+
+load_dotenv()
+# Threads fetching images in each worker process; 0 fetches images in the calling thread
+IMAGE_WORKERS: int = int(getenv("IMAGE_WORKERS", "2"))
+# Seconds after which a job that has not finished (e.g. because its worker was killed) is dropped
+IMAGE_JOB_TIMEOUT: float = float(getenv("IMAGE_JOB_TIMEOUT", "300"))
+# Jobs in progress, shared by all worker processes
+IMAGE_JOBS_FILE = getenv("IMAGE_JOBS_FILE", "./cache/image_jobs.json")
+
+
+class ImageQueue:
+    """
+    Runs Util.get_image() in a thread pool. Jobs in progress are recorded in a SharedState file,
+    so every worker can tell that an image is still being fetched (see pending()) and the same
+    image is not fetched twice at once.
+
+    Attributes:
+        workers (int): Size of the thread pool; 0 runs jobs in the calling thread
+        job_timeout (float): Seconds after which an unfinished job is no longer considered pending
+        jobs (SharedState): Start times of the jobs in progress, keyed by "<item_type>/<item_id>"
+    """
+    workers: int = IMAGE_WORKERS
+    job_timeout: float = IMAGE_JOB_TIMEOUT
+    jobs: SharedState = SharedState(IMAGE_JOBS_FILE)
+    _executor: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def enqueue(cls, item_type: str, item_id: int, **kwargs) -> bool:
+        """
+        Fetch the image of an item in the background.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+            **kwargs: Passed to Util.get_image, e.g. mbid, release_name, artist_name, label_name or url
+
+        Returns:
+            bool: True if the job was queued; False if the image is already being fetched
+        """
+        key = f"{item_type}/{item_id}"
+        with cls.jobs.update() as jobs:
+            cls._expire(jobs)
+            if key in jobs:
+                return False
+            jobs[key] = time.time()
+        app = current_app._get_current_object() if has_app_context() else None
+        if cls.workers <= 0:
+            cls._run(app, key, item_type, item_id, kwargs)
+        else:
+            cls._get_executor().submit(cls._run, app, key, item_type, item_id, kwargs)
+        return True
+
+    @classmethod
+    def generate_thumbnails(cls, item_type: str, item_id: int) -> None:
+        """
+        Generate every thumbnail size of an item's image in the background; see Thumbnails.generate_all().
+        Unlike enqueue(), the job is not recorded in `jobs`, as the image itself is already available.
+        """
+        if cls.workers <= 0:
+            cls._run_thumbnails(item_type, item_id)
+        else:
+            cls._get_executor().submit(cls._run_thumbnails, item_type, item_id)
+
+    @classmethod
+    def pending(cls, item_type: str, item_id: int) -> bool:
+        """
+        Check whether the image of an item is still being fetched by any worker.
+        """
+        jobs = cls.jobs.read()
+        cls._expire(jobs)
+        return f"{item_type}/{item_id}" in jobs
+
+    @classmethod
+    def wait(cls) -> None:
+        """
+        Wait for all jobs queued by this process to finish.
+        """
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.workers, thread_name_prefix="image")
+            return cls._executor
+
+    @classmethod
+    def _run(cls, app, key: str, item_type: str, item_id: int, kwargs: dict) -> None:
+        from .api import Util
+        try:
+            if app is not None:
+                with app.app_context():
+                    Util.get_image(item_type=item_type, item_id=item_id, **kwargs)
+            else:
+                Util.get_image(item_type=item_type, item_id=item_id, **kwargs)
+        except Exception as err:
+            print(f'Could not fetch image for {key}: {err}')
+        finally:
+            with cls.jobs.update() as jobs:
+                jobs.pop(key, None)
+
+    @staticmethod
+    def _run_thumbnails(item_type: str, item_id: int) -> None:
+        from .thumbnails import Thumbnails
+        try:
+            Thumbnails.generate_all(item_type, item_id)
+        except Exception as err:
+            print(f'Could not generate thumbnails for {item_type}/{item_id}: {err}')
+
+    @classmethod
+    def _expire(cls, jobs: dict) -> None:
+        now = time.time()
+        for key in [key for key, started in jobs.items() if now - started > cls.job_timeout]:
+            del jobs[key]
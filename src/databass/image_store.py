@@ -0,0 +1,271 @@
+"""
+Content-addressed storage for release, artist and label images
+"""
+import hashlib
+import threading
+import time
+from os import getpid, makedirs, path, remove, replace, scandir, stat, symlink, utime, walk
+from typing import Callable, Iterable, List, Optional
+import click
+from flask.cli import with_appcontext
+from .image_index import ImageIndex, ITEM_TYPES
+from .thumbnails import Thumbnails
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Bytes passed to the type detection of put_stream(); enough for the JPEG, PNG and WebP signatures
+HEADER_SIZE = 12
+CHUNK_SIZE = 64 * 1024
+# Blobs written or reused within this many seconds are never pruned, as an item may be about to point to them
+PRUNE_GRACE_PERIOD = 600
+
+
+class ImageStore:
+    """
+    Stores each distinct image once, as a blob named after the sha256 of its content:
+    <img_dir>/blobs/<first two hex digits>/<sha256><ext>. Items refer to blobs through
+    relative symlinks at the usual <img_dir>/<item_type>/<item_id><ext> paths, so identical
+    images (e.g. a release group's cover shared by several releases) take up space only once,
+    and ImageIndex and the /img route work as before.
+
+    Blobs and links are written under a temporary name and renamed into place, so concurrent
+    writers never leave a partial file, and a blob can be verified by hashing it again (see verify()).
+    Blobs can be written from a stream (see put_stream()), so large downloads are never held in memory.
+    """
+
+    @staticmethod
+    def blob_dir() -> str:
+        return path.join(ImageIndex.img_dir, "blobs")
+
+    @classmethod
+    def save(cls, item_type: str, item_id: int, data: bytes, ext: str) -> str:
+        """
+        Store an image and point the item at it.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+            data (bytes): The image
+            ext (str): File extension, including the dot
+
+        Returns:
+            str: Path of the item's image, <img_dir>/<item_type>/<item_id><ext>
+        """
+        blob = cls.put(data, ext)
+        return cls.link(item_type, item_id, blob)
+
+    @classmethod
+    def put(cls, data: bytes, ext: str) -> str:
+        """
+        Store a blob, unless a blob with the same content already exists.
+
+        Returns:
+            str: Path of the blob
+        """
+        return cls.put_stream([data], lambda header: ext)
+
+    @classmethod
+    def put_stream(
+            cls,
+            chunks: Iterable[bytes],
+            detect_type: Callable[[bytes], str],
+            max_bytes: Optional[int] = None
+    ) -> str:
+        """
+        Store a blob from chunks of data, e.g. a streamed download, without holding it in memory.
+        The chunks are written to a temporary file while they are hashed, which is then renamed to
+        the blob name, or deleted if a blob with the same content already exists.
+
+        Args:
+            chunks: The data
+            detect_type (callable): Returns the file extension for the first HEADER_SIZE bytes
+                                    (or all of the data, if shorter); raises ValueError for unsupported data
+            max_bytes (int): Abort once the data exceeds this size
+
+        Returns:
+            str: Path of the blob
+
+        Raises:
+            ValueError: If the data is larger than max_bytes or detect_type rejects it
+        """
+        makedirs(cls.blob_dir(), exist_ok=True)
+        temp_path = _temp_path(path.join(cls.blob_dir(), "incoming"))
+        digest = hashlib.sha256()
+        header = b""
+        ext = None
+        size = 0
+        try:
+            with open(temp_path, "wb") as blob_file:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise ValueError(f'Image is larger than {max_bytes} bytes')
+                    if ext is None:
+                        header += chunk
+                        if len(header) >= HEADER_SIZE:
+                            ext = detect_type(header[:HEADER_SIZE])
+                    digest.update(chunk)
+                    blob_file.write(chunk)
+            if ext is None:
+                ext = detect_type(header)
+            hex_digest = digest.hexdigest()
+            blob = path.join(cls.blob_dir(), hex_digest[:2], hex_digest + ext)
+            if path.exists(blob):
+                # Refresh the modification time so prune() leaves it alone until it is linked
+                utime(blob)
+                remove(temp_path)
+                return blob
+            makedirs(path.dirname(blob), exist_ok=True)
+            replace(temp_path, blob)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+        return blob
+
+    @classmethod
+    def link(cls, item_type: str, item_id: int, blob: str) -> str:
+        """
+        Point an item at a blob, replacing its previous image (of any extension) atomically.
+
+        Returns:
+            str: Path of the item's image
+        """
+        if item_type not in ITEM_TYPES:
+            raise ValueError(f'Unexpected item_type: {item_type}')
+        item_dir = path.join(ImageIndex.img_dir, item_type)
+        makedirs(item_dir, exist_ok=True)
+        ext = path.splitext(blob)[1]
+        img_path = path.join(item_dir, f"{item_id}{ext}")
+        temp_path = path.join(item_dir, "." + path.basename(_temp_path(img_path)))
+        symlink(path.relpath(blob, item_dir), temp_path)
+        try:
+            replace(temp_path, img_path)
+        except Exception:
+            _remove_quietly(temp_path)
+            raise
+        for other_ext in IMAGE_EXTENSIONS:
+            if other_ext != ext:
+                _remove_quietly(path.join(item_dir, f"{item_id}{other_ext}"))
+        ImageIndex.record(item_type, item_id, img_path)
+        return img_path
+
+    @classmethod
+    def digest(cls, img_path: str) -> Optional[str]:
+        """
+        The sha256 of an item's image, read from the name of its blob without hashing the file.
+
+        Returns:
+            str: Hex digest, or None if the image is not stored as a blob
+        """
+        real_path = path.realpath(img_path)
+        if path.dirname(path.dirname(real_path)) != path.realpath(cls.blob_dir()):
+            return None
+        return path.splitext(path.basename(real_path))[0]
+
+    @classmethod
+    def blobs(cls) -> List[str]:
+        """Paths of all stored blobs"""
+        found = []
+        for directory, _, files in walk(cls.blob_dir()):
+            found.extend(path.join(directory, name) for name in files if not name.endswith(".tmp"))
+        return found
+
+    @classmethod
+    def verify(cls) -> List[str]:
+        """
+        Hash every blob again and compare it with its name.
+
+        Returns:
+            list[str]: Paths of the blobs whose content does not match their name
+        """
+        corrupt = []
+        for blob in cls.blobs():
+            with open(blob, "rb") as blob_file:
+                digest = hashlib.file_digest(blob_file, "sha256").hexdigest()
+            if digest != path.splitext(path.basename(blob))[0]:
+                corrupt.append(blob)
+        return corrupt
+
+    @classmethod
+    def prune(cls) -> int:
+        """
+        Delete the blobs no item points to any more (e.g. after an image was replaced), and their thumbnails.
+        Files written within the last PRUNE_GRACE_PERIOD seconds are kept.
+
+        Returns:
+            int: Number of deleted blobs
+        """
+        referenced = set()
+        for item_type in ITEM_TYPES:
+            try:
+                with scandir(path.join(ImageIndex.img_dir, item_type)) as entries:
+                    for entry in entries:
+                        if entry.is_symlink():
+                            referenced.add(path.realpath(entry.path))
+            except FileNotFoundError:
+                pass
+        deleted = 0
+        now = time.time()
+        for blob in cls.blobs():
+            if path.realpath(blob) not in referenced and now - stat(blob).st_mtime > PRUNE_GRACE_PERIOD:
+                _remove_quietly(blob)
+                deleted += 1
+        # Thumbnails are named after the version of their original, the start of the blob's digest
+        versions = {path.basename(blob)[:32] for blob in referenced}
+        for directory, _, files in walk(Thumbnails.thumb_dir()):
+            for name in files:
+                thumbnail = path.join(directory, name)
+                if name[:32] not in versions and now - stat(thumbnail).st_mtime > PRUNE_GRACE_PERIOD:
+                    _remove_quietly(thumbnail)
+        return deleted
+
+    @classmethod
+    def migrate(cls) -> int:
+        """
+        Move images saved as regular files (before the blob store existed) into the blob store.
+
+        Returns:
+            int: Number of migrated images
+        """
+        migrated = 0
+        for item_type in ITEM_TYPES:
+            for item_id in sorted(ImageIndex.ids(item_type)):
+                img_path = ImageIndex.get(item_type, item_id)
+                ext = path.splitext(img_path or "")[1].lower()
+                if img_path is None or path.islink(img_path) or ext not in IMAGE_EXTENSIONS:
+                    continue
+                with open(img_path, "rb") as img_file:
+                    blob = cls.put_stream(iter(lambda: img_file.read(CHUNK_SIZE), b""), lambda header: ext)
+                cls.link(item_type, item_id, blob)
+                migrated += 1
+        return migrated
+
+
+def _temp_path(final_path: str) -> str:
+    return f"{final_path}.{getpid()}.{threading.get_ident()}.tmp"
+
+
+def _remove_quietly(file_path: str) -> None:
+    try:
+        remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+@click.command("migrate-images")
+@with_appcontext
+def migrate_images():
+    """Move existing images into the content-addressed blob store."""
+    click.echo(f"{ImageStore.migrate()} images migrated")
+
+
+@click.command("verify-images")
+@click.option("--prune", is_flag=True, help="Also delete blobs no item points to")
+@with_appcontext
+def verify_images(prune):
+    """Check that every stored image blob matches its hash."""
+    corrupt = ImageStore.verify()
+    for blob in corrupt:
+        click.echo(f"Corrupt: {blob}")
+    click.echo(f"{len(corrupt)} corrupt blobs")
+    if prune:
+        click.echo(f"{ImageStore.prune()} unused blobs deleted")
@@ -39,18 +39,20 @@ def labels():
 def label_search():
     from ..pagination import Pager
     data = request.get_json()
-    search_results = Label.dynamic_search(data)
+    search_query = Label.search_query(data)
     page = Pager.get_page_param(request)
-    paged_data, flask_pagination = Pager.paginate(
+    paged_data, flask_pagination, cursors = Pager.paginate_keyset(
         per_page=15,
         current_page=page,
-        data=search_results
+        query=search_query,
+        sort_key=Label.id,
+        cursor=request.args.get('cursor')
     )
     return render_template(
         'label_search.html',
         data=paged_data,
-        data_full=search_results,
-        pagination=flask_pagination
+        pagination=flask_pagination,
+        cursors=cursors
     )
 
 
@@ -96,15 +98,19 @@ def edit_label(label_id):
                 if "http" and "://" in image:
                     # If image is a URL, download it
                     new_image = Util.get_image(
-                        item_type='release',
+                        item_type='label',
                         item_id=label_id,
                         url=image
                     )
-                    label_data.image = image
+                    label_data.image = new_image
                 else:
                     print("Image not a URL. Skipping.")
         except KeyError:
             pass
+        except ValueError as err:
+            # Raised by Util.download_image for oversized or non-image downloads
+            flash(f"Could not use image from {image}: {err}")
+            return redirect('/error', code=302)
 
         try:
             country = edit_data["country"]
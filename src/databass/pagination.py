@@ -1,4 +1,7 @@
-from typing import Tuple
+import base64
+import binascii
+import json
+from typing import Tuple, Optional, Any
 from flask import request
 from flask_paginate import Pagination, get_page_parameter
 
@@ -51,3 +54,167 @@ class Pager:
             # record_name='latest_releases'
         )
         return paged_data, flask_pagination
+
+    @staticmethod
+    def paginate_page(
+            per_page: int,
+            current_page: int,
+            page_data: list,
+            total: int,
+    ):
+        """
+        Build pagination for a page that was already fetched from the database,
+        i.e. with LIMIT/OFFSET, instead of slicing a fully materialized list.
+
+        Args:
+            per_page (int): The number of results per page.
+            current_page (int): The current page number (1-indexed).
+            page_data (list): The results for the current page only.
+            total (int): The total number of results across all pages.
+
+        Returns:
+            Tuple[list, Pagination]: The page data and the flask_paginate Pagination object.
+
+        Raises:
+            ValueError: If `per_page` or `current_page` is less than or equal to 0.
+        """
+        Pager.get_page_range(per_page, current_page)
+        flask_pagination = Pagination(
+            page=current_page,
+            per_page=per_page,
+            total=total or 0,
+            search=False,
+        )
+        return page_data, flask_pagination
+
+    @staticmethod
+    def paginate_query(
+            per_page: int,
+            current_page: int,
+            query,
+            total: int = None,
+    ):
+        """
+        Offset-mode pagination on a SQLAlchemy query; only the current page is fetched.
+
+        Args:
+            per_page (int): The number of results per page.
+            current_page (int): The current page number (1-indexed).
+            query: The SQLAlchemy query to paginate. Should already be ordered.
+            total (int, optional): The total number of results, i.e. a cached count.
+                If not provided, a COUNT query is run.
+
+        Returns:
+            Tuple[list, Pagination]: The page data and the flask_paginate Pagination object.
+        """
+        start, _ = Pager.get_page_range(per_page, current_page)
+        paged_data = query.limit(per_page).offset(start).all()
+        if total is None:
+            total = query.order_by(None).count()
+        return Pager.paginate_page(per_page, current_page, paged_data, total)
+
+    @staticmethod
+    def encode_cursor(value: Any, direction: str) -> str:
+        """
+        Encode a sort key value and a direction ('next' or 'prev') into an opaque, URL-safe cursor string.
+        """
+        payload = json.dumps({"v": value, "d": direction}).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, str]]:
+        """
+        Decode a cursor created by encode_cursor().
+
+        Returns:
+            Optional[Tuple[Any, str]]: The sort key value and direction,
+            or None if the cursor is missing or malformed.
+        """
+        if not cursor or not isinstance(cursor, str):
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            value, direction = payload["v"], payload["d"]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            return None
+        if value is None or direction not in ("next", "prev"):
+            return None
+        return value, direction
+
+    @staticmethod
+    def paginate_keyset(
+            per_page: int,
+            current_page: int,
+            query,
+            sort_key,
+            cursor: str = None,
+            descending: bool = False,
+            with_total: bool = False,
+    ):
+        """
+        Keyset (cursor) pagination on a SQLAlchemy query.
+
+        Instead of OFFSET, the page is located with a WHERE clause on `sort_key`
+        relative to the cursor, so deep pages cost the same as the first page.
+        Falls back to offset mode when a total count is required, or when a page
+        past the first is requested without a usable cursor.
+
+        Args:
+            per_page (int): The number of results per page.
+            current_page (int): The current page number (1-indexed); used for display only in keyset mode.
+            query: The SQLAlchemy query to paginate. Any existing ordering is replaced.
+            sort_key: The model column to page on, e.g. Release.id. Must be unique
+                      and its values JSON serializable.
+            cursor (str, optional): A cursor returned by a previous call.
+            descending (bool, optional): Whether to sort by `sort_key` in descending order.
+            with_total (bool, optional): Whether the real total count is required.
+
+        Returns:
+            Tuple[list, Pagination, dict]: The page data, the flask_paginate Pagination object,
+            and a dictionary with the "next" and "prev" cursors (None if there is no such page).
+
+        Raises:
+            ValueError: If `per_page` or `current_page` is less than or equal to 0.
+        """
+        Pager.get_page_range(per_page, current_page)
+        position = Pager.decode_cursor(cursor)
+
+        if with_total or (position is None and current_page > 1):
+            ordered = query.order_by(None).order_by(
+                sort_key.desc() if descending else sort_key.asc()
+            )
+            paged_data, flask_pagination = Pager.paginate_query(per_page, current_page, ordered)
+            has_next, has_prev = flask_pagination.has_next, flask_pagination.has_prev
+        else:
+            value, direction = position if position else (None, "next")
+            backwards = direction == "prev"
+            # Walking backwards flips the sort order; the page is reversed afterwards
+            ascending = descending == backwards
+            page_query = query.order_by(None).order_by(
+                sort_key.asc() if ascending else sort_key.desc()
+            )
+            if value is not None:
+                page_query = page_query.filter(
+                    sort_key > value if ascending else sort_key < value
+                )
+            # Fetch one extra row to find out whether another page exists
+            rows = page_query.limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            paged_data = rows[:per_page]
+            if backwards:
+                paged_data.reverse()
+                has_next, has_prev = True, has_more
+            else:
+                has_next, has_prev = has_more, current_page > 1
+
+            # The real total is unknown; use the smallest total consistent with has_next
+            total = (current_page - 1) * per_page + len(paged_data) + (1 if has_next else 0)
+            _, flask_pagination = Pager.paginate_page(per_page, current_page, paged_data, total)
+
+        cursors = {"next": None, "prev": None}
+        if paged_data:
+            if has_next:
+                cursors["next"] = Pager.encode_cursor(getattr(paged_data[-1], sort_key.key), "next")
+            if has_prev:
+                cursors["prev"] = Pager.encode_cursor(getattr(paged_data[0], sort_key.key), "prev")
+        return paged_data, flask_pagination, cursors
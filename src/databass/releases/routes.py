@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, flash
 from .. import db
 from ..db import models
 from ..api import Util
+from ..image_queue import ImageQueue
 
 release_bp = Blueprint(
     'release_bp', __name__,
@@ -37,7 +38,8 @@ def release(release_id):
         "artist": artist_data,
         "label": label_data,
         "label_releases": label_releases,
-        "artist_releases": artist_releases
+        "artist_releases": artist_releases,
+        "image_pending": ImageQueue.pending("release", release_data.id)
     }
     return render_template('release.html', data=data)
 
@@ -87,6 +89,10 @@ def edit(release_id):
                     print("Image not a URL. Skipping.")
         except KeyError:
             pass
+        except ValueError as err:
+            # Raised by Util.download_image for oversized or non-image downloads
+            flash(f"Could not use image from {image}: {err}")
+            return redirect('/error', code=302)
 
         # release year
         try:
@@ -221,18 +227,20 @@ def release_search():
     from ..pagination import Pager
     data = request.get_json()
     print(data)
-    search_results = models.Release.dynamic_search(data)
+    search_query = models.Release.search_query(data)
 
     page = Pager.get_page_param(request)
-    paged_data, flask_pagination = Pager.paginate(
+    paged_data, flask_pagination, cursors = Pager.paginate_keyset(
         per_page=15,
         current_page=page,
-        data=search_results
+        query=search_query,
+        sort_key=models.Release.id,
+        cursor=request.args.get('cursor')
     )
 
     return render_template(
         'release_search.html',
         data=paged_data,
-        data_full=search_results,
-        pagination=flask_pagination
+        pagination=flask_pagination,
+        cursors=cursors
     )
@@ -0,0 +1,105 @@
+"""
+Server-side storage for search result lists, so that paging through them only needs a result set id
+"""
+import json
+import secrets
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, insert
+from .db.base import app_db
+from .db.models import SearchResultSet
+
+load_dotenv()
+# Seconds a result set is kept after it was last used
+RESULT_SET_TTL: float = float(getenv('RESULT_SET_TTL', '900'))
+# Maximum number of result sets kept; the least recently used set is dropped first
+RESULT_SET_MAX: int = int(getenv('RESULT_SET_MAX', '64'))
+
+
+class ResultSets:
+    """
+    Size-bounded LRU store of search results with a TTL, keyed by a random result set id.
+
+    The result sets are stored in the result_set table, so a page can be served by any worker process.
+    Like ResponseCache, it uses its own connection rather than the ORM session, so storing a result set
+    never commits (or rolls back) changes pending in the request's session.
+
+    Attributes:
+        ttl (float): Seconds a result set is kept after it was last used
+        max_sets (int): Maximum number of result sets kept
+    """
+    ttl: float = RESULT_SET_TTL
+    max_sets: int = RESULT_SET_MAX
+
+    @classmethod
+    def store(cls, results: list) -> Optional[str]:
+        """
+        Store a list of search results, and drop expired and least recently used result sets.
+
+        Args:
+            results (list): The full list of results, e.g. from MusicBrainz.release_search()
+
+        Returns:
+            str: The id used to retrieve the results with get(), or None if the results could not be stored
+        """
+        result_set_id = secrets.token_urlsafe(12)
+        now = datetime.now()
+        newest = (
+            select(SearchResultSet.id)
+            .order_by(SearchResultSet.last_used.desc(), SearchResultSet.id.desc())
+            .limit(cls.max_sets)
+        )
+        try:
+            with app_db.engine.begin() as connection:
+                connection.execute(insert(SearchResultSet).values(
+                    key=result_set_id,
+                    results=json.dumps(results, default=str),
+                    last_used=now
+                ))
+                connection.execute(delete(SearchResultSet).where(
+                    (SearchResultSet.last_used <= now - timedelta(seconds=cls.ttl))
+                    | SearchResultSet.id.notin_(newest.scalar_subquery())
+                ))
+        except Exception as err:
+            print(f'Storing search results failed: {err}')
+            return None
+        return result_set_id
+
+    @classmethod
+    def get(cls, result_set_id: str) -> Optional[list]:
+        """
+        Retrieve a stored list of search results and mark it as recently used.
+
+        Args:
+            result_set_id (str): The id returned by store()
+
+        Returns:
+            list: The stored results, or None if the id is unknown or has expired
+        """
+        if not isinstance(result_set_id, str) or not result_set_id:
+            return None
+        now = datetime.now()
+        current = (
+            (SearchResultSet.key == result_set_id)
+            & (SearchResultSet.last_used > now - timedelta(seconds=cls.ttl))
+        )
+        try:
+            with app_db.engine.begin() as connection:
+                results = connection.execute(
+                    select(SearchResultSet.results).where(current)
+                ).scalar_one_or_none()
+                if results is None:
+                    return None
+                connection.execute(update(SearchResultSet).where(current).values(last_used=now))
+        except Exception as err:
+            print(f'Reading search results failed: {err}')
+            return None
+        return json.loads(results)
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop all stored result sets"""
+        with app_db.engine.begin() as connection:
+            connection.execute(delete(SearchResultSet))
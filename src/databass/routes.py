@@ -6,24 +6,36 @@ Implements the main routes for the databass application, including
 - goals page
 """
 from datetime import datetime
-from os.path import join, abspath
-from glob import glob
+from os import getenv
 import flask
 from flask import render_template, request, redirect, abort, flash, make_response, send_file
 from sqlalchemy.exc import IntegrityError
 import pycountry
+from dotenv import load_dotenv
 from .api import Util, MusicBrainz
+from .api.cache import ResponseCache
+from .api.rate_limit import INTERACTIVE
 from . import db
 from .db import models
-from .db.util import get_all_stats, handle_submit_data
+from .db.util import get_stats, handle_submit_data
+from .db.cache import StatsCache
 from .pagination import Pager
+from .result_sets import ResultSets
+from .image_queue import ImageQueue
+from .image_backfill import ImageBackfill
+from .image_index import ImageIndex
+from .thumbnails import Thumbnails
+
+load_dotenv()
+# Seconds browsers may cache images requested through a versioned URL
+IMAGE_MAX_AGE: int = int(getenv('IMAGE_MAX_AGE', '31536000'))
 
 
 def register_routes(app):
     @app.route('/', methods=['GET'])
     @app.route('/home', methods=['GET'])
     def home() -> str:
-        stats_data = get_all_stats()
+        stats_data = get_stats('totals', 'yearly')
         active_goals = models.Goal.get_incomplete()
         if active_goals is not None:
             goal_data = [process_goal_data(goal) for goal in active_goals]
@@ -40,13 +52,14 @@ def register_routes(app):
 
     @app.route("/home_release_table")
     def home_release_table():
-        data = models.Release.home_data()
-
+        per_page = 5
         page = Pager.get_page_param(request)
-        paged_data, flask_pagination = Pager.paginate(
-            per_page=5,
+        data = models.Release.home_data(page=page, per_page=per_page)
+        paged_data, flask_pagination = Pager.paginate_page(
+            per_page=per_page,
             current_page=page,
-            data=data
+            page_data=data,
+            total=StatsCache.get('release_count', models.Release.total_count)
         )
 
         return render_template(
@@ -61,7 +74,7 @@ def register_routes(app):
 
     @app.route("/search", methods=["POST", "GET"])
     def search() -> str | flask.Response:
-        page = paged_data = release_data = per_page = None
+        page = paged_data = result_set = per_page = None
 
         if request.method == "GET":
             return render_template(
@@ -69,7 +82,7 @@ def register_routes(app):
                 page=page,
                 data=paged_data,
                 pagination=None,
-                data_full=release_data,
+                result_set=result_set,
                 per_page=per_page
             )
 
@@ -86,7 +99,9 @@ def register_routes(app):
         if not search_release and not search_artist and not search_label:
             error = "ERROR: Search requires at least one search term"
             return error
-        release_data = MusicBrainz.release_search(release=search_release,
+        # Searches are served before background lookups waiting for MusicBrainz
+        with MusicBrainz.scheduler.priority(INTERACTIVE):
+            release_data = MusicBrainz.release_search(release=search_release,
                                                       artist=search_artist,
                                                       label=search_label)
         page = Pager.get_page_param(request)
@@ -98,18 +113,23 @@ def register_routes(app):
                 current_page=page,
                 data=release_data
             )
+            # The full result list stays on the server; page changes only send its id
+            result_set = ResultSets.store(release_data)
             return render_template(
                 "search.html",
                 page=page,
                 data=paged_data,
                 pagination=flask_pagination,
-                data_full=release_data,
+                result_set=result_set,
                 per_page=per_page
             )
-        
-    @app.route("/search_results", methods=["POST"])
+
+    @app.route("/search_results", methods=["GET"])
     def search_results():
-        data = request.get_json()
+        result_set = request.args.get('id')
+        data = ResultSets.get(result_set)
+        if data is None:
+            return "Search results have expired, please search again", 404
         per_page = 10
         page = Pager.get_page_param(request)
         paged_data, flask_pagination = Pager.paginate(
@@ -122,7 +142,7 @@ def register_routes(app):
             page=page,
             data=paged_data,
             pagination=flask_pagination,
-            data_full=data,
+            result_set=result_set,
             per_page=per_page
         )
 
@@ -210,28 +230,38 @@ def register_routes(app):
 
     @app.route('/stats', methods=['GET'])
     def stats():
-        statistics = get_all_stats()
+        statistics = get_stats('totals', 'yearly')
         return render_template('stats.html', data=statistics, active_page='stats')
 
     @app.route('/stats/get/<string:stats_type>', methods=['GET'])
     def stats_get(stats_type):
-        statistics = get_all_stats()
         data = ""
-        if stats_type == "labels":
-            data = {
-                "most_frequent": statistics["top_frequent_labels"],
-                "highest_average": statistics["top_average_labels"],
-                "favourite": statistics["top_rated_labels"]
-            }
-        if stats_type == "artists":
+        if stats_type in ("artists", "labels"):
+            # Only the leaderboards of the requested type are computed
+            statistics = get_stats(stats_type)
             data = {
-                "most_frequent": statistics["top_frequent_artists"],
-                "highest_average": statistics["top_average_artists"],
-                "favourite": statistics["top_rated_artists"]
+                "most_frequent": statistics[f"top_frequent_{stats_type}"],
+                "highest_average": statistics[f"top_average_{stats_type}"],
+                "favourite": statistics[f"top_rated_{stats_type}"]
             }
         return render_template('stats_data.html', type=stats_type, stats=data)
 
 
+    @app.route('/stats/cache', methods=['GET'])
+    def stats_cache():
+        # Hit/miss counters of the statistics cache, for monitoring
+        return StatsCache.info()
+
+    @app.route('/musicbrainz/cache', methods=['GET'])
+    def musicbrainz_cache():
+        # Hit/miss counters of the MusicBrainz response cache, for monitoring
+        return ResponseCache.info('musicbrainz')
+
+    @app.route('/musicbrainz/queue', methods=['GET'])
+    def musicbrainz_queue():
+        # Queue depth and wait times of the MusicBrainz request scheduler, for monitoring
+        return MusicBrainz.scheduler.info()
+
     @app.route('/goals', methods=['GET'])
     def goals():
         if request.method != 'GET':
@@ -267,32 +297,58 @@ def register_routes(app):
 
     @app.route('/img/<string:itemtype>/<int:itemid>', methods=['GET'])
     def serve_image(itemtype: str, itemid: int):
-        item = ''
-        if itemtype == 'artist':
-            item = models.Artist.exists_by_id(itemid)
-        if itemtype == 'label':
-            item = models.Label.exists_by_id(itemid)
-        if itemtype == 'release':
-            item = models.Release.exists_by_id(itemid)
-
-        try:
-            img_dir = abspath(join("databass", "static", "img", itemtype))
-            img_pattern = join(img_dir, f"{item.id}.*")
-            match = glob(img_pattern)
-            if match:
-                img_path = match[0]
-            else:
-                img_path = "./static/img/none.png"
-        except KeyError:
-            img_path = "./static/img/none.png"
-        try:
-            resp = make_response(send_file(img_path))
-        except TypeError:
-            img_path = "./static/img/none.png"
-            resp = make_response(send_file(img_path))
-        resp.headers['Cache-Control'] = 'max-age'
+        # Served from the in-memory image index; no database query or directory listing per request
+        img_path = ImageIndex.get(itemtype, itemid)
+        version = ImageIndex.version(itemtype, itemid) if img_path is not None else None
+        if version is None:
+            resp = make_response(send_file("./static/img/none.png"))
+            # Placeholder; must not be cached, as the image may still be fetched in the background
+            resp.headers['Cache-Control'] = 'no-cache'
+            if ImageQueue.pending(itemtype, itemid):
+                resp.headers['X-Image-Pending'] = 'true'
+            return resp
+        etag = version
+        requested_size = request.args.get('size', type=int)
+        size = Thumbnails.fit(requested_size) if requested_size else None
+        if size is not None:
+            thumbnail = Thumbnails.get(itemtype, itemid, size)
+            # Falls back to the original if the thumbnail cannot be generated
+            if thumbnail is not None:
+                img_path = thumbnail
+                etag = f'{version}-{size}'
+        # The content hash is a strong ETag; send_file answers If-None-Match/If-Modified-Since with 304
+        resp = make_response(send_file(img_path, etag=etag, conditional=True))
+        if request.args.get('v') == version:
+            # Versioned URL (see image_url); the content behind it never changes
+            resp.headers['Cache-Control'] = f'public, max-age={IMAGE_MAX_AGE}, immutable'
+        else:
+            # Unversioned or outdated URL; revalidate on every use, which costs a 304 while unchanged
+            resp.headers['Cache-Control'] = 'no-cache'
         return resp
 
+    @app.template_global('image_url')
+    def image_url(item_type: str, item_id: int, size: int | None = None) -> str:
+        """
+        URL of an item's image, versioned with the hash of its content if the image exists,
+        so that browsers can cache it indefinitely and still see a replaced image immediately.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+            size (int): Display size in pixels; the smallest thumbnail at least this large is served
+
+        Returns:
+            str: /img/<item_type>/<item_id>, with ?v=<version> if the item has an image and &size=<size>
+        """
+        params = []
+        version = ImageIndex.version(item_type, item_id)
+        if version:
+            params.append(f'v={version}')
+        if size:
+            params.append(f'size={size}')
+        url = f'/img/{item_type}/{item_id}'
+        return f'{url}?{"&".join(params)}' if params else url
+
     # TODO: see if still needed
     @app.route('/stats_search', methods=['GET'])
     def stats_search():
@@ -306,80 +362,14 @@ def register_routes(app):
                      item_type=item_type,
                      item_property=item_property)
 
-    # TODO: see if still needed
-    @app.route('/imgupdate/<item_type>/<item_id>')
-    def imgupdate(item_type, item_id):
-        print(f'Checking: {item_type} {item_id}')
-        item_id = int(item_id)
-        if item_type == 'release':
-            item = models.Release.exists_by_id(item_id)
-        elif item_type == 'artist':
-            item = models.Artist.exists_by_id(item_id)
-        elif item_type == 'label':
-            item = models.Label.exists_by_id(item_id)
-        else:
-            raise ValueError(f"Unexpected item_type: {item_type}")
-        try:
-            img_path = '.' + Util.img_exists(item_id=item_id, item_type=item_type)
-            print(f'Local image already exists: {img_path}')
-        except TypeError:
-            print('Local image not found, attempting to grab from external sources.')
-            # No local image exists, grab it
-            if item_type == 'release':
-                release_name = item.name
-                release_artist = models.Artist.exists_by_id(item.artist_id)
-                artist_name = release_artist.name
-                img_path = Util.get_image(
-                    item_type=item_type,
-                    item_id=item_id,
-                    mbid=item.mbid,
-                    release_name=release_name,
-                    artist_name=artist_name
-                )
-            elif item_type == 'artist':
-                artist_name = item.name
-                img_path = Util.get_image(
-                    item_type=item_type,
-                    item_id=item_id,
-                    mbid=item.mbid,
-                    artist_name=artist_name
-                )
-            elif item_type == 'label':
-                label_name = item.name
-                img_path = Util.get_image(
-                    item_type=item_type,
-                    item_id=item_id,
-                    mbid=item.mbid,
-                    label_name=label_name
-                )
-        if item.image != img_path:
-            item.image = img_path
-            print(f'Updating database entry: {item_type}.image => {img_path}')
-            db.update(item)
-        # Define the mappings for the order of items.
-        # All releases are fixed 1 by 1, then artists, then labels
-        next_type = {
-            'release': 'artist',
-            'artist': 'label',
-            'label': None
-        }
-        next_item = db.util.next_item(item_type=item_type, prev_id=item_id)
-        if next_item:
-            return redirect(f'/imgupdate/{item_type}/{next_item.id}')
-
-        # No next item; move onto next item type
-        next_item = next_type.get(item_type)
-        if next_item:
-            return redirect(f'/imgupdate/{next_item}/0')
-        # Complete, redirect to home
-        return redirect('/', code=302)
-
-    # TODO: see if still needed
-    @app.route('/fix_images')
+    @app.route('/fix_images', methods=['GET', 'POST'])
     def fix_images():
-        print('Fixing images.')
-        # Starts the imgupdate process; recursively calls itself and update all images 1 by 1
-        return redirect('/imgupdate/release/1')
+        # POST starts downloading all missing images in the background (same as `flask backfill-images`);
+        # both methods return the progress of the current or last run
+        started = False
+        if request.method == 'POST':
+            started = ImageBackfill.start(resume=request.args.get('resume') == 'true')
+        return {"started": started, "running": ImageBackfill.running(), **ImageBackfill.progress_info()}
 
     @app.route('/new_release', methods=["POST"])
     def new_release_popup():
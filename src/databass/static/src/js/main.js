@@ -134,14 +134,8 @@ function handleSearchButton() {
 
 function loadSearchResults(direction) {
     let targetPage = getTargetPage(direction);
-    let data = document.getElementById("data_full").innerHTML;
-    let formattedData = formatDataString(data);
-    let parsedData = JSON.parse(formattedData);
-    fetch('/search_results?page=' + targetPage, {
-        method: 'POST',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify(parsedData)
-    })
+    let resultSet = document.getElementById("result_set").value;
+    fetch('/search_results?id=' + encodeURIComponent(resultSet) + '&page=' + targetPage)
         .then(response => response.text())
         .then(html => {
             addPopupListeners(html);
@@ -162,6 +156,18 @@ function getTargetPage(direction) {
     return targetPage
 }
 
+function getCursor(direction) {
+    // Keyset pagination cursors rendered by the search templates; empty when not applicable
+    let cursor = '';
+    try {
+        if (direction === 'prev') cursor = document.getElementById('prev_cursor').value;
+        if (direction === 'next') cursor = document.getElementById('next_cursor').value;
+    } catch (e) {
+        cursor = '';
+    }
+    return cursor
+}
+
 function loadHomeTable(direction) {
     let targetPage = getTargetPage(direction);
     fetch('/home_release_table?page=' + targetPage)
@@ -211,7 +217,10 @@ function loadSearchTable(type, direction) {
         }
     }
     let targetPage = getTargetPage(direction);
-    fetch('/' + type + '_search?page=' + targetPage, {
+    let url = '/' + type + '_search?page=' + targetPage;
+    let cursor = getCursor(direction);
+    if (cursor) url += '&cursor=' + encodeURIComponent(cursor);
+    fetch(url, {
         method: 'POST',
         headers: {'Content-Type': 'application/json'},
         body: JSON.stringify(formData)
@@ -222,7 +231,29 @@ function loadSearchTable(type, direction) {
         })
 }
 
+function refreshPendingImages() {
+    // Images still being fetched in the background show a placeholder;
+    // poll until the server no longer reports them as pending, then reload them
+    document.querySelectorAll('img[data-pending]').forEach(img => {
+        let attempts = 0;
+        const src = img.getAttribute('src');
+        const poll = setInterval(() => {
+            attempts++;
+            fetch(src, { method: 'HEAD', cache: 'no-store' })
+                .then(response => {
+                    if (!response.headers.has('X-Image-Pending') || attempts >= 60) {
+                        clearInterval(poll);
+                        img.removeAttribute('data-pending');
+                        img.src = src + (src.includes('?') ? '&' : '?') + 't=' + Date.now();
+                    }
+                })
+        }, 2000);
+    });
+}
+
 document.addEventListener('DOMContentLoaded', () => {
+    refreshPendingImages();
+
     if (window.location.pathname === "/" || window.location.pathname === "/home") {
         loadHomeTable();
         document.addEventListener('click', function(event) {
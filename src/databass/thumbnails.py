@@ -0,0 +1,129 @@
+"""
+Downscaled variants of the stored release, artist and label images
+"""
+import threading
+from os import getenv, getpid, makedirs, path, remove, replace
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+from .image_index import ImageIndex
+
+load_dotenv()
+# Longest side, in pixels, of the thumbnails generated for every image
+THUMBNAIL_SIZES: Tuple[int, ...] = tuple(sorted(
+    int(size) for size in getenv("THUMBNAIL_SIZES", "64,250,500").split(",")
+))
+# Format of the thumbnails: webp or jpeg
+THUMBNAIL_FORMAT = getenv("THUMBNAIL_FORMAT", "webp").lower()
+THUMBNAIL_QUALITY: int = int(getenv("THUMBNAIL_QUALITY", "80"))
+EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+# Number of locks shared by all thumbnail paths; a path always maps to the same lock
+LOCK_STRIPES = 64
+
+
+class Thumbnails:
+    """
+    Generates and locates the thumbnails of an item's image.
+
+    Thumbnails are named after the version (content hash) of their original, in one subdirectory
+    per size: <img_dir>/thumbs/<size>/<version>.webp. Items sharing an image share its thumbnails,
+    and a replaced image gets new ones. They are generated in the background when an image is
+    downloaded (see ImageQueue.generate_thumbnails()) and otherwise on first request. Files are written
+    under a temporary name and renamed into place, so concurrent workers never serve a partially written thumbnail.
+
+    Attributes:
+        sizes (tuple[int]): Available sizes, ascending
+        image_format (str): 'webp' or 'jpeg'
+        quality (int): Encoder quality, 1-100
+    """
+    sizes: Tuple[int, ...] = THUMBNAIL_SIZES
+    image_format: str = THUMBNAIL_FORMAT
+    quality: int = THUMBNAIL_QUALITY
+    _locks: Tuple[threading.Lock, ...] = tuple(threading.Lock() for _ in range(LOCK_STRIPES))
+
+    @classmethod
+    def fit(cls, size: int) -> Optional[int]:
+        """
+        The smallest available size at least as large as the requested size.
+
+        Returns:
+            int: The thumbnail size, or None if the original should be used
+        """
+        for available in cls.sizes:
+            if available >= size:
+                return available
+        return None
+
+    @staticmethod
+    def thumb_dir() -> str:
+        return path.join(ImageIndex.img_dir, "thumbs")
+
+    @classmethod
+    def path(cls, version: str, size: int) -> str:
+        """Path of the thumbnail of the given size of the image with the given version"""
+        return path.abspath(path.join(cls.thumb_dir(), str(size), f"{version}{EXTENSIONS[cls.image_format]}"))
+
+    @classmethod
+    def get(cls, item_type: str, item_id: int, size: int) -> Optional[str]:
+        """
+        Path of the thumbnail of an item's image, generating it if needed.
+
+        Args:
+            item_type (str): 'release', 'artist' or 'label'
+            item_id (int): ID of the item
+            size (int): One of `sizes`
+
+        Returns:
+            str: Path of the thumbnail, or None if the item has no image or it could not be read
+        """
+        version = ImageIndex.version(item_type, item_id)
+        if version is None:
+            return None
+        thumbnail = cls.path(version, size)
+        if path.exists(thumbnail):
+            return thumbnail
+        with cls._lock_for(thumbnail):
+            # Another thread may have generated it while this one waited
+            if not path.exists(thumbnail):
+                original = ImageIndex.get(item_type, item_id)
+                try:
+                    cls._generate(original, thumbnail, size)
+                except FileNotFoundError:
+                    ImageIndex.discard(item_type, item_id)
+                    return None
+                except Exception as err:
+                    print(f'Could not generate {size}px thumbnail of {original}: {err}')
+                    return None
+        return thumbnail
+
+    @classmethod
+    def generate_all(cls, item_type: str, item_id: int) -> None:
+        """
+        Generate every thumbnail size of an item's image, e.g. right after it was downloaded.
+        """
+        for size in cls.sizes:
+            cls.get(item_type, item_id, size)
+
+    @classmethod
+    def _lock_for(cls, thumbnail: str) -> threading.Lock:
+        # Paths share a fixed set of locks, so the locks do not grow with the number of thumbnails
+        return cls._locks[hash(thumbnail) % len(cls._locks)]
+
+    @classmethod
+    def _generate(cls, original: str, thumbnail: str, size: int) -> None:
+        with Image.open(original) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if cls.image_format == "jpeg" and img.mode != "RGB":
+                img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+            makedirs(path.dirname(thumbnail), exist_ok=True)
+            temp_path = f"{thumbnail}.{getpid()}.{threading.get_ident()}.tmp"
+            try:
+                img.save(temp_path, format=cls.image_format, quality=cls.quality)
+                replace(temp_path, thumbnail)
+            except Exception:
+                if path.exists(temp_path):
+                    remove(temp_path)
+                raise
@@ -1,11 +1,14 @@
 from pathlib import Path
 import datetime
+import os
 import pytest
 from databass.api.util import Util
+from databass.image_index import ImageIndex
 
 VALID_JPEG_BYTES = bytes([0xFF, 0xD8, 0xFF, 0xE0, 0x00, 0x10, 0x4A, 0x46])
 VALID_PNG_BYTES = bytes([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
 INVALID_BYTES = bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
+VALID_WEBP_BYTES = b'RIFF\x24\x00\x00\x00WEBPVP8 '
 
 
 class TestToDate:
@@ -66,58 +69,6 @@ class TestToDate:
         assert result == expected
 
 
-
-
-class TestGetImageTypeFromUrl:
-    """Tests for Util.get_image_type_from_url method."""
-    def test_standard_image_urls(self):
-        """Test detection of image types from standard URLs with extensions at the end."""
-        test_cases = {
-            'https://example.com/image.jpg': '.jpg',
-            'https://example.com/photo.png': '.png',
-            'https://example.com/avatar.webp': '.webp',
-        }
-        for url, expected in test_cases.items():
-            assert Util.get_image_type_from_url(url) == expected
-
-    def test_uppercase_extensions(self):
-        """Test that uppercase extensions are correctly identified."""
-        test_cases = {
-            'https://example.com/image.JPG': '.jpg',
-            'https://example.com/photo.PNG': '.png',
-            'https://example.com/avatar.WEBP': '.webp'
-        }
-        for url, expected in test_cases.items():
-            assert Util.get_image_type_from_url(url) == expected
-
-    def test_extension_in_path(self):
-        """Test URLs where the extension appears in the middle of the path."""
-        test_cases = {
-            'https://example.com/photos/image.jpg/download': '.jpg',
-            'https://example.com/image.png/thumbnail': '.png',
-            'https://example.com/avatar.webp/small': '.webp'
-        }
-        for url, expected in test_cases.items():
-            assert Util.get_image_type_from_url(url) == expected
-
-    def test_invalid_url(self):
-        """Test that invalid URLs raise ValueError."""
-        invalid_urls = [
-            'https://example.com/image',
-            'https://example.com/photo.invalid',
-            'https://example.com/picture.doc'
-        ]
-        for url in invalid_urls:
-            with pytest.raises(ValueError):
-                Util.get_image_type_from_url(url)
-
-    def test_all_supported_formats(self):
-        """Test all supported image formats."""
-        formats = ['.jpg', '.jpeg', '.png', '.webp']
-        for fmt in formats:
-            url = f'https://example.com/image{fmt}'
-            assert Util.get_image_type_from_url(url) == fmt
-
 class TestGetImageTypeFromBytes:
     # Test Util.get_image_type_from_bytes()
     def test_get_image_type_from_bytes_jpeg(self):
@@ -128,6 +79,10 @@ class TestGetImageTypeFromBytes:
         """Test to verify PNG bytes are correctly identified"""
         assert Util.get_image_type_from_bytes(VALID_PNG_BYTES) == '.png'
 
+    def test_get_image_type_from_bytes_webp(self):
+        """Test to verify WebP bytes are correctly identified"""
+        assert Util.get_image_type_from_bytes(VALID_WEBP_BYTES) == '.webp'
+
     def test_get_image_type_from_bytes_invalid(self):
         """Test to verify ValueError is raised for invalid image bytes"""
         with pytest.raises(ValueError) as exc_info:
@@ -147,8 +102,158 @@ class TestGetImageTypeFromBytes:
             Util.get_image_type_from_bytes(partial_jpeg)
         assert "must be at least 8 bytes" in str(exc_info.value)
 
-# class TestGetImage:
-    # Tests for Util.get_image()
+
+class TestGetImage:
+    """Tests for Util.get_image()"""
+
+    def test_caa_bounded_by_caa_timeout(self, mocker):
+        """
+        Test that CoverArtArchive gets CAA_TIMEOUT seconds before the Discogs fallback is tried
+        """
+        from databass.api.http_client import HttpClient
+        from databass.api.util import CAA_TIMEOUT
+        remaining = []
+        mocker.patch('databass.api.musicbrainz.MusicBrainz.get_image',
+                     side_effect=lambda mbid: remaining.append(HttpClient.remaining()))
+        mock_discogs = mocker.patch('databass.api.discogs.Discogs.get_release_image_url', return_value=None)
+        mocker.patch('databass.api.util.Path.mkdir')
+
+        Util.get_image(item_type='release', item_id=1, mbid='mbid', release_name='Release', artist_name='Artist')
+        assert 0 < remaining[0] <= CAA_TIMEOUT
+        mock_discogs.assert_called_once_with(name='Release', artist='Artist')
+
+    def test_deadline_applies_to_all_requests(self, mocker):
+        """
+        Test that the Discogs lookups and the download share the IMAGE_FETCH_TIMEOUT deadline
+        """
+        from databass.api.http_client import HttpClient
+        from databass.api.util import IMAGE_FETCH_TIMEOUT
+        remaining = []
+        mocker.patch('databass.api.discogs.Discogs.get_artist_image_url',
+                     side_effect=lambda name: remaining.append(HttpClient.remaining()))
+        mocker.patch('databass.api.util.Path.mkdir')
+
+        Util.get_image(item_type='artist', item_id=1, artist_name='Artist')
+        assert 0 < remaining[0] <= IMAGE_FETCH_TIMEOUT
+        assert HttpClient.remaining() is None
+
+    def test_runs_outside_main_thread(self, mocker):
+        """
+        Test that images can be fetched from worker threads, where signal-based timeouts are not allowed
+        """
+        import threading
+        mocker.patch('databass.api.musicbrainz.MusicBrainz.get_image', return_value=None)
+        mocker.patch('databass.api.discogs.Discogs.get_release_image_url', return_value=None)
+        mocker.patch('databass.api.util.Path.mkdir')
+        errors = []
+
+        def fetch():
+            try:
+                Util.get_image(item_type='release', item_id=1, mbid='mbid')
+            except Exception as err:
+                errors.append(err)
+
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        thread.join()
+        assert errors == []
+
+    def test_thumbnails_generated_in_background(self, mocker):
+        """
+        Test that the thumbnails of a downloaded image are queued rather than generated before returning
+        """
+        mocker.patch('databass.api.util.Util.download_image', return_value='databass/static/img/release/1.jpg')
+        mock_generate_thumbnails = mocker.patch('databass.image_queue.ImageQueue.generate_thumbnails')
+        mock_generate_all = mocker.patch('databass.thumbnails.Thumbnails.generate_all')
+
+        assert Util.get_image(item_type='release', item_id=1, url='https://example.com/a.jpg') == 'static/img/release/1.jpg'
+        mock_generate_thumbnails.assert_called_once_with('release', 1)
+        mock_generate_all.assert_not_called()
+
+    @pytest.mark.parametrize("item_type", ["artist", "label"])
+    def test_url_saved_for_item_type(self, item_type, mocker):
+        """
+        Test that an image URL given for an artist or label is saved for that item, not the release with the same ID
+        """
+        mock_download = mocker.patch(
+            'databass.api.util.Util.download_image', return_value=f'databass/static/img/{item_type}/3.jpg'
+        )
+        mock_generate_thumbnails = mocker.patch('databass.image_queue.ImageQueue.generate_thumbnails')
+
+        assert Util.get_image(item_type=item_type, item_id=3, url='https://example.com/a.jpg') == f'static/img/{item_type}/3.jpg'
+        mock_download.assert_called_once_with('https://example.com/a.jpg', item_type, 3)
+        mock_generate_thumbnails.assert_called_once_with(item_type, 3)
+
+
+class TestDownloadImage:
+    """Tests for Util.download_image()"""
+
+    @pytest.fixture
+    def mock_response(self, mocker):
+        """Streamed response to HttpClient.get(); set `chunks` and `headers` to change the body"""
+        response = mocker.MagicMock(status_code=200, headers={}, url="https://example.com/image")
+        response.__bool__.return_value = True
+        response.chunks = [VALID_JPEG_BYTES + b"\x00" * 100, b"\x01" * 100]
+        response.iter_content.side_effect = lambda chunk_size: iter(response.chunks)
+        mocker.patch('databass.api.util.HttpClient.get', return_value=response)
+        return response
+
+    def test_streams_to_image_store(self, mock_response, image_index):
+        """Test that the image is streamed into the store and linked to the item"""
+        from databass.api.util import HttpClient
+        img_path = Util.download_image("https://example.com/image", "artist", 3)
+        assert img_path.endswith("/artist/3.jpg")
+        with open(img_path, "rb") as img_file:
+            assert img_file.read() == b"".join(mock_response.chunks)
+        HttpClient.get.assert_called_once_with("https://example.com/image", stream=True)
+        mock_response.close.assert_called_once()
+
+    def test_type_detected_from_first_bytes(self, mock_response, image_index):
+        """Test that the extension comes from the content, not from the URL"""
+        mock_response.chunks = [b"RIFF", b"\x24\x00\x00\x00WEB", b"PVP8 " + b"\x00" * 50]
+        assert Util.download_image("https://example.com/image.jpg", "release", 1).endswith("/release/1.webp")
+
+    def test_unsupported_type(self, mock_response, image_index):
+        """Test that a non-image response (e.g. an HTML error page) is rejected after the first bytes"""
+        read = []
+        mock_response.chunks = (read.append(n) or b"<!DOCTYPE html>" for n in range(1000))
+        with pytest.raises(ValueError):
+            Util.download_image("https://example.com/image", "release", 1)
+        assert len(read) == 1
+        assert ImageIndex.get("release", 1) is None
+
+    def test_aborts_when_too_large(self, mock_response, image_index, mocker):
+        """Test that the download stops as soon as it exceeds IMAGE_MAX_BYTES and leaves no file behind"""
+        mocker.patch('databass.api.util.IMAGE_MAX_BYTES', 150)
+        read = []
+        mock_response.chunks = (read.append(n) or (VALID_JPEG_BYTES * 10) for n in range(1000))
+        with pytest.raises(ValueError):
+            Util.download_image("https://example.com/image", "release", 1)
+        assert len(read) == 2
+        assert ImageIndex.get("release", 1) is None
+        assert os.listdir(f"{image_index.img_dir}/blobs") == []
+
+    def test_content_length_too_large(self, mock_response, image_index, mocker):
+        """Test that a download announced as too large is not started"""
+        mocker.patch('databass.api.util.IMAGE_MAX_BYTES', 150)
+        mock_response.headers = {"Content-Length": "151"}
+        with pytest.raises(ValueError):
+            Util.download_image("https://example.com/image", "release", 1)
+        mock_response.iter_content.assert_not_called()
+        mock_response.close.assert_called_once()
+
+    def test_error_status(self, mock_response, image_index):
+        """Test that nothing is saved if the server returns an error"""
+        mock_response.__bool__.return_value = False
+        mock_response.status_code = 404
+        assert Util.download_image("https://example.com/image", "release", 1) is None
+        mock_response.iter_content.assert_not_called()
+
+    def test_get_image_with_url(self, mock_response, image_index):
+        """Test that images given by URL (e.g. from the edit form) are streamed as well"""
+        assert Util.get_image(item_type="release", item_id=4, url="https://example.com/image") is not None
+        assert ImageIndex.get("release", 4).endswith("/release/4.jpg")
+
 
 class TestImgExists:
     """Test suite for the img_exists utility function"""
@@ -157,40 +262,27 @@ class TestImgExists:
         (456, "artist", "/static/img/artist/456.png", "png"),
         (789, "label", "/static/img/label/789.jpg", "jpg"),
     ])
-    def test_existing_image(self, item_id, item_type, expected, extension, monkeypatch):
+    def test_existing_image(self, item_id, item_type, expected, extension, image_index):
         """
         Test that the function returns the correct path when an image exists
         """
-
-        def mock_glob(*args, **kwargs):
-            return [Path(f"static/img/{item_type}/{item_id}.{extension}")]
-
-        monkeypatch.setattr(Path, "glob", mock_glob)
+        image_index.record(item_type, item_id, f"{image_index.img_dir}/{item_type}/{item_id}.{extension}")
         result = Util.img_exists(item_id, item_type)
         assert result == expected
 
-    def test_nonexistent_image(self, monkeypatch):
+    def test_nonexistent_image(self, image_index):
         """
         Test that the function returns None when no image exists
         """
-
-        def mock_glob(*args, **kwargs):
-            return []
-
-        monkeypatch.setattr(Path, "glob", mock_glob)
         result = Util.img_exists(123, "release")
         assert result is None
 
     @pytest.mark.parametrize("item_type", ["RELEASE", "ARTIST", "LABEL"])
-    def test_case_insensitive_type(self, item_type, monkeypatch):
+    def test_case_insensitive_type(self, item_type, image_index):
         """
         Test that the function handles case-insensitive item types correctly
         """
-
-        def mock_glob(*args, **kwargs):
-            return [Path(f"static/img/{item_type.lower()}/123.jpg")]
-
-        monkeypatch.setattr(Path, "glob", mock_glob)
+        image_index.record(item_type.lower(), 123, f"{image_index.img_dir}/{item_type.lower()}/123.jpg")
         result = Util.img_exists(123, item_type)
         assert result is not None
 
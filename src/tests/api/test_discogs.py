@@ -3,7 +3,7 @@ import requests.exceptions
 from requests import Response
 import time
 import requests
-from databass.api.discogs import Discogs, RATE_LIMIT_THRESHOLD
+from databass.api.discogs import Discogs
 
 
 class TestUpdateRateLimit:
@@ -17,20 +17,24 @@ class TestUpdateRateLimit:
         Discogs.update_rate_limit(mock_response)
         assert Discogs.remaining_requests == 42
 
-class TestIsThrottled:
-    """Tests for Discogs.is_throttled method"""
+    def test_update_rate_limit_seeds_rate_limiter(self, mocker):
+        """Test that the reported limit and remaining requests are passed to the rate limiter"""
+        mock_observe = mocker.patch.object(Discogs.rate_limiter, 'observe')
+        mock_response = mocker.Mock(spec=requests.Response)
+        mock_response.headers = {"x-discogs-ratelimit": "25", "x-discogs-ratelimit-remaining": "10"}
+
+        Discogs.update_rate_limit(mock_response)
+        mock_observe.assert_called_once_with(25, 10)
+
+    def test_update_rate_limit_without_headers(self, mocker):
+        """Test that responses without rate limit headers leave the rate limiter alone"""
+        mock_observe = mocker.patch.object(Discogs.rate_limiter, 'observe')
+        mock_response = mocker.Mock(spec=requests.Response)
+        mock_response.headers = {}
+
+        Discogs.update_rate_limit(mock_response)
+        mock_observe.assert_not_called()
 
-    @pytest.mark.parametrize("remaining,expected", [
-        (None, False),  # Initial state
-        (1.0, True),  # Below threshold
-        (1.1, True),  # At threshold
-        (2.0, False),  # Above threshold
-        (0, True),  # Zero remaining
-    ])
-    def test_throttle_detection(self, remaining, expected):
-        """Test throttling detection for different remaining request counts"""
-        Discogs.remaining_requests = remaining
-        assert Discogs.is_throttled() == expected
 
 class TestRequest:
     """Tests for Discogs.request method"""
@@ -42,26 +46,30 @@ class TestRequest:
         mock_response.headers = {"x-discogs-ratelimit-remaining": "5"}
         mock_response.json.return_value = {"data": "test"}
 
-        mock_get = mocker.patch('requests.get', return_value=mock_response)
+        mock_get = mocker.patch('databass.api.http_client.HttpClient.get', return_value=mock_response)
         result = Discogs.request("/test")
 
         assert result == {"data": "test"}
         mock_get.assert_called_once()
 
-    def test_request_with_throttling(self, mocker):
-        """Test request handling when rate limited"""
+    def test_request_waits_for_rate_limiter(self, mocker):
+        """Test that a token is taken from the rate limiter before the request is sent"""
+        calls = []
         mock_response = mocker.Mock(spec=requests.Response)
         mock_response.status_code = 200
         mock_response.headers = {"x-discogs-ratelimit-remaining": "1"}
         mock_response.json.return_value = {"data": "test"}
 
+        mocker.patch.object(Discogs.rate_limiter, 'acquire', side_effect=lambda: calls.append('acquire'))
+        mocker.patch('databass.api.http_client.HttpClient.get',
+                     side_effect=lambda *args, **kwargs: calls.append('get') or mock_response)
         mock_sleep = mocker.patch('time.sleep')
-        mocker.patch('requests.get', return_value=mock_response)
 
         result = Discogs.request("/test")
 
         assert result == {"data": "test"}
-        mock_sleep.assert_called_once_with(5)
+        assert calls == ['acquire', 'get']
+        mock_sleep.assert_not_called()
 
     def test_failed_request(self, mocker):
         """Test handling of failed API requests"""
@@ -69,11 +77,76 @@ class TestRequest:
         mock_response.status_code = 404
         mock_response.headers = {"x-discogs-ratelimit-remaining": "5"}
 
-        mocker.patch('requests.get', return_value=mock_response)
+        mocker.patch('databass.api.http_client.HttpClient.get', return_value=mock_response)
 
         with pytest.raises(requests.exceptions.RequestException):
             Discogs.request("/test")
 
+class TestRequestCache:
+    """Tests for the on-disk response cache used by Discogs.request"""
+
+    @staticmethod
+    def mock_response(mocker, status_code=200, body=None, headers=None):
+        response = mocker.Mock(spec=requests.Response)
+        response.status_code = status_code
+        response.headers = {"x-discogs-ratelimit-remaining": "50", **(headers or {})}
+        response.json.return_value = body
+        return response
+
+    def test_fresh_entry_skips_network(self, mocker):
+        """Test that a repeated request within the TTL is served from disk"""
+        mock_get = mocker.patch('databass.api.http_client.HttpClient.get', return_value=self.mock_response(mocker, body={"id": 1}))
+        assert Discogs.request("/artists/1") == {"id": 1}
+        assert Discogs.request("/artists/1") == {"id": 1}
+        mock_get.assert_called_once()
+
+    def test_stale_entry_revalidated_with_validators(self, mocker):
+        """Test that an expired entry is revalidated, and reused on 304 Not Modified"""
+        mock_time = mocker.patch('databass.api.discogs.time.time', return_value=1000.0)
+        first = self.mock_response(mocker, body={"id": 1}, headers={
+            "ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"
+        })
+        not_modified = self.mock_response(mocker, status_code=304)
+        mock_get = mocker.patch('databass.api.http_client.HttpClient.get', side_effect=[first, not_modified])
+
+        Discogs.request("/labels/1")
+        mock_time.return_value = 1000.0 + Discogs.cache_ttl + 1
+        assert Discogs.request("/labels/1") == {"id": 1}
+
+        sent_headers = mock_get.call_args_list[1].kwargs["headers"]
+        assert sent_headers["If-None-Match"] == '"abc"'
+        assert sent_headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        # The 304 refreshed the entry, so the next request does not touch the network
+        Discogs.request("/labels/1")
+        assert mock_get.call_count == 2
+
+    def test_stale_entry_replaced_on_200(self, mocker):
+        """Test that a changed resource replaces the cached response"""
+        mock_time = mocker.patch('databass.api.discogs.time.time', return_value=1000.0)
+        mocker.patch('databass.api.http_client.HttpClient.get', side_effect=[
+            self.mock_response(mocker, body={"v": 1}),
+            self.mock_response(mocker, body={"v": 2}),
+        ])
+        Discogs.request("/releases/1")
+        mock_time.return_value = 1000.0 + Discogs.cache_ttl + 1
+        assert Discogs.request("/releases/1") == {"v": 2}
+        assert Discogs.load_cached("/releases/1")["body"] == {"v": 2}
+
+    def test_errors_not_cached(self, mocker):
+        """Test that failed requests are not written to the cache"""
+        mocker.patch('databass.api.http_client.HttpClient.get', return_value=self.mock_response(mocker, status_code=500))
+        with pytest.raises(requests.exceptions.RequestException):
+            Discogs.request("/artists/2")
+        assert Discogs.load_cached("/artists/2") is None
+
+    def test_cache_disabled_with_zero_ttl(self, mocker):
+        """Test that a TTL of 0 sends every request to Discogs"""
+        mocker.patch.object(Discogs, 'cache_ttl', 0)
+        mock_get = mocker.patch('databass.api.http_client.HttpClient.get', return_value=self.mock_response(mocker, body={"id": 1}))
+        Discogs.request("/artists/1")
+        Discogs.request("/artists/1")
+        assert mock_get.call_count == 2
+
 class TestGetItemId:
     """Test suite for Discogs.get_item_id method"""
 
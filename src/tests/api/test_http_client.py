@@ -0,0 +1,152 @@
+import threading
+import time
+import pytest
+import requests
+from databass.api.http_client import HttpClient, build_session, HTTP_POOL_SIZE, HTTP_RETRIES, HTTP_TIMEOUT, USER_AGENT
+
+
+class TestBuildSession:
+    """Tests for build_session()"""
+
+    @pytest.mark.parametrize("scheme", ["https://", "http://"])
+    def test_pool_and_retries(self, scheme):
+        """Test that both schemes use a pooled adapter that retries with backoff"""
+        adapter = build_session().get_adapter(f"{scheme}api.discogs.com")
+        assert adapter._pool_maxsize == HTTP_POOL_SIZE
+        assert adapter.max_retries.total == HTTP_RETRIES
+        assert adapter.max_retries.backoff_factor > 0
+        assert 429 in adapter.max_retries.status_forcelist
+        assert 503 in adapter.max_retries.status_forcelist
+
+    def test_default_headers(self):
+        """Test that the session sends the databass User-Agent"""
+        assert build_session().headers["User-Agent"] == USER_AGENT
+
+    def test_cookies_disabled(self):
+        """Test that the shared session accepts no cookies from any domain"""
+        policy = build_session().cookies._policy
+        assert not policy.allowed_domains()
+        assert policy.allowed_domains() is not None
+
+
+class TestHttpClientGet:
+    """Tests for HttpClient.get()"""
+
+    def test_uses_shared_session(self, mocker):
+        """Test that requests go through the shared session with the default timeout"""
+        mock_get = mocker.patch.object(HttpClient.session, "get")
+        HttpClient.get("https://i.discogs.com/a.jpg", headers={"Accept": "image/*"})
+        mock_get.assert_called_once_with(
+            "https://i.discogs.com/a.jpg", headers={"Accept": "image/*"}, timeout=HTTP_TIMEOUT
+        )
+
+    def test_timeout_can_be_overridden(self, mocker):
+        """Test that an explicit timeout is passed through"""
+        mock_get = mocker.patch.object(HttpClient.session, "get")
+        HttpClient.get("https://api.discogs.com", timeout=5)
+        assert mock_get.call_args.kwargs["timeout"] == 5
+
+    def test_no_deadline(self):
+        """Test that no deadline is set outside of a deadline() block"""
+        assert HttpClient.remaining() is None
+
+    def test_deadline_caps_timeout(self, mocker):
+        """Test that the timeout is capped at the time left until the deadline"""
+        mock_get = mocker.patch.object(HttpClient.session, "get")
+        with HttpClient.deadline(5):
+            HttpClient.get("https://coverartarchive.org")
+        assert 0 < mock_get.call_args.kwargs["timeout"] <= 5
+
+    def test_nested_deadline_cannot_extend(self):
+        """Test that an inner deadline never ends after the outer one"""
+        with HttpClient.deadline(2):
+            with HttpClient.deadline(30):
+                assert HttpClient.remaining() <= 2
+            with HttpClient.deadline(1):
+                assert HttpClient.remaining() <= 1
+            assert 1 < HttpClient.remaining() <= 2
+        assert HttpClient.remaining() is None
+
+    def test_deadline_passed(self, mocker):
+        """Test that requests fail with a timeout without being sent once the deadline has passed"""
+        mock_get = mocker.patch.object(HttpClient.session, "get")
+        with HttpClient.deadline(0):
+            with pytest.raises(requests.exceptions.Timeout):
+                HttpClient.get("https://api.discogs.com")
+        mock_get.assert_not_called()
+
+    def test_deadline_is_per_thread(self):
+        """Test that a deadline set in one thread does not apply to other threads"""
+        seen = []
+        with HttpClient.deadline(5):
+            thread = threading.Thread(target=lambda: seen.append(HttpClient.remaining()))
+            thread.start()
+            thread.join()
+        assert seen == [None]
+
+
+class TestDeadlineRetry:
+    """Tests for retries of rate limited requests within a deadline"""
+
+    @pytest.fixture
+    def rate_limited_server(self):
+        """Local HTTP server answering every request with 429 and the Retry-After of `server.retry_after`"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.server.requests += 1
+                self.send_response(429)
+                self.send_header("Retry-After", self.server.retry_after)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        server.requests = 0
+        server.retry_after = "30"
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def test_retry_after_past_deadline_is_not_waited_for(self, rate_limited_server):
+        """Test that a Retry-After longer than the time left returns the 429 instead of sleeping"""
+        url = f"http://127.0.0.1:{rate_limited_server.server_port}/"
+        start = time.monotonic()
+        with HttpClient.deadline(2):
+            response = HttpClient.get(url)
+        assert time.monotonic() - start < 1
+        assert response.status_code == 429
+        assert rate_limited_server.requests == 1
+
+    def test_retries_stop_at_deadline(self, rate_limited_server):
+        """Test that retries are made while their backoff ends before the deadline, and no later"""
+        rate_limited_server.retry_after = "0"
+        url = f"http://127.0.0.1:{rate_limited_server.server_port}/"
+        start = time.monotonic()
+        with HttpClient.deadline(2):
+            response = HttpClient.get(url)
+        assert time.monotonic() - start < 2
+        assert response.status_code == 429
+        assert 1 < rate_limited_server.requests < HTTP_RETRIES + 1
+
+
+class TestIterContent:
+    """Tests for HttpClient.iter_content()"""
+
+    def test_yields_chunks(self, mocker):
+        """Test that the body is read in chunks of the given size"""
+        response = mocker.Mock(iter_content=mocker.Mock(return_value=iter([b"ab", b"cd"])))
+        assert list(HttpClient.iter_content(response, 2)) == [b"ab", b"cd"]
+        response.iter_content.assert_called_once_with(2)
+
+    def test_deadline_passed_while_reading(self, mocker):
+        """Test that a slow body is abandoned once the deadline has passed"""
+        response = mocker.Mock(url="https://example.com/image.jpg", iter_content=mocker.Mock(return_value=iter([b"ab"])))
+        with HttpClient.deadline(0):
+            with pytest.raises(requests.exceptions.Timeout):
+                list(HttpClient.iter_content(response, 2))
@@ -1,4 +1,5 @@
 import pytest
+import requests
 from databass.api.musicbrainz import MusicBrainz
 from databass.api.types import ReleaseInfo
 import musicbrainzngs as mbz
@@ -565,6 +566,27 @@ class TestGetReleaseLength:
         assert result == 0
 
 
+def caa_response(mocker, status_code=200, content=b"", json=None):
+    response = mocker.Mock(spec=requests.Response)
+    response.status_code = status_code
+    response.content = content
+    response.json.return_value = json
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status_code} error")
+    return response
+
+
+def mock_caa(mocker, responses):
+    """Patch the shared HTTP session to answer CoverArtArchive paths from `responses`"""
+    def get(url, **kwargs):
+        path = url.removeprefix("https://coverartarchive.org/")
+        response = responses.get(path, caa_response(mocker, status_code=404))
+        if isinstance(response, Exception):
+            raise response
+        return response
+    return mocker.patch('databass.api.http_client.HttpClient.get', side_effect=get)
+
+
 class TestGetImage:
     @pytest.mark.parametrize("mbid,size", [
         ("2ab9206e-4408-47e3-92cc-283d2b96c896", "250"),
@@ -577,7 +599,7 @@ class TestGetImage:
         verifying that the function returns bytes data.
         """
         mock_image = b"mock_image_data"
-        mocker.patch('musicbrainzngs.get_release_group_image_front', return_value=mock_image)
+        mock_caa(mocker, {f"release-group/{mbid}/front-{size}": caa_response(mocker, content=mock_image)})
 
         result = MusicBrainz.get_image(mbid, size)
         assert result == mock_image
@@ -590,14 +612,11 @@ class TestGetImage:
         mock_image = b"fallback_image_data"
         mbid = "test-mbid"
 
-        # Mock primary method to fail
-        mocker.patch('musicbrainzngs.get_release_group_image_front',
-                     side_effect=mbz.musicbrainz.ResponseError(None, None))
-
-        # Mock fallback methods
-        mocker.patch('musicbrainzngs.get_image_list',
-                     return_value={'images': [{'id': 'cover-id'}]})
-        mocker.patch('musicbrainzngs.get_image', return_value=mock_image)
+        # Primary method fails with a 404; the image list and image are found
+        mock_caa(mocker, {
+            f"release/{mbid}": caa_response(mocker, json={'images': [{'id': 'cover-id'}]}),
+            f"release/{mbid}/cover-id-250": caa_response(mocker, content=mock_image),
+        })
 
         result = MusicBrainz.get_image(mbid)
         assert result == mock_image
@@ -637,9 +656,7 @@ class TestGetImage:
         Test handling of cases where no images are found for a valid MBID,
         verifying None is returned.
         """
-        mocker.patch('musicbrainzngs.get_release_group_image_front',
-                     side_effect=mbz.musicbrainz.ResponseError(None, None))
-        mocker.patch('musicbrainzngs.get_image_list', return_value={'images': []})
+        mock_caa(mocker, {"release/valid-mbid": caa_response(mocker, json={'images': []})})
 
         result = MusicBrainz.get_image("valid-mbid")
         assert result is None
@@ -649,8 +666,16 @@ class TestGetImage:
         Test handling of API errors during image fetch, ensuring None is returned
         when unexpected errors occur.
         """
-        mocker.patch('musicbrainzngs.get_release_group_image_front',
-                     side_effect=Exception("Unexpected API error"))
+        mock_caa(mocker, {"release-group/valid-mbid/front-250": Exception("Unexpected API error")})
+
+        result = MusicBrainz.get_image("valid-mbid")
+        assert result is None
+
+    def test_timeout_returns_none(self, mocker):
+        """
+        Test that a request timing out (e.g. because the caller's deadline passed) returns None
+        """
+        mock_caa(mocker, {"release-group/valid-mbid/front-250": requests.exceptions.Timeout()})
 
         result = MusicBrainz.get_image("valid-mbid")
         assert result is None
@@ -660,10 +685,44 @@ class TestGetImage:
         Test handling of missing image ID in fallback response,
         verifying None is returned when image ID cannot be found.
         """
-        mocker.patch('musicbrainzngs.get_release_group_image_front',
-                     side_effect=mbz.musicbrainz.ResponseError(None, None))
-        mocker.patch('musicbrainzngs.get_image_list',
-                     return_value={'images': [{}]})
+        mock_caa(mocker, {"release/valid-mbid": caa_response(mocker, json={'images': [{}]})})
 
         result = MusicBrainz.get_image("valid-mbid")
         assert result is None
+
+class TestMusicBrainzCached:
+    # Tests for MusicBrainz.cached()
+    def test_cached_calls_network_once(self, sqlite_app, mocker):
+        """
+        Test that repeated lookups of the same artist are served from the response cache
+        """
+        mocker.patch.object(MusicBrainz, 'init', True)
+        response = {"artist": {"id": "abc", "name": "Test Artist"}}
+        mock_get = mocker.patch('musicbrainzngs.get_artist_by_id', return_value=response)
+
+        first = MusicBrainz.artist_search(name="Test Artist", mbid="abc")
+        second = MusicBrainz.artist_search(name="Test Artist", mbid="abc")
+
+        assert first == second
+        mock_get.assert_called_once_with("abc", includes=['area-rels'])
+
+    def test_cached_does_not_store_errors(self, sqlite_app, mocker):
+        """
+        Test that failed calls are retried rather than cached
+        """
+        mock_get = mocker.patch('musicbrainzngs.get_release_by_id', side_effect=Exception("API Error"))
+        with pytest.raises(Exception):
+            MusicBrainz.cached('release', 'get_release_by_id', "abc")
+        with pytest.raises(Exception):
+            MusicBrainz.cached('release', 'get_release_by_id', "abc")
+        assert mock_get.call_count == 2
+
+    def test_cached_waits_for_scheduler_on_miss_only(self, sqlite_app, mocker):
+        """
+        Test that only calls that reach MusicBrainz wait for the request scheduler
+        """
+        mock_acquire = mocker.patch.object(MusicBrainz.scheduler, 'acquire')
+        mocker.patch('musicbrainzngs.get_release_by_id', return_value={"release": {"id": "abc"}})
+        MusicBrainz.cached('release', 'get_release_by_id', "abc")
+        MusicBrainz.cached('release', 'get_release_by_id', "abc")
+        mock_acquire.assert_called_once()
@@ -0,0 +1,263 @@
+import json
+import threading
+import pytest
+import requests
+from databass.api.http_client import HttpClient
+from databass.api.rate_limit import TokenBucket, RequestScheduler, SharedState, INTERACTIVE, BACKGROUND
+
+
+@pytest.fixture
+def clock(mocker):
+    """Mock wall clock; time.sleep() advances it instead of blocking"""
+    now = {"time": 1000.0}
+    mocker.patch('databass.api.rate_limit.time.time', side_effect=lambda: now["time"])
+
+    def sleep(seconds):
+        now["time"] += seconds
+
+    mocker.patch('databass.api.rate_limit.time.sleep', side_effect=sleep)
+    return now
+
+
+class TestSharedState:
+    """Test suite for SharedState"""
+
+    def test_update_writes_state(self, tmp_path):
+        """Test that changes made in an update block are written to the file"""
+        state_file = tmp_path / "state.json"
+        with SharedState(str(state_file)).update() as state:
+            state["count"] = 1
+        assert json.loads(state_file.read_text()) == {"count": 1}
+
+    def test_read_does_not_rewrite(self, tmp_path):
+        """Test that read returns a copy of the state without writing the file"""
+        state_file = tmp_path / "state.json"
+        shared = SharedState(str(state_file))
+        with shared.update() as state:
+            state["jobs"] = {"release/1": 1.0}
+        modified = state_file.stat().st_mtime_ns
+
+        state = shared.read()
+        state["jobs"].clear()
+
+        assert shared.read() == {"jobs": {"release/1": 1.0}}
+        assert state_file.stat().st_mtime_ns == modified
+
+    def test_read_missing_file(self, tmp_path):
+        """Test that reading before anything was written returns an empty state and creates no file"""
+        state_file = tmp_path / "state.json"
+        assert SharedState(str(state_file)).read() == {}
+        assert not state_file.exists()
+
+    def test_read_unwritable_state_file(self, tmp_path):
+        """Test that read returns the state of this process if the state file cannot be opened"""
+        blocker = tmp_path / "not_a_directory"
+        blocker.write_text("")
+        shared = SharedState(str(blocker / "state.json"))
+        with shared.update() as state:
+            state["count"] = 1
+        assert shared.read() == {"count": 1}
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return TokenBucket(str(tmp_path / "bucket.json"), limit=60, window=60, burst=5)
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket"""
+
+    def test_burst_without_waiting(self, bucket, clock):
+        """Test that a full bucket allows `burst` requests without waiting"""
+        assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+
+    def test_waits_when_empty(self, bucket, clock):
+        """Test that requests are spaced out to the refill rate once the burst is used up"""
+        for _ in range(5):
+            bucket.acquire()
+        rate = bucket.rate(60)
+        assert bucket.acquire() == pytest.approx(1 / rate)
+        assert bucket.acquire() == pytest.approx(1 / rate)
+
+    def test_never_exceeds_limit_per_window(self, bucket, clock):
+        """Test that no more than `limit` requests are sent within any window"""
+        sent = []
+        for _ in range(150):
+            bucket.acquire()
+            sent.append(clock["time"])
+        for i, start in enumerate(sent):
+            in_window = [t for t in sent[i:] if t < start + 60]
+            assert len(in_window) <= 60
+
+    def test_refills_over_time(self, bucket, clock):
+        """Test that tokens are added back while idle, up to the capacity"""
+        for _ in range(5):
+            bucket.acquire()
+        clock["time"] += 3600
+        assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+        assert bucket.acquire() > 0
+
+    def test_wait_past_deadline_raises_timeout(self, bucket, clock):
+        """Test that a wait longer than the time left in the HttpClient deadline raises Timeout without taking a token"""
+        for _ in range(5):
+            bucket.acquire()
+        with HttpClient.deadline(0.5):
+            with pytest.raises(requests.exceptions.Timeout):
+                bucket.acquire()
+        assert clock["time"] == 1000.0
+        assert bucket.acquire() == pytest.approx(1 / bucket.rate(60))
+
+    def test_observe_limits_tokens_to_remaining(self, bucket, clock):
+        """Test that the bucket holds no more tokens than the API reports as remaining"""
+        bucket.observe(limit=60, remaining=2)
+        assert bucket.acquire() == 0.0
+        assert bucket.acquire() > 0
+
+    def test_observe_seeds_limit(self, bucket, clock, tmp_path):
+        """Test that the limit reported by the API replaces the default"""
+        bucket.observe(limit=25, remaining=None)
+        with open(tmp_path / "bucket.json", encoding="utf-8") as state_file:
+            assert json.load(state_file)["limit"] == 25
+        for _ in range(bucket.capacity(25)):
+            bucket.acquire()
+        assert bucket.acquire() == pytest.approx(1 / bucket.rate(25))
+
+    def test_state_shared_between_instances(self, tmp_path, clock):
+        """Test that buckets using the same state file (e.g. in other workers) share their tokens"""
+        first = TokenBucket(str(tmp_path / "bucket.json"), limit=60, burst=2)
+        second = TokenBucket(str(tmp_path / "bucket.json"), limit=60, burst=2)
+        assert first.acquire() == 0.0
+        assert second.acquire() == 0.0
+        assert first.acquire() > 0
+
+    def test_concurrent_threads_reserve_distinct_slots(self, bucket, mocker):
+        """Test that concurrent callers queue up behind each other"""
+        mocker.patch('databass.api.rate_limit.time.time', return_value=1000.0)
+        mocker.patch('databass.api.rate_limit.time.sleep')
+        waits = []
+        threads = [threading.Thread(target=lambda: waits.append(bucket.acquire())) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = [max(0.0, (n - 5) / bucket.rate(60)) for n in range(1, 21)]
+        assert sorted(waits) == pytest.approx(expected)
+
+    def test_unwritable_state_file(self, tmp_path, clock):
+        """Test that the bucket still limits this process if the state file cannot be opened"""
+        blocker = tmp_path / "not_a_directory"
+        blocker.write_text("")
+        bucket = TokenBucket(str(blocker / "bucket.json"), limit=60, burst=1)
+        assert bucket.acquire() == 0.0
+        assert bucket.acquire() > 0
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return RequestScheduler(str(tmp_path / "queue.json"), interval=1.0, poll=0.05, stale_after=30)
+
+
+def add_waiter(scheduler, ticket, priority, since):
+    """Register a request waiting in another worker"""
+    with SharedState(scheduler.state_file).update() as state:
+        state.setdefault("waiters", {})[ticket] = {"priority": priority, "since": since, "seen": since}
+
+
+class TestRequestScheduler:
+    """Tests for RequestScheduler"""
+
+    def test_spaces_requests_by_interval(self, scheduler, clock):
+        """Test that requests start at least `interval` seconds apart"""
+        assert scheduler.acquire() == 0.0
+        assert scheduler.acquire() == pytest.approx(1.0)
+        clock["time"] += 5
+        assert scheduler.acquire() == 0.0
+
+    def test_wait_past_deadline_raises_timeout(self, scheduler, clock):
+        """Test that a queue wait longer than the time left in the HttpClient deadline raises Timeout and leaves the queue"""
+        scheduler.acquire()
+        with HttpClient.deadline(0.5):
+            with pytest.raises(requests.exceptions.Timeout):
+                scheduler.acquire()
+        assert scheduler.info()["queue_depth"] == {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def test_shared_between_instances(self, tmp_path, clock):
+        """Test that schedulers using the same state file (e.g. in other workers) share the interval"""
+        first = RequestScheduler(str(tmp_path / "queue.json"), interval=1.0)
+        second = RequestScheduler(str(tmp_path / "queue.json"), interval=1.0)
+        first.acquire()
+        assert second.acquire() == pytest.approx(1.0)
+
+    def test_background_waits_for_interactive(self, scheduler, clock, mocker):
+        """Test that background requests are not served while an interactive request is waiting"""
+        add_waiter(scheduler, "search", INTERACTIVE, since=clock["time"] + 1)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock["time"] += seconds
+            if len(sleeps) == 3:
+                # The interactive request is served by its worker
+                with SharedState(scheduler.state_file).update() as state:
+                    del state["waiters"]["search"]
+                    state["next_slot"] = clock["time"] + 1.0
+
+        mocker.patch('databass.api.rate_limit.time.sleep', side_effect=sleep)
+        wait = scheduler.acquire()
+        assert wait == pytest.approx(3 * 0.05 + 1.0)
+
+    def test_interactive_skips_background_queue(self, scheduler, clock):
+        """Test that interactive requests go ahead of background requests that arrived earlier"""
+        add_waiter(scheduler, "enrichment", BACKGROUND, since=clock["time"] - 10)
+        with scheduler.priority(INTERACTIVE):
+            assert scheduler.acquire() == 0.0
+
+    def test_same_priority_is_first_come_first_served(self, scheduler, clock, mocker):
+        """Test that requests of the same priority wait for those that arrived earlier"""
+        add_waiter(scheduler, "earlier", BACKGROUND, since=clock["time"] - 1)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock["time"] += seconds
+            if len(sleeps) == 2:
+                # The earlier request is served by its worker
+                with SharedState(scheduler.state_file).update() as state:
+                    del state["waiters"]["earlier"]
+                    state["next_slot"] = clock["time"] + 1.0
+
+        mocker.patch('databass.api.rate_limit.time.sleep', side_effect=sleep)
+        assert scheduler.acquire() == pytest.approx(2 * 0.05 + 1.0)
+
+    def test_stale_waiters_dropped(self, scheduler, clock):
+        """Test that waiters of workers that stopped polling do not block the queue"""
+        add_waiter(scheduler, "dead-worker", INTERACTIVE, since=clock["time"] - 60)
+        assert scheduler.acquire() == 0.0
+        assert scheduler.info()["queue_depth"] == {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def test_priority_context(self, scheduler, clock):
+        """Test that priority() applies to requests made inside the block only"""
+        with scheduler.priority(INTERACTIVE):
+            scheduler.acquire()
+        scheduler.acquire()
+        info = scheduler.info()
+        assert info[INTERACTIVE]["requests"] == 1
+        assert info[BACKGROUND]["requests"] == 1
+
+    def test_unknown_priority(self, scheduler):
+        """Test that an unknown priority raises ValueError"""
+        with pytest.raises(ValueError):
+            with scheduler.priority("urgent"):
+                pass
+
+    def test_info(self, scheduler, clock):
+        """Test the queue depth and wait time metrics"""
+        add_waiter(scheduler, "other", BACKGROUND, since=clock["time"] + 100)
+        scheduler.acquire()
+        scheduler.acquire()
+        info = scheduler.info()
+        assert info["queue_depth"] == {INTERACTIVE: 0, BACKGROUND: 1}
+        assert info[BACKGROUND] == {"requests": 2, "wait_avg": 0.5, "wait_max": 1.0}
+        assert info[INTERACTIVE] == {"requests": 0, "wait_avg": 0.0, "wait_max": 0.0}
+        scheduler.reset_metrics()
+        assert scheduler.info()[BACKGROUND]["requests"] == 0
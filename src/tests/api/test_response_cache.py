@@ -0,0 +1,91 @@
+import pytest
+from datetime import datetime, timedelta
+from databass.api.cache import ResponseCache
+
+
+@pytest.fixture(autouse=True)
+def reset_counters():
+    ResponseCache.reset_counters()
+    yield
+    ResponseCache.reset_counters()
+
+
+class TestResponseCache:
+    """Test suite for ResponseCache"""
+
+    def test_make_key_depends_on_arguments(self):
+        """Test that keys differ by source, endpoint and arguments but not by keyword order"""
+        key = ResponseCache.make_key("musicbrainz", "get_release_by_id", {"a": 1, "b": 2})
+        assert key == ResponseCache.make_key("musicbrainz", "get_release_by_id", {"b": 2, "a": 1})
+        assert key != ResponseCache.make_key("musicbrainz", "get_release_by_id", {"a": 2, "b": 2})
+        assert key != ResponseCache.make_key("musicbrainz", "get_artist_by_id", {"a": 1, "b": 2})
+        assert key != ResponseCache.make_key("discogs", "get_release_by_id", {"a": 1, "b": 2})
+
+    def test_set_and_get(self, sqlite_app):
+        """Test that a stored response is returned on the next lookup"""
+        response = {"release": {"id": "abc", "medium-list": [{"track-count": 3}]}}
+        assert ResponseCache.get("musicbrainz", "get_release_by_id", ["abc"]) == (False, None)
+        ResponseCache.set("musicbrainz", "get_release_by_id", ["abc"], response, ttl=60)
+        assert ResponseCache.get("musicbrainz", "get_release_by_id", ["abc"]) == (True, response)
+
+    def test_set_replaces_existing_entry(self, sqlite_app):
+        """Test that storing a response for the same call replaces the previous one"""
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=60)
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 2}, ttl=60)
+        assert ResponseCache.get("musicbrainz", "search_artists", ["x"]) == (True, {"v": 2})
+
+    def test_expired_entry_is_a_miss(self, sqlite_app, mocker):
+        """Test that entries past their TTL are not returned"""
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=60)
+        later = datetime.now() + timedelta(seconds=120)
+        mock_datetime = mocker.patch("databass.api.cache.datetime")
+        mock_datetime.now.return_value = later
+        assert ResponseCache.get("musicbrainz", "search_artists", ["x"]) == (False, None)
+
+    @pytest.mark.parametrize("ttl", [0, -1])
+    def test_non_positive_ttl_is_not_stored(self, sqlite_app, ttl):
+        """Test that a TTL of zero disables caching"""
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=ttl)
+        assert ResponseCache.get("musicbrainz", "search_artists", ["x"]) == (False, None)
+
+    def test_no_app_context_is_a_miss(self):
+        """Test that the cache is bypassed outside of an application context"""
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=60)
+        assert ResponseCache.get("musicbrainz", "search_artists", ["x"]) == (False, None)
+
+    def test_info_hit_ratio(self, sqlite_app):
+        """Test that hits and misses are counted per source"""
+        ResponseCache.get("musicbrainz", "search_artists", ["x"])
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=60)
+        ResponseCache.get("musicbrainz", "search_artists", ["x"])
+        ResponseCache.get("musicbrainz", "search_artists", ["x"])
+        assert ResponseCache.info("musicbrainz") == {"hits": 2, "misses": 1, "hit_ratio": 0.6667}
+        assert ResponseCache.info("discogs") == {"hits": 0, "misses": 0, "hit_ratio": 0.0}
+
+    def test_prune_deletes_expired_entries(self, sqlite_app, mocker):
+        """Test that prune() deletes expired responses and keeps current ones"""
+        from databass.db.base import app_db
+        from databass.db.models import ApiResponse
+        ResponseCache.set("musicbrainz", "search_artists", ["old"], {"v": 1}, ttl=60)
+        ResponseCache.set("musicbrainz", "search_artists", ["new"], {"v": 2}, ttl=600)
+        mock_datetime = mocker.patch("databass.api.cache.datetime")
+        mock_datetime.now.return_value = datetime.now() + timedelta(seconds=120)
+
+        assert ResponseCache.prune() == 1
+        assert app_db.session.query(ApiResponse).count() == 1
+
+    def test_set_prunes_when_due(self, sqlite_app, mocker):
+        """Test that storing a response prunes expired ones at most once per prune interval"""
+        mocker.patch.object(ResponseCache, "_last_prune", 0.0)
+        mocker.patch("databass.api.cache.time.monotonic", return_value=ResponseCache.prune_interval)
+        mock_prune = mocker.patch.object(ResponseCache, "prune")
+        ResponseCache.set("musicbrainz", "search_artists", ["x"], {"v": 1}, ttl=60)
+        ResponseCache.set("musicbrainz", "search_artists", ["y"], {"v": 1}, ttl=60)
+        mock_prune.assert_called_once_with()
+
+    def test_prune_command(self, sqlite_app, mocker):
+        """Test that the prune-api-cache command reports the deleted responses"""
+        from databass.api.cache import prune_api_cache
+        mocker.patch.object(ResponseCache, "prune", return_value=3)
+        result = sqlite_app.test_cli_runner().invoke(prune_api_cache)
+        assert "3 expired responses deleted" in result.output
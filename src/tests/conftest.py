@@ -0,0 +1,126 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from databass.db.base import app_db
+from databass.db.models import Base
+from databass.db.cache import StatsCache
+from databass.api.discogs import Discogs
+from databass.api.musicbrainz import MusicBrainz
+from databass.api.rate_limit import TokenBucket, RequestScheduler, SharedState
+from databass.image_queue import ImageQueue
+from databass.image_backfill import ImageBackfill
+from databass.image_index import ImageIndex
+from databass.routes import register_routes
+
+
+@pytest.fixture(autouse=True)
+def clear_stats_cache():
+    """StatsCache is process-wide; start every test with an empty cache"""
+    StatsCache.clear()
+    yield
+    StatsCache.clear()
+
+
+@pytest.fixture(autouse=True)
+def discogs_cache_dir(tmp_path, monkeypatch):
+    """Keep the on-disk Discogs response cache of each test in its own temporary directory"""
+    cache_dir = tmp_path / "discogs"
+    monkeypatch.setattr(Discogs, "cache_dir", str(cache_dir))
+    yield cache_dir
+
+
+@pytest.fixture(autouse=True)
+def discogs_rate_limiter(tmp_path, monkeypatch):
+    """Give each test a fresh Discogs rate limiter whose state file is in a temporary directory"""
+    rate_limiter = TokenBucket(str(tmp_path / "discogs.ratelimit"), limit=60, window=60, burst=5)
+    monkeypatch.setattr(Discogs, "rate_limiter", rate_limiter)
+    yield rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def musicbrainz_scheduler(tmp_path, monkeypatch):
+    """Give each test its own MusicBrainz request queue, without the 1 second spacing"""
+    scheduler = RequestScheduler(str(tmp_path / "musicbrainz.queue"), interval=0)
+    monkeypatch.setattr(MusicBrainz, "scheduler", scheduler)
+    yield scheduler
+
+
+@pytest.fixture(autouse=True)
+def image_queue(tmp_path, monkeypatch):
+    """Run image jobs in the calling thread, tracking them in a temporary state file"""
+    monkeypatch.setattr(ImageQueue, "workers", 0)
+    monkeypatch.setattr(ImageQueue, "jobs", SharedState(str(tmp_path / "image_jobs.json")))
+    yield ImageQueue
+    ImageQueue.wait()
+
+
+@pytest.fixture(autouse=True)
+def image_index(tmp_path, monkeypatch):
+    """Save and index images in a temporary directory, starting from an empty index"""
+    monkeypatch.setattr(ImageIndex, "img_dir", str(tmp_path / "img"))
+    ImageIndex.clear()
+    yield ImageIndex
+    ImageIndex.clear()
+
+
+@pytest.fixture(autouse=True)
+def image_backfill(tmp_path, monkeypatch):
+    """Keep the resume state of the image backfill in a temporary directory"""
+    monkeypatch.setattr(ImageBackfill, "state", SharedState(str(tmp_path / "image_backfill.json")))
+    monkeypatch.setattr(ImageBackfill, "progress", {})
+    monkeypatch.setattr(ImageBackfill, "_attempted", [])
+    yield ImageBackfill
+
+
+@pytest.fixture
+def sqlite_app():
+    """
+    Minimal Flask application backed by an in-memory SQLite database,
+    for tests that need to run real queries without a Postgres server.
+    """
+    app = Flask(__name__)
+    app.config.update({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite://",
+    })
+    app_db.init_app(app)
+    with app.app_context():
+        Base.metadata.create_all(app_db.engine)
+        yield app
+        app_db.session.remove()
+
+
+@pytest.fixture
+def query_counter(sqlite_app):
+    """
+    Counts the SQL statements executed against the sqlite_app database.
+    Reset with `query_counter.clear()`; read with `len(query_counter)`.
+    """
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(app_db.engine, "before_cursor_execute", count_statement)
+    yield statements
+    event.remove(app_db.engine, "before_cursor_execute", count_statement)
+
+
+@pytest.fixture
+def image_client(image_index, tmp_path):
+    """Test client for the main routes, backed by an in-memory SQLite database that counts its queries"""
+    placeholder = tmp_path / "root" / "static" / "img" / "none.png"
+    placeholder.parent.mkdir(parents=True)
+    placeholder.write_bytes(b"placeholder")
+    app = Flask("databass", root_path=str(tmp_path / "root"))
+    app.config.update({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    app_db.init_app(app)
+    register_routes(app)
+    statements = []
+    with app.app_context():
+        Base.metadata.create_all(app_db.engine)
+        event.listen(app_db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        with app.test_client() as client:
+            client.statements = statements
+            yield client
+        app_db.session.remove()
@@ -0,0 +1,123 @@
+import pytest
+from databass.db.cache import StatsCache
+
+
+class TestStatsCacheGet:
+    """Tests for StatsCache.get()"""
+
+    def test_get_computes_on_miss(self, mocker):
+        """Test that the value is computed on the first lookup"""
+        compute = mocker.Mock(return_value={"total_listens": 1})
+        result = StatsCache.get('all', compute)
+        assert result == {"total_listens": 1}
+        compute.assert_called_once()
+        assert StatsCache.misses == 1
+        assert StatsCache.hits == 0
+
+    def test_get_serves_from_cache(self, mocker):
+        """Test that repeated lookups are served from memory"""
+        compute = mocker.Mock(return_value=1)
+        for _ in range(3):
+            assert StatsCache.get('all', compute) == 1
+        compute.assert_called_once()
+        assert StatsCache.hits == 2
+        assert StatsCache.misses == 1
+
+    def test_get_separate_keys(self, mocker):
+        """Test that different keys are cached independently"""
+        assert StatsCache.get('a', mocker.Mock(return_value=1)) == 1
+        assert StatsCache.get('b', mocker.Mock(return_value=2)) == 2
+        assert StatsCache.get('a', mocker.Mock(return_value=3)) == 1
+
+    def test_get_expires_after_ttl(self, mocker):
+        """Test that entries older than the TTL are recomputed"""
+        mock_time = mocker.patch('databass.db.cache.time.monotonic', return_value=1000.0)
+        compute = mocker.Mock(side_effect=[1, 2])
+        assert StatsCache.get('all', compute) == 1
+        mock_time.return_value = 1000.0 + StatsCache.ttl + 1
+        assert StatsCache.get('all', compute) == 2
+        assert compute.call_count == 2
+
+    def test_get_does_not_store_stale_value(self, mocker):
+        """Test that a value computed while a write happened is not cached"""
+        def compute():
+            StatsCache.invalidate()
+            return 1
+        StatsCache.get('all', compute)
+        second = mocker.Mock(return_value=2)
+        assert StatsCache.get('all', second) == 2
+        second.assert_called_once()
+
+
+class TestStatsCacheInvalidate:
+    """Tests for StatsCache.invalidate() and StatsCache.invalidate_for()"""
+
+    def test_invalidate_recomputes(self, mocker):
+        """Test that invalidating the cache forces a recomputation"""
+        compute = mocker.Mock(side_effect=[1, 2])
+        StatsCache.get('all', compute)
+        StatsCache.invalidate()
+        assert StatsCache.get('all', compute) == 2
+
+    @pytest.mark.parametrize("table_name, invalidated", [
+        ("release", True),
+        ("artist", True),
+        ("label", True),
+        ("goal", True),
+        ("review", False),
+        (None, False),
+    ])
+    def test_invalidate_for_table(self, table_name, invalidated):
+        """Test that only writes to tables used by the statistics invalidate the cache"""
+        version = StatsCache.version
+        StatsCache.invalidate_for(table_name)
+        assert (StatsCache.version != version) == invalidated
+
+    def test_info(self, mocker):
+        """Test that info() reports the hit/miss counters"""
+        StatsCache.get('all', mocker.Mock(return_value=1))
+        StatsCache.get('all', mocker.Mock(return_value=1))
+        info = StatsCache.info()
+        assert info["hits"] == 1
+        assert info["misses"] == 1
+        assert info["hit_ratio"] == 0.5
+        assert info["size"] == 1
+
+
+class TestOperationsInvalidateStatsCache:
+    """Tests that writes through databass.db.operations invalidate the statistics cache"""
+
+    @pytest.fixture
+    def mock_db_session(self, mocker):
+        session = mocker.patch('databass.db.operations.app_db.session')
+        session.get_bind.return_value.dialect.name = "sqlite"
+        return session
+
+    def test_insert_invalidates(self, mock_db_session, mocker):
+        from databass.db.operations import insert
+        from databass.db.models import Release
+        mock_invalidate = mocker.patch('databass.db.operations.StatsCache.invalidate_for')
+        insert(Release(name="Test"))
+        mock_invalidate.assert_called_once_with("release")
+
+    def test_update_invalidates(self, mock_db_session, mocker):
+        from databass.db.operations import update
+        from databass.db.models import Artist
+        mock_invalidate = mocker.patch('databass.db.operations.StatsCache.invalidate_for')
+        update(Artist(name="Test", id=1))
+        mock_invalidate.assert_called_once_with("artist")
+
+    def test_delete_invalidates(self, mock_db_session, mocker):
+        from databass.db.operations import delete
+        mock_invalidate = mocker.patch('databass.db.operations.StatsCache.invalidate_for')
+        delete(item_type="label", item_id=1)
+        mock_invalidate.assert_called_once_with("label")
+
+    def test_failed_insert_does_not_invalidate(self, mock_db_session, mocker):
+        from databass.db.operations import insert
+        from databass.db.models import Release
+        mock_db_session.commit.side_effect = Exception("boom")
+        mock_invalidate = mocker.patch('databass.db.operations.StatsCache.invalidate_for')
+        with pytest.raises(Exception):
+            insert(Release(name="Test"))
+        mock_invalidate.assert_not_called()
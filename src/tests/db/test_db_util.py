@@ -1,4 +1,7 @@
 import pytest 
+import time
+from datetime import datetime
+from databass.db.base import app_db
 from databass.db.util import *
 
 
@@ -32,100 +35,198 @@ def mock_model_fixture():
     # Could still add a few basic tests for correct error handling though
 
 
-class TestMeanAvgAndCount:
-    # Tests for mean_avg_and_count()
-    @pytest.mark.parametrize(
-        "input_list,expected_avg,expected_count",
-        [
-            ([{"avg": 98, "count": 5},{"avg": 80, "count": 10}], 89.0, 7.5),
-            ([{"avg": 47, "count": 1},{"avg": 53, "count": 4},{"avg": 62, "count": 2}], 54.0, 2.3333333333333335)
-        ]
-    )
-    def test_mean_avg_and_count_success(self, input_list, expected_avg, expected_count, mocker):
-        """
-        Test for proper handling of successful calculation of average and total count
-        """
-        # Construct list of mock objects to be passed to the function
-        mock_list = []
-        for item in input_list:
-            mock_item = mocker.MagicMock()
-            mock_item.average_rating = item["avg"]
-            mock_item.release_count = item["count"]
-            mock_list.append(mock_item)
-
-        result_avg, result_count = mean_avg_and_count(mock_list)
-        assert result_avg == expected_avg
-        assert result_count == expected_count
-
-
-    def test_mean_avg_and_count_fail(self, mocker):
-        """
-        Test for proper handling of invalid input data; invalid element should be discounted from the end calculation
-        """
-        mock_row = mocker.MagicMock()
-        mock_row.average_rating = 60
-        mock_row.release_count = 2
-        entity_list = [{"test": 1}, mock_row]
-        result_avg, result_count = mean_avg_and_count(entity_list)
-        assert result_avg == 60
-        assert result_count == 2
-
-
-class TestBayesianAvg:
-    # Tests for bayesian_avg()
-    @pytest.mark.parametrize(
-        "weight,item_avg,mean_avg",
-        [
-            (2.0, 1.0, None),
-            (2.0, None, 3.0),
-            (None, 1.0, 3.0)
-        ]
-    )
-    def test_bayesian_avg_missing_value(self, weight, item_avg, mean_avg):
-        """
-        Test for correct handling of input with missing values
-        """
-        with pytest.raises(ValueError, match="Input missing one of the required values"):
-            bayesian_avg(
-                    item_weight=weight,
-                    item_avg=item_avg,
-                    mean_avg=mean_avg
-            )
-
-    @pytest.mark.parametrize(
-        "weight,item_avg,mean_avg,expected",
-        [
-            (1.0, 2.0, 3.0, 2.0),
-            (2.0, 3.0, 1.0, 5.0),
-            (3.0, 1.0, 2.0, -1.0)
-        ]
-    )
-    def test_bayesian_avg_correct_return(self, weight, item_avg, mean_avg, expected):
-        """
-        Test for correct handling of valid input
-        """
-        result = bayesian_avg(
-                item_weight=weight,
-                item_avg=item_avg,
-                mean_avg=mean_avg
-        )
-        assert result == expected
-        
-class TestGetAllStats:
-    # Tests for get_all_stats()
-    def test_get_all_stats_success(self):
+class TestGetStats:
+    # Tests for get_stats()
+    def test_get_stats_merges_sections(self, mocker):
         """
-        Test for correct handling of successfully returned stats data
+        Test that the requested sections are computed and merged into one dictionary
         """
+        mock_section = mocker.patch(
+            "databass.db.stats.stats_section",
+            side_effect=lambda name: {name: True}
+        )
+        result = get_stats("totals", "yearly")
+        assert result == {"totals": True, "yearly": True}
+        assert [call.args[0] for call in mock_section.call_args_list] == ["totals", "yearly"]
 
-    def test_get_all_stats_fail(self):
+    def test_get_stats_caches_each_section(self, mocker):
         """
-        Test for successful handling of errored stats function result
+        Test that a section computed for one page is reused by another page needing it
         """
-
+        mock_section = mocker.patch(
+            "databass.db.stats.stats_section",
+            side_effect=lambda name: {name: True}
+        )
+        get_stats("totals", "yearly")
+        get_stats("yearly", "artists")
+        assert [call.args[0] for call in mock_section.call_args_list] == ["totals", "yearly", "artists"]
 
 
 class TestHandleSubmitData:
     # Tests for handle_submit_data()
-    def test_handle_submit_test_success(self):
-        pass
\ No newline at end of file
+
+    @staticmethod
+    def submit_data(**overrides):
+        data = {
+            "mbid": "release-mbid",
+            "release_group_mbid": "group-mbid",
+            "name": "Test Release",
+            "label_mbid": "label-mbid",
+            "label_name": "Test Label",
+            "artist_mbid": "artist-mbid",
+            "artist_name": "Test Artist",
+            "main_genre": "rock",
+            "genres": "",
+            "image": None,
+            "rating": 80,
+            "year": 2000,
+            "track_count": 10,
+            "country": "CA",
+            "listen_date": datetime(2024, 1, 1),
+        }
+        data.update(overrides)
+        return data
+
+    @staticmethod
+    def slow(result, seconds=0.3):
+        def call(*args, **kwargs):
+            time.sleep(seconds)
+            return result
+        return call
+
+    def test_handle_submit_test_success(self, sqlite_app, mocker):
+        """
+        Test that a manual submission inserts the release with its label, artist and genres, then checks the goals
+        """
+        mock_runtime = mocker.patch("databass.api.MusicBrainz.get_release_length")
+        mocker.patch.object(Label, "lookup", return_value={"name": "Test Label"})
+        mocker.patch.object(Artist, "lookup", return_value={"name": "Test Artist"})
+        mocker.patch("databass.api.Util.get_image")
+        mock_check_goals = mocker.patch.object(Goal, "check_goals")
+
+        handle_submit_data(self.submit_data(mbid=None, label_mbid="", artist_mbid="", runtime=1800000,
+                                            genres="jazz,funk"))
+
+        mock_runtime.assert_not_called()
+        release = app_db.session.query(Release).one()
+        assert release.runtime == 1800000
+        assert release.label.name == "Test Label"
+        assert release.artist.name == "Test Artist"
+        assert release.main_genre.name == "rock"
+        assert sorted(genre.name for genre in release.genres) == ["funk", "jazz"]
+        mock_check_goals.assert_called_once_with()
+
+    def test_handle_submit_lookups_run_concurrently(self, sqlite_app, mocker):
+        """
+        Test that lookups which do not wait on MusicBrainz.scheduler (e.g. cache hits) overlap,
+        so submitting takes about as long as the slowest
+        """
+        mocker.patch("databass.api.MusicBrainz.get_release_length", side_effect=self.slow(123000))
+        mocker.patch.object(Label, "lookup", side_effect=self.slow({"name": "Test Label", "mbid": "label-mbid"}))
+        mocker.patch.object(Artist, "lookup", side_effect=self.slow({"name": "Test Artist", "mbid": "artist-mbid"}))
+        mocker.patch("databass.api.Util.get_image")
+        mocker.patch.object(Goal, "check_goals")
+
+        start = time.perf_counter()
+        handle_submit_data(self.submit_data())
+        elapsed = time.perf_counter() - start
+
+        assert elapsed < 0.75
+        release = app_db.session.query(Release).one()
+        assert release.runtime == 123000
+        assert release.label.mbid == "label-mbid"
+        assert release.artist.mbid == "artist-mbid"
+
+    def test_handle_submit_lookups_take_turns_in_scheduler(self, sqlite_app, mocker, musicbrainz_scheduler):
+        """
+        Test that lookups reaching MusicBrainz are spaced by the real scheduler and queued at interactive priority
+        """
+        from databass.api.rate_limit import INTERACTIVE, BACKGROUND
+        musicbrainz_scheduler.interval = 0.2
+        starts = []
+
+        def scheduled(result):
+            def call(*args, **kwargs):
+                musicbrainz_scheduler.acquire()
+                starts.append(time.monotonic())
+                return result
+            return call
+
+        mocker.patch("databass.api.MusicBrainz.get_release_length", side_effect=scheduled(123000))
+        mocker.patch.object(Label, "lookup", side_effect=scheduled({"name": "Test Label", "mbid": "label-mbid"}))
+        mocker.patch.object(Artist, "lookup", side_effect=scheduled({"name": "Test Artist", "mbid": "artist-mbid"}))
+        mocker.patch("databass.api.Util.get_image")
+        mocker.patch.object(Goal, "check_goals")
+
+        handle_submit_data(self.submit_data())
+
+        starts.sort()
+        assert len(starts) == 3
+        assert all(later - earlier >= 0.19 for earlier, later in zip(starts, starts[1:]))
+        info = musicbrainz_scheduler.info()
+        assert info[INTERACTIVE]["requests"] == 3
+        assert info[BACKGROUND]["requests"] == 0
+        assert app_db.session.query(Release).one().runtime == 123000
+
+    def test_handle_submit_skips_lookup_for_existing_entities(self, sqlite_app, mocker):
+        """
+        Test that labels and artists already in the database are not looked up again
+        """
+        from databass.db.operations import insert
+        label_id = insert(Label(name="Test Label", mbid="label-mbid"))
+        mocker.patch("databass.api.MusicBrainz.get_release_length", return_value=0)
+        mock_label_lookup = mocker.patch.object(Label, "lookup")
+        mocker.patch.object(Artist, "lookup", return_value={"name": "Test Artist", "mbid": "artist-mbid"})
+        mocker.patch("databass.api.Util.get_image")
+        mocker.patch.object(Goal, "check_goals")
+
+        handle_submit_data(self.submit_data())
+        mock_label_lookup.assert_not_called()
+        assert app_db.session.query(Release).one().label_id == label_id
+
+    def test_handle_submit_deadline(self, sqlite_app, mocker):
+        """
+        Test that the release is inserted without lookups that miss the deadline
+        """
+        mocker.patch("databass.db.util.ENRICHMENT_DEADLINE", 0.1)
+        mocker.patch("databass.api.MusicBrainz.get_release_length", side_effect=self.slow(123000, seconds=1))
+        mocker.patch.object(Label, "lookup", return_value={"name": "Test Label", "mbid": "label-mbid", "type": "Original Production"})
+        mocker.patch.object(Artist, "lookup", side_effect=self.slow({"name": "Looked Up"}, seconds=1))
+        mocker.patch("databass.api.Util.get_image")
+        mocker.patch.object(Goal, "check_goals")
+
+        start = time.perf_counter()
+        handle_submit_data(self.submit_data())
+        assert time.perf_counter() - start < 0.75
+
+        release = app_db.session.query(Release).one()
+        assert release.runtime == 0
+        assert release.label.type == "Original Production"
+        assert release.artist.name == "Test Artist"
+        assert release.artist.mbid == "artist-mbid"
+
+
+class TestRunConcurrently:
+    # Tests for run_concurrently()
+    def test_run_concurrently_collects_results(self):
+        """
+        Test that results are returned by name and failing calls are left out
+        """
+        def fail():
+            raise ValueError("lookup failed")
+
+        results = run_concurrently({"a": lambda: 1, "b": lambda: 2, "c": fail}, deadline=5)
+        assert results == {"a": 1, "b": 2}
+
+    def test_run_concurrently_empty(self):
+        """
+        Test that no calls return no results
+        """
+        assert run_concurrently({}, deadline=5) == {}
+
+    def test_run_concurrently_app_context(self, sqlite_app):
+        """
+        Test that calls can use the database through the caller's application context
+        """
+        results = run_concurrently({"count": lambda: app_db.session.query(Release).count()}, deadline=5)
+        assert results == {"count": 0}
@@ -1,6 +1,7 @@
 import pytest
 from databass import create_app
 from databass.db.models import Release, Artist, Label, ArtistOrLabel, Goal, Genre
+from databass.db.operations import insert
 from datetime import datetime
 
 
@@ -640,8 +641,8 @@ class TestReleaseHomeData:
     def test_home_data_returns_list(self, mocker):
         """Test that home_data returns a list regardless of whether entries exist"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_order_by = mock_query.return_value.order_by
-        mock_order_by.return_value.all.return_value = []
+        mock_order_by = mock_query.return_value.options.return_value.order_by
+        mock_order_by.return_value.limit.return_value.offset.return_value.all.return_value = []
 
         result = Release.home_data()
         assert isinstance(result, list)
@@ -650,8 +651,8 @@ class TestReleaseHomeData:
     def test_home_data_orders_by_id_desc(self, mocker):
         """Test that home_data orders results by release ID in descending order"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_order_by = mock_query.return_value.order_by
-        mock_order_by.return_value.all.return_value = []
+        mock_order_by = mock_query.return_value.options.return_value.order_by
+        mock_order_by.return_value.limit.return_value.offset.return_value.all.return_value = []
 
         Release.home_data()
 
@@ -674,7 +675,7 @@ class TestReleaseHomeData:
 
         # Patch the query to return a list containing the mock row
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.order_by.return_value.all.return_value = [mock_row]
+        mock_query.return_value.options.return_value.order_by.return_value.limit.return_value.offset.return_value.all.return_value = [mock_row]
 
         # Call the function
         result = Release.home_data()
@@ -706,7 +707,7 @@ class TestReleaseHomeData:
 
         # Patch the query to return a list containing the mock row
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.order_by.return_value.all.return_value = [mock_row]
+        mock_query.return_value.options.return_value.order_by.return_value.limit.return_value.offset.return_value.all.return_value = [mock_row]
 
         # Call the function
         result = Release.home_data()
@@ -719,6 +720,91 @@ class TestReleaseHomeData:
         assert hasattr(row, 'genres')
         assert row.genres is None
 
+    @pytest.mark.parametrize("page, per_page, expected_offset", [
+        (1, 5, 0),
+        (2, 5, 5),
+        (4, 10, 30),
+    ])
+    def test_home_data_limits_to_requested_page(self, mocker, page, per_page, expected_offset):
+        """Test that home_data only fetches the rows for the requested page"""
+        mock_query = mocker.patch('databass.db.base.app_db.session.query')
+        mock_limit = mock_query.return_value.options.return_value.order_by.return_value.limit
+        mock_limit.return_value.offset.return_value.all.return_value = []
+
+        Release.home_data(page=page, per_page=per_page)
+
+        mock_limit.assert_called_once_with(per_page)
+        mock_limit.return_value.offset.assert_called_once_with(expected_offset)
+
+    @pytest.mark.parametrize("page, per_page", [(0, 5), (1, 0), (-1, 5), ("1", 5)])
+    def test_home_data_invalid_page(self, page, per_page):
+        """Test that home_data raises ValueError for invalid page parameters"""
+        with pytest.raises(ValueError, match="page and per_page must be positive integers"):
+            Release.home_data(page=page, per_page=per_page)
+
+class TestReleaseListingQueryCount:
+    """
+    Test suite for the loading strategy of release listing queries (home_data, dynamic_search)
+
+    Uses an in-memory SQLite database to count the statements actually executed.
+    """
+
+    @staticmethod
+    def seed(count):
+        from databass.db.base import app_db
+        rock, jazz = Genre(name="rock"), Genre(name="jazz")
+        artists = [Artist(name=f"Artist {i}") for i in range(3)]
+        label = Label(name="Label")
+        app_db.session.add_all([rock, jazz, label, *artists])
+        app_db.session.commit()
+        for i in range(count):
+            release = Release(
+                name=f"Release {i}",
+                artist_id=artists[i % 3].id,
+                label_id=label.id,
+                year=2000,
+                runtime=1000,
+                rating=50,
+                listen_date=datetime(2024, 1, 1),
+                track_count=10,
+                main_genre_id=rock.id
+            )
+            release.genres = [rock, jazz]
+            app_db.session.add(release)
+        app_db.session.commit()
+        app_db.session.expunge_all()
+
+    @staticmethod
+    def render_rows(releases):
+        # Touch every relationship the home release table renders
+        return [
+            (r.artist.name, r.main_genre.name, [g.name for g in r.genres])
+            for r in releases
+        ]
+
+    @pytest.mark.parametrize("per_page", [1, 5, 20])
+    def test_home_data_query_count_is_constant(self, query_counter, per_page):
+        """Test that a page of releases and its relationships loads in a fixed number of queries"""
+        self.seed(20)
+        query_counter.clear()
+
+        releases = Release.home_data(page=1, per_page=per_page)
+        rows = self.render_rows(releases)
+
+        assert len(rows) == per_page
+        assert len(query_counter) == 2
+
+    def test_dynamic_search_query_count_is_constant(self, query_counter):
+        """Test that search results and their relationships load in a fixed number of queries"""
+        self.seed(12)
+        query_counter.clear()
+
+        releases = Release.dynamic_search({"name": "Release"})
+        rows = self.render_rows(releases)
+
+        assert len(rows) == 12
+        assert len(query_counter) == 2
+
 class TestReleaseListensThisYear:
     """Test suite for Release.listens_this_year class method"""
 
@@ -838,7 +924,7 @@ class TestReleaseDynamicSearch:
     def test_dynamic_search_returns_list(self, mocker):
         """Test that dynamic_search returns a list regardless of search criteria"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.order_by.return_value.all.return_value = []
+        mock_query.return_value.options.return_value.order_by.return_value.all.return_value = []
 
         result = Release.dynamic_search({})
         assert isinstance(result, list)
@@ -876,6 +962,7 @@ class TestReleaseDynamicSearch:
         mock_query = mocker.MagicMock()
         mock_query.filter.return_value = mock_query
         mock_query.where.return_value = mock_query
+        mock_query.options.return_value = mock_query
         mock_query.order_by.return_value = mock_query
         mock_query.all.return_value = []
 
@@ -885,31 +972,39 @@ class TestReleaseDynamicSearch:
         assert isinstance(result, list)
         assert len(result) == 0
 
-    def test_dynamic_search_label_filter(self, mocker):
-        """Test that dynamic_search correctly handles label filtering"""
+    @pytest.mark.parametrize("key, table", [("label", "label"), ("artist", "artist")])
+    def test_dynamic_search_related_name_filter(self, mocker, key, table):
+        """Test that dynamic_search filters on the artist/label name with an EXISTS subquery"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_label = mocker.Mock()
-        mock_label.id = 1
-        mock_exists = mocker.patch('databass.db.models.Label.id_by_matching_name')
-        mock_exists.return_value = [mock_label]
+        mock_ids = mocker.patch(f'databass.db.models.{table.capitalize()}.id_by_matching_name')
 
-        Release.dynamic_search({"label": "Test Label"})
+        Release.dynamic_search({key: "Test"})
 
-        mock_exists.assert_called_once_with(name="Test Label")
-        mock_query.return_value.filter.assert_called()
+        mock_ids.assert_not_called()
+        filter_arg = str(mock_query.return_value.filter.call_args[0][0]).lower()
+        assert 'exists' in filter_arg
+        assert f'lower({table}.name) like lower' in filter_arg
 
-    def test_dynamic_search_artist_filter(self, mocker):
-        """Test that dynamic_search correctly handles artist filtering"""
-        mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_artist = mocker.Mock()
-        mock_artist.id = 1
-        mock_exists = mocker.patch('databass.db.models.Artist.id_by_matching_name')
-        mock_exists.return_value = [mock_artist]
+    def test_dynamic_search_related_name_filter_single_statement(self, query_counter):
+        """Test that artist and label filters run as one statement and match on substrings"""
+        from databass.db.base import app_db
+        genre, label, other_label = Genre(name="rock"), Label(name="Warp"), Label(name="Sub Pop")
+        artists = [Artist(name="The Band"), Artist(name="The Other"), Artist(name="Solo")]
+        app_db.session.add_all([genre, label, other_label, *artists])
+        app_db.session.commit()
+        for artist, release_label in zip(artists, [label, label, other_label]):
+            app_db.session.add(Release(
+                name=f"{artist.name} LP", artist_id=artist.id, label_id=release_label.id, year=2000,
+                runtime=1000, rating=50, listen_date=datetime(2024, 1, 1), track_count=10,
+                main_genre_id=genre.id
+            ))
+        app_db.session.commit()
+        query_counter.clear()
 
-        Release.dynamic_search({"artist": "Test Artist"})
+        result = Release.search_query({"artist": "the", "label": "war"}).order_by(Release.id).all()
 
-        mock_exists.assert_called_once_with(name="Test Artist")
-        mock_query.return_value.filter.assert_called()
+        assert [release.name for release in result] == ["The Band LP", "The Other LP"]
+        assert len(query_counter) == 1
 
     def test_dynamic_search_comparison_filters(self, mocker):
         """Test that dynamic_search correctly handles comparison filters"""
@@ -932,6 +1027,7 @@ class TestReleaseDynamicSearch:
         mock_query_instance = mock_query.return_value
         mock_filter = mock_query_instance.filter
         mock_filter.return_value = mock_query_instance  # Allow filter chaining
+        mock_query_instance.options.return_value = mock_query_instance
 
         # Mock the Genre.exists_by_name method
         mock_genre_lookup = mocker.patch('databass.models.Genre.exists_by_name')
@@ -1079,6 +1175,40 @@ class TestReleaseCreateNew:
         Release.create_new(test_data)
         mock_construct.assert_called_once_with('release', test_data)
 
+    def test_create_new_queues_one_image_job(self, mocker):
+        """Test that create_new queues a single background image lookup instead of fetching it inline"""
+        mocker.patch('databass.db.operations.construct_item')
+        mocker.patch('databass.db.operations.insert', return_value=42)
+        mock_get_image = mocker.patch('databass.api.Util.get_image')
+        mock_enqueue = mocker.patch('databass.image_queue.ImageQueue.enqueue')
+
+        test_data = {
+            "name": "Test Release",
+            "artist_name": "Test Artist",
+            "label_name": "Test Label",
+            "release_group_mbid": "test-mbid",
+            "image": None
+        }
+
+        Release.create_new(test_data)
+        mock_enqueue.assert_called_once_with(
+            "release", 42,
+            release_name="Test Release",
+            artist_name="Test Artist",
+            label_name="Test Label",
+            mbid="test-mbid"
+        )
+        mock_get_image.assert_not_called()
+
+    def test_create_new_queues_image_url(self, mocker):
+        """Test that a user-provided image URL is downloaded instead of searched for"""
+        mocker.patch('databass.db.operations.construct_item')
+        mocker.patch('databass.db.operations.insert', return_value=42)
+        mock_enqueue = mocker.patch('databass.image_queue.ImageQueue.enqueue')
+
+        Release.create_new({"name": "Test Release", "image": "https://example.com/a.jpg"})
+        mock_enqueue.assert_called_once_with("release", 42, url="https://example.com/a.jpg")
+
     def test_create_new_missing_required_fields(self, mocker):
         """Test that create_new handles missing required fields appropriately"""
         mock_construct = mocker.patch('databass.db.operations.construct_item')
@@ -1098,7 +1228,7 @@ class TestArtistOrLabelFrequencyHighest:
     def test_frequency_highest_returns_list(self, mocker):
         """Test that frequency_highest returns a list regardless of whether entries exist"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.join.return_value.where.return_value.group_by.return_value.order_by.return_value.limit.return_value.all.return_value = []
+        mock_query.return_value.join.return_value.where.return_value.where.return_value.order_by.return_value.limit.return_value.all.return_value = []
 
         result = Artist.frequency_highest()
         assert isinstance(result, list)
@@ -1113,7 +1243,7 @@ class TestArtistOrLabelFrequencyHighest:
         """Test that frequency_highest returns the correct number of entries based on limit parameter"""
         mock_entries = [mocker.Mock() for _ in range(expected_count)]
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.join.return_value.where.return_value.group_by.return_value.order_by.return_value.limit.return_value.all.return_value = mock_entries
+        mock_query.return_value.join.return_value.where.return_value.where.return_value.order_by.return_value.limit.return_value.all.return_value = mock_entries
 
         result = Artist.frequency_highest(limit=limit)
         assert len(result) == expected_count
@@ -1122,7 +1252,7 @@ class TestArtistOrLabelFrequencyHighest:
         """Test that frequency_highest orders results by count in descending order"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
         mock_order = mocker.Mock()
-        mock_query.return_value.join.return_value.where.return_value.group_by.return_value.order_by = mock_order
+        mock_query.return_value.join.return_value.where.return_value.where.return_value.order_by = mock_order
         mock_order.return_value.limit.return_value.all.return_value = []
 
         Artist.frequency_highest()
@@ -1138,7 +1268,7 @@ class TestArtistOrLabelFrequencyHighest:
         mock_result.image = "test.jpg"
 
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.join.return_value.where.return_value.group_by.return_value.order_by.return_value.limit.return_value.all.return_value = [mock_result]
+        mock_query.return_value.join.return_value.where.return_value.where.return_value.order_by.return_value.limit.return_value.all.return_value = [mock_result]
 
         result = Artist.frequency_highest()
         assert len(result) == 1
@@ -1162,16 +1292,16 @@ class TestArtistOrLabelFrequencyHighest:
             Artist.frequency_highest(limit=invalid_limit)
 
     def test_frequency_highest_joins_correct_tables(self, mocker):
-        """Test that frequency_highest performs the correct table joins"""
+        """Test that frequency_highest reads the counts from the rollup table"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
         mock_join = mocker.Mock()
         mock_query.return_value.join = mock_join
-        mock_join.return_value.where.return_value.group_by.return_value.order_by.return_value.limit.return_value.all.return_value = []
+        mock_join.return_value.where.return_value.where.return_value.order_by.return_value.limit.return_value.all.return_value = []
 
         Artist.frequency_highest()
 
         join_args = mock_join.call_args[0]
-        assert 'Release' in str(join_args)
+        assert 'EntityRollup' in str(join_args)
 
 class TestArtistOrLabelAverageRatingsAndTotalCounts:
     """Test suite for ArtistOrLabel.average_ratings_and_total_counts class method"""
@@ -1194,29 +1324,29 @@ class TestArtistOrLabelAverageRatingsAndTotalCounts:
     def test_average_ratings_and_total_counts_queries_correct_columns(self, mocker):
         """Test that average_ratings_and_total_counts queries the expected columns"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_query.return_value.join.return_value.where.return_value.having.return_value.group_by.return_value.all.return_value = []
+        mock_query.return_value.join.return_value.where.return_value.where.return_value.order_by.return_value.all.return_value = []
 
         Artist.average_ratings_and_total_counts()
 
         # Verify the correct columns are being queried
         query_args = mock_query.call_args[0]
-        expected_columns = ['id', 'name', 'avg', 'count', 'image']
+        expected_columns = ['id', 'name', 'rating_sum', 'release_count', 'image']
         for column in expected_columns:
             assert any(column in str(arg).lower() for arg in query_args)
 
-    def test_average_ratings_and_total_counts_joins_release_table(self, mocker):
-        """Test that average_ratings_and_total_counts performs the correct table join with Release"""
+    def test_average_ratings_and_total_counts_joins_rollup_table(self, mocker):
+        """Test that average_ratings_and_total_counts reads the aggregates from the rollup table"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
         mock_join = mocker.Mock()
         mock_query.return_value.join = mock_join
-        mock_join.return_value.where.return_value.having.return_value.group_by.return_value.all.return_value = []
+        mock_join.return_value.where.return_value.where.return_value.order_by.return_value.all.return_value = []
 
         Artist.average_ratings_and_total_counts()
 
-        # Verify join with Release table
+        # Verify join with the rollup table
         mock_join.assert_called_once()
         join_args = mock_join.call_args[0]
-        assert 'Release' in str(join_args)
+        assert 'EntityRollup' in str(join_args)
 
     @pytest.mark.parametrize("model_class", [Artist, Label])
     def test_average_ratings_and_total_counts_works_for_both_models(self, mocker, model_class):
@@ -1245,60 +1375,82 @@ class TestArtistOrLabelAverageRatingsAndTotalCounts:
     def test_average_ratings_and_total_counts_filters_by_minimum_releases(self, mocker):
         """Test that average_ratings_and_total_counts filters entities with more than one release"""
         mock_query = mocker.patch('databass.db.base.app_db.session.query')
-        mock_having = mocker.Mock()
-        mock_query.return_value.join.return_value.where.return_value.having = mock_having
-        mock_having.return_value.group_by.return_value.all.return_value = []
+        mock_where = mocker.Mock()
+        mock_query.return_value.join.return_value.where.return_value.where = mock_where
+        mock_where.return_value.order_by.return_value.all.return_value = []
 
         Artist.average_ratings_and_total_counts()
 
-        # Verify HAVING clause requires more than one release
-        having_arg = mock_having.call_args[0][0]
-        assert 'count' in str(having_arg).lower()
-        assert 'count(release.id)' in str(having_arg)
+        # Verify the filter requires more than one release
+        where_arg = mock_where.call_args[0][0]
+        assert 'entity_rollup.release_count >' in str(where_arg)
+        assert where_arg.right.value == 1
 
 class TestArtistOrLabelAverageRatingsBayesian:
-    """Test suite for ArtistOrLabel.average_ratings_bayesian class method"""
+    """
+    Test suite for ArtistOrLabel.average_ratings_bayesian class method
 
-    def test_average_ratings_bayesian_returns_list(self, mocker):
-        """Test that average_ratings_bayesian returns a list regardless of whether entries exist"""
-        mock_ratings = mocker.patch('databass.db.models.ArtistOrLabel.average_ratings_and_total_counts')
-        mock_ratings.return_value = []
+    The calculation runs in SQL, so these tests use an in-memory SQLite database.
+    """
 
+    @staticmethod
+    def seed(ratings_by_artist):
+        from databass.db.base import app_db
+        genre = Genre(name="rock")
+        label = Label(name="Label")
+        app_db.session.add_all([genre, label])
+        app_db.session.commit()
+        for name, ratings in ratings_by_artist.items():
+            artist = Artist(name=name, image=f"{name}.jpg")
+            app_db.session.add(artist)
+            app_db.session.commit()
+            for i, rating in enumerate(ratings):
+                # Inserted through operations so the rollups are maintained
+                insert(Release(
+                    name=f"{name} {i}",
+                    artist_id=artist.id,
+                    label_id=label.id,
+                    year=2000,
+                    runtime=1000,
+                    rating=rating,
+                    listen_date=datetime(2024, 1, 1),
+                    track_count=10,
+                    main_genre_id=genre.id
+                ))
+
+    @staticmethod
+    def python_bayesian(ratings_by_artist):
+        # Reference implementation: the per-entity loop the query replaces
+        entities = {name: ratings for name, ratings in ratings_by_artist.items() if len(ratings) > 1}
+        averages = {name: int(sum(r) / len(r)) for name, r in entities.items()}
+        mean_avg = sum(averages.values()) / len(entities)
+        mean_count = sum(len(r) for r in entities.values()) / len(entities)
+        results = {}
+        for name, ratings in entities.items():
+            weight = len(ratings) / (len(ratings) + mean_count)
+            results[name] = round(weight * averages[name] + (1 - weight) * mean_avg)
+        return results
+
+    def test_average_ratings_bayesian_returns_list(self, sqlite_app):
+        """Test that average_ratings_bayesian returns a list regardless of whether entries exist"""
         result = Artist.average_ratings_bayesian()
         assert isinstance(result, list)
 
-    @pytest.mark.parametrize("sort_order,expected_order", [
+    def test_average_ratings_bayesian_empty_database(self, sqlite_app):
+        """Test that average_ratings_bayesian handles empty database correctly"""
+        assert Artist.average_ratings_bayesian() == []
+
+    @pytest.mark.parametrize("sort_order,is_descending", [
         ('desc', True),
         ('asc', False)
     ])
-    def test_average_ratings_bayesian_sort_order(self, mocker, sort_order, expected_order):
+    def test_average_ratings_bayesian_sort_order(self, sqlite_app, sort_order, is_descending):
         """Test that average_ratings_bayesian sorts results correctly based on sort_order parameter"""
-        mock_entity = mocker.Mock()
-        mock_entity.id = 1
-        mock_entity.name = "Test Entity"
-        mock_entity.average_rating = 4
-        mock_entity.release_count = 10
-        mock_entity.image = "test.jpg"
-
-        mock_ratings = mocker.patch('databass.db.models.ArtistOrLabel.average_ratings_and_total_counts')
-        mock_ratings.return_value = [mock_entity]
-
+        self.seed({"A": [90, 95, 100], "B": [10, 20], "C": [50, 60, 70, 80]})
         result = Artist.average_ratings_bayesian(sort_order=sort_order)
-        assert len(result) > 0
-        assert isinstance(result[0], dict)
-
-        # Verify sort order was applied correctly
-        if len(result) > 1:
-            is_descending = result[0]['rating'] >= result[1]['rating']
-            assert is_descending == expected_order
-
-    def test_average_ratings_bayesian_empty_database(self, mocker):
-        """Test that average_ratings_bayesian handles empty database correctly"""
-        mock_ratings = mocker.patch('databass.db.models.ArtistOrLabel.average_ratings_and_total_counts')
-        mock_ratings.return_value = []
-
-        result = Artist.average_ratings_bayesian()
-        assert result == []
+        ratings = [item['rating'] for item in result]
+        assert len(ratings) == 3
+        assert ratings == sorted(ratings, reverse=is_descending)
 
     @pytest.mark.parametrize("invalid_sort_order", [
         None,
@@ -1313,43 +1465,54 @@ class TestArtistOrLabelAverageRatingsBayesian:
         with pytest.raises(ValueError, match="Unrecognized sort order"):
             Artist.average_ratings_bayesian(sort_order=invalid_sort_order)
 
-    def test_average_ratings_bayesian_calculation(self, mocker):
-        """Test that average_ratings_bayesian calculates Bayesian averages correctly"""
-        mock_entity1 = mocker.Mock()
-        mock_entity1.id = 1
-        mock_entity1.name = "Entity 1"
-        mock_entity1.average_rating = 4
-        mock_entity1.release_count = 10
-        mock_entity1.image = "test1.jpg"
-
-        mock_entity2 = mocker.Mock()
-        mock_entity2.id = 2
-        mock_entity2.name = "Entity 2"
-        mock_entity2.average_rating = 5
-        mock_entity2.release_count = 5
-        mock_entity2.image = "test2.jpg"
-
-        mock_ratings = mocker.patch('databass.db.models.ArtistOrLabel.average_ratings_and_total_counts')
-        mock_ratings.return_value = [mock_entity1, mock_entity2]
+    @pytest.mark.parametrize("invalid_limit", [0, -1, "10"])
+    def test_average_ratings_bayesian_invalid_limit(self, invalid_limit):
+        """Test that average_ratings_bayesian raises ValueError for invalid limits"""
+        with pytest.raises(ValueError, match="Limit must be a positive integer."):
+            Artist.average_ratings_bayesian(limit=invalid_limit)
 
+    def test_average_ratings_bayesian_calculation(self, sqlite_app):
+        """Test that average_ratings_bayesian matches the per-entity Python calculation"""
+        ratings = {"A": [90, 95, 100], "B": [10, 20], "C": [50, 60, 70, 80], "D": [77, 33, 61]}
+        self.seed(ratings)
         result = Artist.average_ratings_bayesian()
-        assert len(result) == 2
+        assert {item['name']: item['rating'] for item in result} == self.python_bayesian(ratings)
         assert all(key in result[0] for key in ['id', 'name', 'rating', 'image', 'count'])
+        assert result[0]['image'] == "A.jpg"
+        assert result[0]['count'] == 3
 
-    def test_average_ratings_bayesian_rounding(self, mocker):
-        """Test that average_ratings_bayesian rounds ratings correctly"""
-        mock_entity = mocker.Mock()
-        mock_entity.id = 1
-        mock_entity.name = "Test Entity"
-        mock_entity.average_rating = 4.6789
-        mock_entity.release_count = 10
-        mock_entity.image = "test.jpg"
+    def test_average_ratings_bayesian_excludes_single_releases(self, sqlite_app):
+        """Test that entities with a single release, and placeholder names, are not ranked"""
+        self.seed({"A": [90, 95], "B": [100], "Various Artists": [100, 100]})
+        result = Artist.average_ratings_bayesian()
+        assert [item['name'] for item in result] == ["A"]
+
+    def test_average_ratings_bayesian_limit(self, query_counter):
+        """Test that the limit is applied in the single query"""
+        self.seed({f"Artist {i}": [50 + 10 * i, 50] for i in range(5)})
+        query_counter.clear()
+        result = Artist.average_ratings_bayesian(limit=2)
+        assert [item['name'] for item in result] == ["Artist 4", "Artist 3"]
+        assert len(query_counter) == 1
+        assert "LIMIT" in query_counter[0]
+
+    def test_average_ratings_bayesian_unbounded_by_default(self, sqlite_app):
+        """Test that every ranked entity is returned when no limit is given"""
+        self.seed({f"Artist {i}": [50 + i, 50] for i in range(12)})
+        result = Artist.average_ratings_bayesian()
+        assert len(result) == 12
 
-        mock_ratings = mocker.patch('databass.db.models.ArtistOrLabel.average_ratings_and_total_counts')
-        mock_ratings.return_value = [mock_entity]
+    def test_average_ratings_bayesian_matches_leaderboard(self, sqlite_app):
+        """Test that the method and the stats page leaderboard rank entities identically"""
+        from databass.db.stats import leaderboards
+        self.seed({"A": [90, 95, 100], "B": [10, 20], "C": [50, 60, 70, 80], "D": [77, 33, 61]})
+        assert leaderboards(Artist)["top_rated_artists"] == Artist.average_ratings_bayesian(limit=10)
 
+    def test_average_ratings_bayesian_rounding(self, sqlite_app):
+        """Test that average_ratings_bayesian rounds ratings correctly"""
+        self.seed({"A": [46, 47], "B": [81, 90, 99]})
         result = Artist.average_ratings_bayesian()
-        assert isinstance(result[0]['rating'], int)
+        assert all(isinstance(item['rating'], int) for item in result)
 
 class TestArtistOrLabelDynamicSearch:
     """Test suite for ArtistOrLabel.dynamic_search class method"""
@@ -1576,3 +1739,234 @@ class TestGenreCreateGenres:
                 mocker.call('genre', {"name": " electronic"})
             ]
             mock_construct.assert_has_calls(expected_calls)
+
+class TestEntityRollup:
+    """
+    Test suite for EntityRollup and its maintenance by databass.db.operations
+
+    Uses an in-memory SQLite database so the incremental updates can be compared with a full rebuild.
+    """
+
+    @staticmethod
+    def seed():
+        from databass.db.base import app_db
+        genre = Genre(name="rock")
+        label = Label(name="Label")
+        artists = [Artist(name="A"), Artist(name="B")]
+        app_db.session.add_all([genre, label, *artists])
+        app_db.session.commit()
+        return genre, label, artists
+
+    @staticmethod
+    def new_release(name, artist, label, genre, rating, runtime=1000):
+        return Release(
+            name=name,
+            artist_id=artist.id,
+            label_id=label.id,
+            year=2000,
+            runtime=runtime,
+            rating=rating,
+            listen_date=datetime(2024, 1, 1),
+            track_count=10,
+            main_genre_id=genre.id
+        )
+
+    @staticmethod
+    def rollups():
+        from databass.db.base import app_db
+        from databass.db.models import EntityRollup
+        return {
+            (row.entity_type, row.entity_id): (row.release_count, row.rating_sum, row.runtime_sum)
+            for row in app_db.session.query(EntityRollup).all()
+            if row.release_count
+        }
+
+    def assert_matches_rebuild(self):
+        from databass.db.models import EntityRollup
+        incremental = self.rollups()
+        EntityRollup.rebuild()
+        assert incremental == self.rollups()
+
+    def test_insert_adds_to_rollups(self, sqlite_app):
+        """Test that inserting releases adds to the artist and label rollups"""
+        genre, label, (a, b) = self.seed()
+        insert(self.new_release("1", a, label, genre, 80, 1000))
+        insert(self.new_release("2", a, label, genre, 60, 2000))
+        assert self.rollups() == {
+            ("artist", a.id): (2, 140, 3000),
+            ("label", label.id): (2, 140, 3000),
+        }
+        self.assert_matches_rebuild()
+
+    def test_update_moves_release_between_artists(self, sqlite_app):
+        """Test that updating a release's artist and rating adjusts both artists' rollups"""
+        from databass.db.operations import update
+        genre, label, (a, b) = self.seed()
+        release_id = insert(self.new_release("1", a, label, genre, 80))
+        insert(self.new_release("2", a, label, genre, 60))
+
+        changed = Release(id=release_id, artist_id=b.id, label_id=label.id, rating=90)
+        update(changed)
+
+        rollups = self.rollups()
+        assert rollups[("artist", a.id)] == (1, 60, 1000)
+        assert rollups[("artist", b.id)] == (1, 90, 1000)
+        assert rollups[("label", label.id)] == (2, 150, 2000)
+        self.assert_matches_rebuild()
+
+    def test_insert_with_string_rating(self, sqlite_app):
+        """Test that a release submitted by a form, with the rating as a string, is added to the rollups"""
+        genre, label, (a, b) = self.seed()
+        insert(self.new_release("1", a, label, genre, "85", "1000"))
+        assert self.rollups()[("artist", a.id)] == (1, 85, 1000)
+        self.assert_matches_rebuild()
+
+    def test_update_with_string_rating(self, sqlite_app):
+        """Test that a rating edited through a form, as a string, adjusts the rollups"""
+        from databass.db.operations import update
+        genre, label, (a, b) = self.seed()
+        release_id = insert(self.new_release("1", a, label, genre, 80))
+
+        update(Release(id=release_id, artist_id=a.id, label_id=label.id, rating="90"))
+
+        assert self.rollups()[("artist", a.id)] == (1, 90, 1000)
+        assert self.rollups()[("label", label.id)] == (1, 90, 1000)
+        self.assert_matches_rebuild()
+
+    def test_delete_release_subtracts_from_rollups(self, sqlite_app):
+        """Test that deleting a release subtracts it from the rollups"""
+        from databass.db.operations import delete
+        genre, label, (a, b) = self.seed()
+        release_id = insert(self.new_release("1", a, label, genre, 80))
+        insert(self.new_release("2", b, label, genre, 60))
+
+        delete("release", release_id)
+
+        assert ("artist", a.id) not in self.rollups()
+        assert self.rollups()[("label", label.id)] == (1, 60, 1000)
+        self.assert_matches_rebuild()
+
+    def test_delete_artist_subtracts_its_releases(self, sqlite_app):
+        """Test that deleting an artist, which also deletes its releases, updates the label rollup"""
+        from databass.db.operations import delete
+        genre, label, (a, b) = self.seed()
+        insert(self.new_release("1", a, label, genre, 80))
+        insert(self.new_release("2", a, label, genre, 70))
+        insert(self.new_release("3", b, label, genre, 60))
+
+        delete("artist", a.id)
+
+        assert self.rollups() == {
+            ("artist", b.id): (1, 60, 1000),
+            ("label", label.id): (1, 60, 1000),
+        }
+        self.assert_matches_rebuild()
+
+    def test_rebuild_rollups_backfills_existing_releases(self, sqlite_app):
+        """Test that the rebuild-rollups command backfills releases written before the rollups existed"""
+        from databass.db.base import app_db
+        from databass.db.models import rebuild_rollups
+        genre, label, (a, b) = self.seed()
+        app_db.session.add(self.new_release("1", a, label, genre, 80))
+        app_db.session.commit()
+        assert self.rollups() == {}
+
+        result = sqlite_app.test_cli_runner().invoke(rebuild_rollups)
+
+        assert "2 rollups rebuilt" in result.output
+        assert self.rollups() == {
+            ("artist", a.id): (1, 80, 1000),
+            ("label", label.id): (1, 80, 1000),
+        }
+
+    def test_rebuild_if_empty_after_upgrade(self, sqlite_app):
+        """Test that releases written before the rollups existed are rolled up once, at startup"""
+        from databass.db.base import app_db
+        from databass.db.models import EntityRollup
+        genre, label, (a, b) = self.seed()
+        app_db.session.add(self.new_release("1", a, label, genre, 80))
+        app_db.session.commit()
+
+        assert EntityRollup.rebuild_if_empty()
+        assert self.rollups() == {
+            ("artist", a.id): (1, 80, 1000),
+            ("label", label.id): (1, 80, 1000),
+        }
+        assert not EntityRollup.rebuild_if_empty()
+
+    def test_rebuild_if_empty_without_releases(self, sqlite_app):
+        """Test that a new database, without releases, is not rebuilt"""
+        from databass.db.models import EntityRollup
+        self.seed()
+        assert not EntityRollup.rebuild_if_empty()
+
+    def test_rollup_upsert_is_one_statement(self, query_counter):
+        """Test that a write adjusts existing and new rollups in a single upsert"""
+        from databass.db.models import EntityRollup
+        genre, label, (a, b) = self.seed()
+        insert(self.new_release("1", a, label, genre, 80))
+        a_id, b_id, label_id = a.id, b.id, label.id
+        query_counter.clear()
+
+        EntityRollup.apply_change(before=[], after=[
+            {"artist_id": a_id, "label_id": label_id, "rating": 60, "runtime": 500},
+            {"artist_id": b_id, "label_id": label_id, "rating": 40, "runtime": 500},
+        ])
+
+        assert len(query_counter) == 1
+        assert "ON CONFLICT" in query_counter[0]
+        assert self.rollups() == {
+            ("artist", a_id): (2, 140, 1500),
+            ("artist", b_id): (1, 40, 500),
+            ("label", label_id): (3, 180, 2000),
+        }
+
+    def test_leaderboards_read_rollups(self, query_counter):
+        """Test that the leaderboard queries do not scan the release table"""
+        genre, label, (a, b) = self.seed()
+        insert(self.new_release("1", a, label, genre, 80))
+        insert(self.new_release("2", a, label, genre, 60))
+        query_counter.clear()
+
+        assert Artist.frequency_highest() == [{"name": "A", "count": 2, "image": None}]
+        assert Artist.average_ratings_and_total_counts()[0].average_rating == 70
+        assert Artist.average_ratings_bayesian()[0]["rating"] == 70
+        assert all("FROM release" not in statement for statement in query_counter)
+
+class TestNameSearch:
+    """Test suite for name_contains() and the trigram name indexes"""
+
+    @pytest.mark.parametrize("term, expected", [
+        ("ank", ["Frank", "Tanks 100%"]),
+        ("ANK", ["Frank", "Tanks 100%"]),
+        ("100%", ["Tanks 100%"]),
+        ("%", ["Tanks 100%"]),
+        ("_", ["Under_score"]),
+        ("zzz", []),
+    ])
+    def test_name_contains_matches_substrings_literally(self, sqlite_app, term, expected):
+        """Test that the match is a case-insensitive substring match with wildcards escaped"""
+        from databass.db.base import app_db
+        from databass.db.models import name_contains
+        app_db.session.add_all([Artist(name=name) for name in ["Frank", "Tanks 100%", "Under_score", "Other"]])
+        app_db.session.commit()
+        result = app_db.session.query(Artist.name).filter(name_contains(Artist.name, term)).order_by(Artist.name)
+        assert [row.name for row in result] == expected
+
+    @pytest.mark.parametrize("model", [Release, Artist, Label])
+    def test_trigram_index_declared_for_postgres(self, model):
+        """Test that each searchable table declares a GIN trigram index on name for PostgreSQL"""
+        from sqlalchemy.schema import CreateIndex
+        from sqlalchemy.dialects import postgresql
+        index = next(i for i in model.__table__.indexes if i.name == f"ix_{model.__tablename__}_name_trgm")
+        ddl = str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+        assert "USING gin (name gin_trgm_ops)" in ddl
+
+    def test_trigram_index_skipped_on_other_engines(self, sqlite_app):
+        """Test that the trigram indexes are not created on SQLite"""
+        from sqlalchemy import inspect
+        from databass.db.base import app_db
+        from databass.db.models import create_search_indexes
+        create_search_indexes(app_db.engine)
+        index_names = [index["name"] for index in inspect(app_db.engine).get_indexes("artist")]
+        assert "ix_artist_name_trgm" not in index_names
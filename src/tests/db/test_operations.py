@@ -24,7 +24,10 @@ def mock_model_fixture():
 @pytest.fixture
 def mock_db_session(mocker):
     """Fixture to mock database session"""
-    return mocker.patch('databass.db.operations.app_db.session')
+    session = mocker.patch('databass.db.operations.app_db.session')
+    # The rollup upsert is built for the session's dialect
+    session.get_bind.return_value.dialect.name = "sqlite"
+    return session
 
 class TestGetModel:
     # Tests for get_model()
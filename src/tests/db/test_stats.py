@@ -0,0 +1,181 @@
+import pytest
+from datetime import datetime, date
+from databass.db.base import app_db
+from databass.db.models import Release, Artist, Label, Genre
+from databass.db import stats
+from databass.db.operations import insert
+
+
+def seed_releases(ratings_by_artist: dict, label_name: str = "Label"):
+    """
+    Insert one artist per key of `ratings_by_artist` with one release per rating,
+    all on the same label.
+    """
+    genre = Genre(name="rock")
+    label = Label(name=label_name, date_added=date.today())
+    app_db.session.add_all([genre, label])
+    app_db.session.commit()
+    for artist_name, ratings in ratings_by_artist.items():
+        artist = Artist(name=artist_name, date_added=date.today())
+        app_db.session.add(artist)
+        app_db.session.commit()
+        for i, rating in enumerate(ratings):
+            insert(Release(
+                name=f"{artist_name} {i}",
+                artist_id=artist.id,
+                label_id=label.id,
+                year=2000,
+                runtime=600000,
+                rating=rating,
+                listen_date=datetime(2024, 1, 1),
+                track_count=10,
+                main_genre_id=genre.id,
+                date_added=date.today()
+            ))
+
+
+class TestGlobalTotals:
+    """Test suite for stats.global_totals()"""
+
+    def test_global_totals_empty_database(self, sqlite_app):
+        """Test that an empty database produces zeroes"""
+        result = stats.global_totals()
+        assert result["total_listens"] == 0
+        assert result["average_rating"] == 0
+        assert result["average_runtime"] == 0
+        assert result["total_runtime"] == 0
+
+    def test_global_totals_values(self, sqlite_app):
+        """Test that the totals match the values calculated by the model methods"""
+        seed_releases({"A": [40, 60], "B": [80]})
+        result = stats.global_totals()
+        assert result["total_listens"] == Release.total_count() == 3
+        assert result["total_artists"] == Artist.total_count() == 2
+        assert result["total_labels"] == Label.total_count() == 1
+        assert result["average_rating"] == Release.ratings_average() == 60
+        assert result["average_runtime"] == Release.average_runtime() == 10
+        assert result["total_runtime"] == Release.total_runtime() == 0.5
+
+    def test_global_totals_single_statement(self, query_counter):
+        """Test that the totals are calculated in a single statement"""
+        seed_releases({"A": [40, 60]})
+        query_counter.clear()
+        stats.global_totals()
+        assert len(query_counter) == 1
+
+    def test_totals_from_row_none(self):
+        """Test that a failed query produces zeroes rather than raising"""
+        result = stats.totals_from_row(None)
+        assert result["total_listens"] == 0
+        assert result["total_runtime"] == 0
+
+
+class TestYearlyRates:
+    """Test suite for stats.yearly_rates()"""
+
+    def test_yearly_rates_values(self, sqlite_app):
+        """Test that the yearly counts and rates match the values calculated by the model methods"""
+        seed_releases({"A": [40, 60], "B": [80]})
+        result = stats.yearly_rates()
+        assert result["releases_this_year"] == Release.added_this_year() == 3
+        assert result["artists_this_year"] == Artist.added_this_year() == 2
+        assert result["labels_this_year"] == Label.added_this_year() == 1
+        assert result["releases_per_day"] == Release.added_per_day_this_year()
+        assert "total_listens" not in result
+
+    def test_yearly_rates_single_statement(self, query_counter):
+        """Test that the yearly rates are calculated in a single statement"""
+        query_counter.clear()
+        stats.yearly_rates()
+        assert len(query_counter) == 1
+
+    def test_yearly_from_row_none(self):
+        """Test that a failed query produces zeroes rather than raising"""
+        result = stats.yearly_from_row(None)
+        assert result["releases_this_year"] == 0
+        assert result["labels_per_day"] == 0
+
+
+class TestLeaderboards:
+    """Test suite for stats.leaderboards()"""
+
+    def test_leaderboards_invalid_limit(self):
+        """Test that a non-positive limit raises ValueError"""
+        with pytest.raises(ValueError, match="Limit must be a positive integer."):
+            stats.leaderboards(limit=0)
+
+    def test_leaderboards_match_model_methods(self, sqlite_app):
+        """Test that the leaderboards contain the same values as the model methods"""
+        seed_releases({
+            "A": [90, 80, 85],
+            "B": [70, 75],
+            "C": [100],
+            "Various Artists": [10, 20, 30, 40],
+        })
+        result = stats.leaderboards()
+
+        assert result["top_frequent_artists"] == Artist.frequency_highest()
+        assert result["top_rated_artists"] == Artist.average_ratings_bayesian()
+        expected_average = [
+            dict(row._mapping) for row in Artist.average_ratings_and_total_counts()
+        ]
+        assert result["top_average_artists"] == expected_average
+        assert result["top_frequent_labels"] == [{"name": "Label", "count": 10, "image": None}]
+
+    def test_leaderboards_exclude_single_release_from_averages(self, sqlite_app):
+        """Test that entities with one release only appear in the frequency leaderboard"""
+        seed_releases({"A": [50, 60], "C": [100]})
+        result = stats.leaderboards()
+        assert [item["name"] for item in result["top_frequent_artists"]] == ["A", "C"]
+        assert [item["name"] for item in result["top_average_artists"]] == ["A"]
+        assert [item["name"] for item in result["top_rated_artists"]] == ["A"]
+
+    def test_leaderboards_respect_limit(self, sqlite_app):
+        """Test that each leaderboard is truncated to the limit"""
+        seed_releases({f"Artist {i}": [50 + 10 * i, 50] for i in range(5)})
+        result = stats.leaderboards(limit=3)
+        assert len(result["top_frequent_artists"]) == 3
+        assert len(result["top_average_artists"]) == 3
+        assert [item["name"] for item in result["top_rated_artists"]] == ["Artist 4", "Artist 3", "Artist 2"]
+
+    def test_leaderboards_single_statement(self, query_counter):
+        """Test that both artist and label leaderboards are calculated in a single statement"""
+        seed_releases({"A": [50, 60]})
+        query_counter.clear()
+        stats.leaderboards()
+        assert len(query_counter) == 1
+
+    def test_leaderboards_single_type(self, query_counter):
+        """Test that requesting one entity type only returns (and ranks) that type"""
+        seed_releases({"A": [50, 60]})
+        query_counter.clear()
+        result = stats.leaderboards(Artist)
+        assert set(result.keys()) == {"top_frequent_artists", "top_average_artists", "top_rated_artists"}
+        assert len(query_counter) == 1
+        assert "label" not in query_counter[0]
+
+
+class TestStatsSection:
+    """Test suite for stats.stats_section()"""
+
+    @pytest.mark.parametrize(
+        "name, expected_key, unexpected_key",
+        [
+            ("totals", "total_listens", "releases_this_year"),
+            ("yearly", "releases_per_day", "total_listens"),
+            ("artists", "top_rated_artists", "top_rated_labels"),
+            ("labels", "top_rated_labels", "top_rated_artists"),
+        ]
+    )
+    def test_stats_section_computes_only_its_keys(self, query_counter, name, expected_key, unexpected_key):
+        """Test that each section returns its own keys in a single statement"""
+        query_counter.clear()
+        result = stats.stats_section(name)
+        assert expected_key in result
+        assert unexpected_key not in result
+        assert len(query_counter) == 1
+
+    def test_stats_section_unknown(self):
+        """Test that an unknown section raises ValueError"""
+        with pytest.raises(ValueError, match="Unknown stats section"):
+            stats.stats_section("goals")
@@ -121,6 +121,27 @@ class TestEdit:
         assert response.location == "/"
         assert b"You should be redirected automatically" in response.data
 
+    def test_edit_post_failure_rejected_image(self, client, mock_release_data, mocker):
+        """
+        Test that an image URL rejected by Util.get_image redirects to the error page
+        """
+        mocker.patch(
+            "databass.db.models.Release.exists_by_id",
+            return_value=mock_release_data
+        )
+        mocker.patch(
+            "databass.releases.routes.Util.get_image",
+            side_effect=ValueError("Not a supported image type")
+        )
+        mock_update = mocker.patch("databass.db.update")
+        response = client.post(
+            "/release/1/edit",
+            data={'image': 'https://example.com/page.html'}
+        )
+        mock_update.assert_not_called()
+        assert response.status_code == 302
+        assert response.location == "/error"
+
     def test_edit_post_failure_non_existing_release(self, client, mocker):
         """
         Test for successful handling of a POST request to a release that does not exist
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from datetime import datetime
+import pytest
+from flask import Flask
+from databass.db.base import app_db
+from databass.db.models import Base, Release, Artist, Label, Genre
+from databass.db.operations import insert
+from databass.image_backfill import ImageBackfill, BackfillItem
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """
+    Overrides the in-memory sqlite_app with a file-backed database: an in-memory database
+    shares one connection between threads, so the concurrent writes of the backfill workers would collide.
+    """
+    app = Flask(__name__)
+    app.config.update({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'backfill.db'}",
+    })
+    app_db.init_app(app)
+    with app.app_context():
+        Base.metadata.create_all(app_db.engine)
+        yield app
+        app_db.session.remove()
+        app_db.engine.dispose()
+
+
+@pytest.fixture
+def seeded(sqlite_app, image_index):
+    """Two releases (one with a MBID), their artist and label; release 1 already has an image"""
+    artist_id = insert(Artist(name="Test Artist", mbid="artist-mbid"))
+    label_id = insert(Label(name="Test Label"))
+    genre_id = insert(Genre(name="rock"))
+    for name, mbid in [("Has Image", "release-1"), ("With MBID", "release-2"), ("No MBID", None)]:
+        insert(Release(
+            name=name, mbid=mbid, artist_id=artist_id, label_id=label_id, main_genre_id=genre_id,
+            year=2000, runtime=600000, rating=80, listen_date=datetime(2024, 1, 1), track_count=10
+        ))
+    release_dir = f"{image_index.img_dir}/release"
+    os.makedirs(release_dir)
+    open(f"{release_dir}/1.jpg", "wb").close()
+    return sqlite_app
+
+
+def saved_path(item_type, item_id, **kwargs):
+    return f"./static/img/{item_type}/{item_id}.jpg"
+
+
+class TestMissingImages:
+    """Test suite for ImageBackfill.missing_images"""
+
+    def test_lists_items_without_image(self, seeded):
+        """Test that every item without an image file is returned with the names needed to look it up"""
+        items = ImageBackfill.missing_images()
+        assert [item.key for item in items] == ["release/2", "release/3", "artist/1", "label/1"]
+        assert items[0] == BackfillItem("release", 2, "With MBID", "release-2", "Test Artist")
+
+    def test_single_query(self, seeded, query_counter):
+        """Test that the items of all types are enumerated with one statement"""
+        query_counter.clear()
+        ImageBackfill.missing_images()
+        assert len(query_counter) == 1
+
+    def test_filter_by_type(self, seeded):
+        """Test that only the requested item types are returned"""
+        assert [item.key for item in ImageBackfill.missing_images(["label"])] == ["label/1"]
+
+    def test_upstream(self):
+        """Test that releases with a MBID go to CoverArtArchive and everything else to Discogs"""
+        assert BackfillItem("release", 1, "A", "mbid", "B").upstream == "caa"
+        assert BackfillItem("release", 1, "A", None, "B").upstream == "discogs"
+        assert BackfillItem("artist", 1, "B", "mbid", None).upstream == "discogs"
+
+
+class TestRun:
+    """Test suite for ImageBackfill.run"""
+
+    def test_dry_run(self, seeded, mocker):
+        """Test that a dry run reports the items and their upstream without fetching anything"""
+        mock_get_image = mocker.patch('databass.api.Util.get_image')
+        lines = []
+        info = ImageBackfill.run(dry_run=True, report=lines.append)
+        mock_get_image.assert_not_called()
+        assert info["total"] == 4 and info["done"] == 0
+        assert "release/2 'With MBID': would fetch from caa" in lines
+        assert "label/1 'Test Label': would fetch from discogs" in lines
+
+    def test_fetches_and_records_images(self, seeded, mocker):
+        """Test that missing images are fetched and their paths stored on the items"""
+        mock_get_image = mocker.patch('databass.api.Util.get_image', side_effect=saved_path)
+        lines = []
+        info = ImageBackfill.run(report=lines.append)
+        assert mock_get_image.call_count == 4
+        mock_get_image.assert_any_call(
+            item_type="release", item_id=2, mbid="release-2", release_name="With MBID", artist_name="Test Artist"
+        )
+        assert info["done"] == info["saved"] == 4
+        assert app_db.session.get(Label, 1).image == "./static/img/label/1.jpg"
+        assert lines[-1].startswith("Done: 4 saved, 0 not found, 0 failed")
+
+    def test_saves_through_operations(self, seeded, mocker):
+        """Test that image paths are written through the operations layer, which invalidates the stats cache"""
+        mocker.patch('databass.api.Util.get_image', side_effect=saved_path)
+        mock_invalidate = mocker.patch('databass.db.operations.StatsCache.invalidate_for')
+        ImageBackfill.run(item_types=["artist"], report=lambda line: None)
+        mock_invalidate.assert_called_once_with("artist")
+        assert app_db.session.get(Artist, 1).image == "./static/img/artist/1.jpg"
+
+    def test_saving_release_keeps_other_columns(self, seeded, mocker):
+        """Test that saving a release image leaves its artist, label, MBID and the rollups unchanged"""
+        from databass.db.models import EntityRollup
+        mocker.patch('databass.api.Util.get_image', side_effect=saved_path)
+
+        def rollups():
+            return {
+                (row.entity_type, row.entity_id): (row.release_count, row.rating_sum, row.runtime_sum)
+                for row in app_db.session.query(EntityRollup).all()
+                if row.release_count
+            }
+
+        before = rollups()
+        ImageBackfill.run(item_types=["release"], report=lambda line: None)
+
+        release = app_db.session.get(Release, 2)
+        assert release.image == "./static/img/release/2.jpg"
+        assert (release.artist_id, release.label_id, release.mbid) == (1, 1, "release-2")
+        assert rollups() == before == {("artist", 1): (3, 240, 1800000), ("label", 1): (3, 240, 1800000)}
+
+    def test_attempts_recorded_in_batches(self, seeded, mocker):
+        """Test that the state file is written once per batch of attempted items, and once for the rest"""
+        mocker.patch('databass.api.Util.get_image', return_value=None)
+        mocker.patch.object(ImageBackfill, "record_every", 3)
+        update_state = mocker.spy(ImageBackfill.state, "update")
+        ImageBackfill.run(report=lambda line: None)
+        # Once to reset the state when the run starts, then one batch of 3 and the remaining item
+        assert update_state.call_count == 3
+        with ImageBackfill.state.update() as state:
+            assert sorted(state["attempted"]) == ["artist/1", "label/1", "release/2", "release/3"]
+
+    def test_failures_are_counted(self, seeded, mocker):
+        """Test that items without an image or with errors are counted but do not stop the run"""
+        def get_image(item_type, item_id, **kwargs):
+            if item_type == "artist":
+                raise Exception("API Error")
+            return None if item_type == "label" else saved_path(item_type, item_id)
+
+        mocker.patch('databass.api.Util.get_image', side_effect=get_image)
+        info = ImageBackfill.run(report=lambda line: None)
+        assert (info["saved"], info["not_found"], info["failed"]) == (2, 1, 1)
+
+    def test_resume_skips_attempted_items(self, seeded, mocker):
+        """Test that a resumed run skips items attempted before, and a fresh run retries them"""
+        mocker.patch('databass.api.Util.get_image', return_value=None)
+        ImageBackfill.run(item_types=["label"], report=lambda line: None)
+
+        mock_get_image = mocker.patch('databass.api.Util.get_image', return_value=None)
+        lines = []
+        info = ImageBackfill.run(resume=True, report=lines.append)
+        assert info["total"] == 3
+        assert lines[0] == "3 items without an image, 1 skipped from earlier runs"
+        assert all(call.kwargs["item_type"] != "label" for call in mock_get_image.call_args_list)
+
+        ImageBackfill.run(report=lambda line: None)
+        assert mock_get_image.call_count == 3 + 4
+
+    def test_concurrency_bounded_per_upstream(self, seeded, mocker):
+        """Test that no more than the configured number of downloads run at once for each upstream"""
+        running = {"caa": 0, "discogs": 0}
+        peak = {"caa": 0, "discogs": 0}
+        lock = threading.Lock()
+
+        def get_image(item_type, item_id, mbid=None, **kwargs):
+            upstream = "caa" if item_type == "release" and mbid else "discogs"
+            with lock:
+                running[upstream] += 1
+                peak[upstream] = max(peak[upstream], running[upstream])
+            time.sleep(0.05)
+            with lock:
+                running[upstream] -= 1
+            return None
+
+        mocker.patch('databass.api.Util.get_image', side_effect=get_image)
+        ImageBackfill.run(caa_workers=1, discogs_workers=2, report=lambda line: None)
+        assert peak["caa"] == 1
+        assert peak["discogs"] == 2
+
+
+class TestBackfillCommand:
+    """Test suite for the backfill-images CLI command"""
+
+    def test_dry_run_command(self, seeded, mocker):
+        """Test that the command passes its options on and prints the progress"""
+        from databass.image_backfill import backfill_images
+        mock_get_image = mocker.patch('databass.api.Util.get_image')
+        seeded.cli.add_command(backfill_images)
+        result = seeded.test_cli_runner().invoke(args=["backfill-images", "--dry-run", "--type", "label"])
+        assert result.exit_code == 0, result.output
+        assert result.output.splitlines() == [
+            "1 items without an image",
+            "label/1 'Test Label': would fetch from discogs",
+        ]
+        mock_get_image.assert_not_called()
@@ -0,0 +1,174 @@
+import os
+import pytest
+from databass.image_index import ImageIndex
+
+
+def save_image(item_type, item_id, ext=".jpg", content=b"image"):
+    """Write an image file the way another worker process would, bypassing the index"""
+    directory = os.path.join(ImageIndex.img_dir, item_type)
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, f"{item_id}{ext}")
+    with open(file_path, "wb") as img_file:
+        img_file.write(content)
+    return os.path.abspath(file_path)
+
+
+class TestImageIndex:
+    """Test suite for ImageIndex"""
+
+    def test_warm_indexes_existing_images(self, image_index):
+        """Test that warm() finds the images of every type with a single listing per directory"""
+        release = save_image("release", 1)
+        label = save_image("label", 7, ".png")
+        ImageIndex.warm()
+        assert ImageIndex.get("release", 1) == release
+        assert ImageIndex.get("label", 7) == label
+        assert ImageIndex.get("artist", 1) is None
+
+    def test_lookup_hit_does_not_touch_filesystem(self, image_index, mocker):
+        """Test that an indexed image is returned without listing or stat-ing anything"""
+        release = save_image("release", 1)
+        ImageIndex.warm()
+        mock_scandir = mocker.patch('databass.image_index.scandir')
+        mock_stat = mocker.patch('databass.image_index.stat')
+        assert ImageIndex.get("release", 1) == release
+        mock_scandir.assert_not_called()
+        mock_stat.assert_not_called()
+
+    def test_miss_does_not_relist_unchanged_directory(self, image_index, mocker):
+        """Test that a miss costs one stat of the directory, not a listing, while the directory is unchanged"""
+        save_image("release", 1)
+        ImageIndex.warm()
+        mock_scandir = mocker.patch('databass.image_index.scandir')
+        assert ImageIndex.get("release", 2) is None
+        mock_scandir.assert_not_called()
+
+    def test_picks_up_images_saved_by_other_workers(self, image_index):
+        """Test that an image added to the directory after warm() is found on the next miss"""
+        ImageIndex.warm()
+        assert ImageIndex.get("artist", 3) is None
+        artist = save_image("artist", 3)
+        assert ImageIndex.get("artist", 3) == artist
+
+    def test_record(self, image_index):
+        """Test that a recorded image is served from the index"""
+        ImageIndex.warm()
+        ImageIndex.record("release", "5", f"{ImageIndex.img_dir}/release/5.png")
+        assert ImageIndex.get("release", 5) == os.path.abspath(f"{ImageIndex.img_dir}/release/5.png")
+
+    def test_newest_file_wins(self, image_index):
+        """Test that the most recently saved file is used when an item has images with different extensions"""
+        old = save_image("release", 1, ".jpg")
+        os.utime(old, ns=(1_000_000_000, 1_000_000_000))
+        new = save_image("release", 1, ".png")
+        ImageIndex.warm()
+        assert ImageIndex.get("release", 1) == new
+
+    def test_unknown_type(self, image_index):
+        """Test that unknown item types are never looked up on disk"""
+        assert ImageIndex.get("../release", 1) is None
+
+    def test_version_is_content_hash(self, image_index):
+        """Test that the version depends on the content only and changes when the image is replaced"""
+        save_image("release", 1, content=b"same")
+        save_image("release", 2, content=b"same")
+        ImageIndex.warm()
+        first = ImageIndex.version("release", 1)
+        assert first == ImageIndex.version("release", 2)
+        save_image("release", 1, content=b"replaced")
+        assert ImageIndex.version("release", 1) != first
+
+    def test_version_cached(self, image_index, mocker):
+        """Test that an unchanged image is hashed only once"""
+        save_image("release", 1)
+        ImageIndex.warm()
+        ImageIndex.version("release", 1)
+        mock_open = mocker.patch('builtins.open')
+        ImageIndex.version("release", 1)
+        mock_open.assert_not_called()
+
+    def test_version_without_image(self, image_index):
+        """Test that items without an image have no version"""
+        assert ImageIndex.version("artist", 1) is None
+
+    def test_ids(self, image_index):
+        """Test that ids() lists the items of a type that have an image"""
+        save_image("label", 1)
+        save_image("label", 2)
+        assert ImageIndex.ids("label") == {1, 2}
+        assert ImageIndex.ids("artist") == set()
+
+
+class TestServeImage:
+    """Test suite for the /img/<type>/<id> route"""
+
+    def test_serves_indexed_image_without_queries(self, image_client):
+        """Test that an image is served from the index without querying the database"""
+        save_image("release", 1, content=b"release image")
+        ImageIndex.warm()
+        response = image_client.get("/img/release/1")
+        assert response.status_code == 200
+        assert response.data == b"release image"
+        assert image_client.statements == []
+
+    def test_placeholder_for_missing_image(self, image_client):
+        """Test that items without an image get the uncached placeholder"""
+        ImageIndex.warm()
+        response = image_client.get("/img/artist/1")
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "no-cache"
+        assert response.data == b"placeholder"
+
+    def test_strong_etag(self, image_client):
+        """Test that the ETag is the quoted content hash"""
+        save_image("release", 1)
+        response = image_client.get("/img/release/1")
+        assert response.headers["ETag"] == f'"{ImageIndex.version("release", 1)}"'
+        assert "Last-Modified" in response.headers
+
+    def test_if_none_match(self, image_client):
+        """Test that a request with the current ETag gets a 304 without the image"""
+        save_image("release", 1)
+        etag = image_client.get("/img/release/1").headers["ETag"]
+        response = image_client.get("/img/release/1", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        response = image_client.get("/img/release/1", headers={"If-None-Match": '"outdated"'})
+        assert response.status_code == 200
+
+    def test_if_modified_since(self, image_client):
+        """Test that a request with the current Last-Modified date gets a 304"""
+        save_image("release", 1)
+        last_modified = image_client.get("/img/release/1").headers["Last-Modified"]
+        response = image_client.get("/img/release/1", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+
+    def test_versioned_url_is_immutable(self, image_client):
+        """Test that images requested with their current version may be cached indefinitely"""
+        from databass.routes import IMAGE_MAX_AGE
+        save_image("release", 1)
+        version = ImageIndex.version("release", 1)
+        response = image_client.get(f"/img/release/1?v={version}")
+        assert response.headers["Cache-Control"] == f"public, max-age={IMAGE_MAX_AGE}, immutable"
+
+    @pytest.mark.parametrize("query", ["", "?v=outdated"])
+    def test_unversioned_url_revalidates(self, image_client, query):
+        """Test that unversioned or outdated URLs must be revalidated, so a replaced image is not cached"""
+        save_image("release", 1)
+        response = image_client.get(f"/img/release/1{query}")
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    def test_image_url(self, image_client):
+        """Test that templates link to versioned URLs for existing images only"""
+        save_image("artist", 1)
+        image_url = image_client.application.jinja_env.globals["image_url"]
+        assert image_url("artist", 1) == f'/img/artist/1?v={ImageIndex.version("artist", 1)}'
+        assert image_url("artist", 2) == "/img/artist/2"
+
+    def test_deleted_image_falls_back_to_placeholder(self, image_client):
+        """Test that an indexed image deleted from disk is dropped from the index"""
+        os.remove(save_image("label", 1))
+        ImageIndex.record("label", 1, f"{ImageIndex.img_dir}/label/1.jpg")
+        response = image_client.get("/img/label/1")
+        assert response.headers["Cache-Control"] == "no-cache"
+        assert ImageIndex.get("label", 1) is None
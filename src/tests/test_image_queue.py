@@ -0,0 +1,94 @@
+import threading
+import time
+from databass.image_queue import ImageQueue
+
+
+class TestImageQueue:
+    """Test suite for ImageQueue"""
+
+    def test_enqueue_fetches_image(self, mocker):
+        """Test that a queued job calls Util.get_image with the item and lookup arguments"""
+        mock_get_image = mocker.patch('databass.api.Util.get_image')
+        assert ImageQueue.enqueue('artist', 3, artist_name="Test Artist") is True
+        mock_get_image.assert_called_once_with(item_type='artist', item_id=3, artist_name="Test Artist")
+        assert ImageQueue.pending('artist', 3) is False
+
+    def test_runs_in_background(self, mocker, monkeypatch):
+        """Test that with workers, enqueue returns before the image is fetched"""
+        monkeypatch.setattr(ImageQueue, "workers", 2)
+        release = threading.Event()
+        mock_get_image = mocker.patch('databass.api.Util.get_image', side_effect=lambda **kwargs: release.wait(5))
+
+        assert ImageQueue.enqueue('release', 1, url="https://example.com/a.jpg") is True
+        assert ImageQueue.pending('release', 1) is True
+
+        release.set()
+        ImageQueue.wait()
+        assert ImageQueue.pending('release', 1) is False
+        mock_get_image.assert_called_once_with(item_type='release', item_id=1, url="https://example.com/a.jpg")
+
+    def test_duplicate_jobs_skipped(self, mocker, monkeypatch):
+        """Test that an image already being fetched is not queued again"""
+        monkeypatch.setattr(ImageQueue, "workers", 1)
+        release = threading.Event()
+        mock_get_image = mocker.patch('databass.api.Util.get_image', side_effect=lambda **kwargs: release.wait(5))
+
+        assert ImageQueue.enqueue('label', 7, label_name="Test Label") is True
+        assert ImageQueue.enqueue('label', 7, label_name="Test Label") is False
+        release.set()
+        ImageQueue.wait()
+        assert mock_get_image.call_count == 1
+
+    def test_errors_are_not_raised(self, mocker):
+        """Test that a failing job is logged and no longer reported as pending"""
+        mocker.patch('databass.api.Util.get_image', side_effect=Exception("API Error"))
+        assert ImageQueue.enqueue('release', 2) is True
+        assert ImageQueue.pending('release', 2) is False
+
+    def test_stale_jobs_expire(self, monkeypatch):
+        """Test that jobs that never finished stop being reported as pending after the timeout"""
+        with ImageQueue.jobs.update() as jobs:
+            jobs["release/5"] = 0.0
+        assert ImageQueue.pending('release', 5) is False
+
+    def test_pending_does_not_write(self, mocker):
+        """Test that checking for a pending job only reads the jobs file"""
+        with ImageQueue.jobs.update() as jobs:
+            jobs["release/6"] = time.time()
+        update = mocker.spy(ImageQueue.jobs, "update")
+        assert ImageQueue.pending('release', 6) is True
+        assert ImageQueue.pending('release', 7) is False
+        update.assert_not_called()
+
+    def test_runs_in_app_context(self, sqlite_app, mocker, monkeypatch):
+        """Test that background jobs run inside the application context of the caller"""
+        from flask import has_app_context
+        monkeypatch.setattr(ImageQueue, "workers", 1)
+        contexts = []
+        mocker.patch('databass.api.Util.get_image', side_effect=lambda **kwargs: contexts.append(has_app_context()))
+        ImageQueue.enqueue('release', 1)
+        ImageQueue.wait()
+        assert contexts == [True]
+
+    def test_generate_thumbnails_in_background(self, mocker, monkeypatch):
+        """Test that thumbnails are generated in the pool without marking the image as pending"""
+        monkeypatch.setattr(ImageQueue, "workers", 1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def generate_all(item_type, item_id):
+            started.set()
+            release.wait(5)
+
+        mock_generate_all = mocker.patch('databass.thumbnails.Thumbnails.generate_all', side_effect=generate_all)
+        ImageQueue.generate_thumbnails('artist', 4)
+        assert started.wait(5)
+        assert ImageQueue.pending('artist', 4) is False
+        release.set()
+        ImageQueue.wait()
+        mock_generate_all.assert_called_once_with('artist', 4)
+
+    def test_thumbnail_errors_are_not_raised(self, mocker):
+        """Test that a failing thumbnail job is logged"""
+        mocker.patch('databass.thumbnails.Thumbnails.generate_all', side_effect=OSError("disk full"))
+        ImageQueue.generate_thumbnails('artist', 4)
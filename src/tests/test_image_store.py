@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+import time
+from databass.image_index import ImageIndex
+from databass.image_store import ImageStore, PRUNE_GRACE_PERIOD, migrate_images, verify_images
+from databass.thumbnails import Thumbnails
+
+JPEG = b"\xff\xd8\xff\xe0" + b"cover" * 20
+OTHER_JPEG = b"\xff\xd8\xff\xe0" + b"other" * 20
+
+
+def age(file_path, seconds=PRUNE_GRACE_PERIOD + 60):
+    """Make a file look as if it was written a while ago"""
+    then = time.time() - seconds
+    os.utime(file_path, (then, then))
+
+
+class TestSave:
+    """Test suite for ImageStore.save"""
+
+    def test_stores_blob_and_link(self, image_index):
+        """Test that the image is stored under its hash and the item path links to it"""
+        img_path = ImageStore.save("release", 1, JPEG, ".jpg")
+        digest = hashlib.sha256(JPEG).hexdigest()
+        assert img_path == os.path.join(image_index.img_dir, "release", "1.jpg")
+        assert os.path.islink(img_path)
+        assert os.path.realpath(img_path) == os.path.realpath(f"{image_index.img_dir}/blobs/{digest[:2]}/{digest}.jpg")
+        with open(img_path, "rb") as img_file:
+            assert img_file.read() == JPEG
+
+    def test_deduplicates(self, image_index):
+        """Test that identical images are stored once"""
+        first = ImageStore.save("release", 1, JPEG, ".jpg")
+        second = ImageStore.save("release", 2, JPEG, ".jpg")
+        ImageStore.save("artist", 1, JPEG, ".jpg")
+        assert os.path.realpath(first) == os.path.realpath(second)
+        assert len(ImageStore.blobs()) == 1
+
+    def test_recorded_in_index(self, image_index):
+        """Test that the saved image is served without listing the directory again"""
+        ImageIndex.warm()
+        img_path = ImageStore.save("label", 3, JPEG, ".jpg")
+        assert ImageIndex.get("label", 3) == os.path.abspath(img_path)
+
+    def test_replaces_previous_image(self, image_index):
+        """Test that a new image replaces the old one, including one with another extension"""
+        ImageStore.save("release", 1, OTHER_JPEG, ".png")
+        img_path = ImageStore.save("release", 1, JPEG, ".jpg")
+        assert sorted(os.listdir(f"{image_index.img_dir}/release")) == ["1.jpg"]
+        ImageIndex.clear()
+        assert ImageIndex.get("release", 1) == os.path.abspath(img_path)
+
+    def test_version_from_blob_name(self, image_index, mocker):
+        """Test that the version of a stored image is read from its blob name instead of hashing the file"""
+        ImageStore.save("release", 1, JPEG, ".jpg")
+        mock_open = mocker.patch('builtins.open')
+        assert ImageIndex.version("release", 1) == hashlib.sha256(JPEG).hexdigest()[:32]
+        mock_open.assert_not_called()
+
+    def test_concurrent_writers(self, image_index):
+        """Test that parallel fetchers saving images for the same items leave complete files only"""
+        images = [JPEG, OTHER_JPEG]
+        errors = []
+
+        def save(n):
+            try:
+                ImageStore.save("release", n % 3, images[n % 2], ".jpg")
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=save, args=(n,)) for n in range(24)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert sorted(os.listdir(f"{image_index.img_dir}/release")) == ["0.jpg", "1.jpg", "2.jpg"]
+        assert ImageStore.verify() == []
+        assert len(ImageStore.blobs()) == 2
+
+
+class TestMaintenance:
+    """Test suite for verifying, pruning and migrating the image store"""
+
+    def test_verify_detects_corruption(self, image_index):
+        """Test that a blob whose content no longer matches its hash is reported"""
+        ImageStore.save("release", 1, JPEG, ".jpg")
+        blob = os.path.realpath(ImageStore.save("release", 2, OTHER_JPEG, ".jpg"))
+        assert ImageStore.verify() == []
+        with open(blob, "ab") as blob_file:
+            blob_file.write(b"bit rot")
+        assert ImageStore.verify() == [blob]
+
+    def test_prune_deletes_unreferenced_blobs(self, image_index):
+        """Test that blobs of replaced images are deleted, together with their thumbnails"""
+        old_blob = os.path.realpath(ImageStore.save("release", 1, OTHER_JPEG, ".jpg"))
+        old_thumbnail = Thumbnails.path(ImageIndex.version("release", 1), 64)
+        os.makedirs(os.path.dirname(old_thumbnail))
+        open(old_thumbnail, "wb").close()
+        age(old_thumbnail)
+        age(old_blob)
+        ImageStore.save("release", 1, JPEG, ".jpg")
+        assert ImageStore.prune() == 1
+        assert not os.path.exists(old_blob)
+        assert not os.path.exists(old_thumbnail)
+        assert ImageStore.verify() == []
+        assert len(ImageStore.blobs()) == 1
+
+    def test_prune_keeps_recent_blobs(self, image_index):
+        """Test that a blob that was just written, and may be about to be linked, is kept"""
+        ImageStore.put(JPEG, ".jpg")
+        assert ImageStore.prune() == 0
+        assert len(ImageStore.blobs()) == 1
+
+    def test_migrate(self, image_index):
+        """Test that images saved as regular files are moved into the store and deduplicated"""
+        release_dir = f"{image_index.img_dir}/release"
+        os.makedirs(release_dir)
+        for item_id in (1, 2):
+            with open(f"{release_dir}/{item_id}.jpg", "wb") as img_file:
+                img_file.write(JPEG)
+        version = ImageIndex.version("release", 1)
+        assert ImageStore.migrate() == 2
+        assert all(os.path.islink(f"{release_dir}/{item_id}.jpg") for item_id in (1, 2))
+        assert len(ImageStore.blobs()) == 1
+        assert ImageIndex.version("release", 2) == version
+        assert ImageStore.migrate() == 0
+
+    def test_commands(self, image_index, sqlite_app):
+        """Test the migrate-images and verify-images commands"""
+        sqlite_app.cli.add_command(migrate_images)
+        sqlite_app.cli.add_command(verify_images)
+        runner = sqlite_app.test_cli_runner()
+        assert "0 images migrated" in runner.invoke(args=["migrate-images"]).output
+        ImageStore.save("release", 1, JPEG, ".jpg")
+        result = runner.invoke(args=["verify-images", "--prune"])
+        assert "0 corrupt blobs" in result.output
+        assert "0 unused blobs deleted" in result.output
@@ -1,5 +1,16 @@
 import pytest
+from flask import Flask
 from databass.pagination import Pager
+from databass.db.models import Release
+
+
+@pytest.fixture
+def request_context():
+    """flask_paginate.Pagination reads the current request, so it needs a request context"""
+    app = Flask(__name__)
+    app.add_url_rule('/', 'index', lambda: '')
+    with app.test_request_context('/'):
+        yield
 
 class TestGetPageRange:
     """Tests for Util.get_page_range() function"""
@@ -37,3 +48,172 @@ class TestGetPageRange:
         start, end = Pager.get_page_range(per_page, current_page)
         assert start == 999000000
         assert end == 1000000000
+
+
+class TestPaginatePage:
+    """Tests for Pager.paginate_page() function"""
+    pytestmark = pytest.mark.usefixtures("request_context")
+
+    def test_paginate_page_uses_given_total(self):
+        """Test that the total comes from the caller instead of the length of the page"""
+        page_data = [1, 2, 3, 4, 5]
+        paged_data, pagination = Pager.paginate_page(
+            per_page=5,
+            current_page=2,
+            page_data=page_data,
+            total=12
+        )
+        assert paged_data is page_data
+        assert pagination.total == 12
+        assert pagination.page == 2
+        assert pagination.has_prev
+        assert pagination.has_next
+
+    def test_paginate_page_last_page(self):
+        """Test that the last page has no next page"""
+        _, pagination = Pager.paginate_page(per_page=5, current_page=3, page_data=[1, 2], total=12)
+        assert not pagination.has_next
+
+    def test_paginate_page_none_total(self):
+        """Test that a missing total is treated as zero"""
+        _, pagination = Pager.paginate_page(per_page=5, current_page=1, page_data=[], total=None)
+        assert pagination.total == 0
+        assert not pagination.has_next
+
+    def test_paginate_page_invalid_page(self):
+        """Test that invalid page parameters raise ValueError"""
+        with pytest.raises(ValueError):
+            Pager.paginate_page(per_page=5, current_page=0, page_data=[], total=10)
+
+
+class TestCursor:
+    """Tests for Pager.encode_cursor() and Pager.decode_cursor()"""
+    @pytest.mark.parametrize("value, direction", [(1, "next"), (250, "prev"), ("abc", "next")])
+    def test_cursor_round_trip(self, value, direction):
+        """Test that a decoded cursor returns the encoded value and direction"""
+        cursor = Pager.encode_cursor(value, direction)
+        assert Pager.decode_cursor(cursor) == (value, direction)
+
+    @pytest.mark.parametrize("cursor", [None, "", "not base64!", "bm90IGpzb24=", 5,
+                                        Pager.encode_cursor(1, "sideways"),
+                                        Pager.encode_cursor(None, "next")])
+    def test_decode_malformed_cursor(self, cursor):
+        """Test that missing or malformed cursors decode to None"""
+        assert Pager.decode_cursor(cursor) is None
+
+
+class TestPaginateKeyset:
+    """Tests for Pager.paginate_keyset() function"""
+    pytestmark = pytest.mark.usefixtures("request_context")
+
+    @staticmethod
+    def make_rows(mocker, ids):
+        rows = []
+        for item_id in ids:
+            row = mocker.Mock()
+            row.id = item_id
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def make_query(mocker, rows):
+        query = mocker.MagicMock()
+        query.order_by.return_value = query
+        query.filter.return_value = query
+        query.limit.return_value = query
+        query.offset.return_value = query
+        query.all.return_value = rows
+        return query
+
+    def test_first_page_without_cursor(self, mocker):
+        """Test that the first page is fetched without a filter and with one extra row"""
+        query = self.make_query(mocker, self.make_rows(mocker, [1, 2, 3, 4]))
+
+        paged_data, pagination, cursors = Pager.paginate_keyset(
+            per_page=3, current_page=1, query=query, sort_key=Release.id
+        )
+
+        query.filter.assert_not_called()
+        query.offset.assert_not_called()
+        query.limit.assert_called_once_with(4)
+        assert [r.id for r in paged_data] == [1, 2, 3]
+        assert pagination.has_next
+        assert not pagination.has_prev
+        assert Pager.decode_cursor(cursors["next"]) == (3, "next")
+        assert cursors["prev"] is None
+
+    def test_next_page_with_cursor(self, mocker):
+        """Test that a cursor filters on the sort key instead of using an offset"""
+        query = self.make_query(mocker, self.make_rows(mocker, [4, 5]))
+
+        paged_data, pagination, cursors = Pager.paginate_keyset(
+            per_page=3, current_page=2, query=query, sort_key=Release.id,
+            cursor=Pager.encode_cursor(3, "next")
+        )
+
+        query.filter.assert_called_once()
+        query.offset.assert_not_called()
+        assert [r.id for r in paged_data] == [4, 5]
+        assert not pagination.has_next
+        assert pagination.has_prev
+        assert cursors["next"] is None
+        assert Pager.decode_cursor(cursors["prev"]) == (4, "prev")
+
+    def test_prev_page_reverses_rows(self, mocker):
+        """Test that walking backwards returns the page in the original order"""
+        query = self.make_query(mocker, self.make_rows(mocker, [6, 5, 4, 3]))
+
+        paged_data, pagination, cursors = Pager.paginate_keyset(
+            per_page=3, current_page=2, query=query, sort_key=Release.id,
+            cursor=Pager.encode_cursor(7, "prev")
+        )
+
+        assert [r.id for r in paged_data] == [4, 5, 6]
+        assert pagination.has_next
+        assert Pager.decode_cursor(cursors["next"]) == (6, "next")
+        assert Pager.decode_cursor(cursors["prev"]) == (4, "prev")
+
+    def test_deep_page_without_cursor_falls_back_to_offset(self, mocker):
+        """Test that a page past the first without a cursor uses offset mode"""
+        query = self.make_query(mocker, self.make_rows(mocker, [7, 8, 9]))
+        query.count.return_value = 20
+
+        paged_data, pagination, cursors = Pager.paginate_keyset(
+            per_page=3, current_page=3, query=query, sort_key=Release.id
+        )
+
+        query.offset.assert_called_once_with(6)
+        assert pagination.total == 20
+        assert Pager.decode_cursor(cursors["next"]) == (9, "next")
+
+    def test_with_total_falls_back_to_offset(self, mocker):
+        """Test that requiring a total count uses offset mode even with a cursor"""
+        query = self.make_query(mocker, self.make_rows(mocker, [1, 2, 3]))
+        query.count.return_value = 3
+
+        _, pagination, cursors = Pager.paginate_keyset(
+            per_page=3, current_page=1, query=query, sort_key=Release.id,
+            cursor=Pager.encode_cursor(3, "next"), with_total=True
+        )
+
+        query.count.assert_called_once()
+        assert pagination.total == 3
+        assert cursors == {"next": None, "prev": None}
+
+
+class TestPaginateQuery:
+    """Tests for Pager.paginate_query() function"""
+    pytestmark = pytest.mark.usefixtures("request_context")
+
+    def test_paginate_query_uses_offset(self, mocker):
+        """Test that only the requested page is fetched"""
+        query = mocker.MagicMock()
+        query.limit.return_value.offset.return_value.all.return_value = [1, 2]
+
+        paged_data, pagination = Pager.paginate_query(per_page=2, current_page=3, query=query, total=10)
+
+        query.limit.assert_called_once_with(2)
+        query.limit.return_value.offset.assert_called_once_with(4)
+        query.order_by.return_value.count.assert_not_called()
+        assert paged_data == [1, 2]
+        assert pagination.total == 10
@@ -0,0 +1,149 @@
+import pytest
+from datetime import datetime, timedelta
+from flask import Flask
+from databass.db.base import app_db
+from databass.db.models import Base
+from databass.result_sets import ResultSets
+from databass.routes import register_routes
+
+
+@pytest.fixture(autouse=True)
+def empty_result_sets(sqlite_app):
+    yield
+    ResultSets.clear()
+
+
+@pytest.fixture
+def mock_now(mocker):
+    """Control the time seen by ResultSets; set mock_now.return_value to move the clock"""
+    mock_datetime = mocker.patch('databass.result_sets.datetime')
+    mock_datetime.now.return_value = datetime(2024, 1, 1)
+    return mock_datetime.now
+
+
+class TestResultSets:
+    """Test suite for ResultSets"""
+
+    def test_store_and_get(self):
+        """Test that stored results can be retrieved by their id"""
+        results = [{"release": {"name": "A"}}, {"release": {"name": "B"}}]
+        result_set_id = ResultSets.store(results)
+        assert isinstance(result_set_id, str)
+        assert ResultSets.get(result_set_id) == results
+
+    def test_ids_are_unique(self):
+        """Test that every stored result set gets its own id"""
+        first = ResultSets.store([1])
+        second = ResultSets.store([2])
+        assert first != second
+        assert ResultSets.get(first) == [1]
+        assert ResultSets.get(second) == [2]
+
+    @pytest.mark.parametrize("result_set_id", ["unknown", "", None, 123])
+    def test_get_unknown_id(self, result_set_id):
+        """Test that unknown or invalid ids return None"""
+        assert ResultSets.get(result_set_id) is None
+
+    def test_expires_after_ttl(self, mock_now):
+        """Test that result sets not used within the TTL are dropped"""
+        start = mock_now.return_value
+        result_set_id = ResultSets.store([1])
+        mock_now.return_value = start + timedelta(seconds=ResultSets.ttl - 1)
+        assert ResultSets.get(result_set_id) == [1]
+        # get() refreshes the last use, so the TTL counts from there
+        mock_now.return_value = start + timedelta(seconds=2 * ResultSets.ttl - 2)
+        assert ResultSets.get(result_set_id) == [1]
+        mock_now.return_value = start + timedelta(seconds=3 * ResultSets.ttl)
+        assert ResultSets.get(result_set_id) is None
+
+    def test_store_prunes_expired_sets(self, mock_now):
+        """Test that storing a result set deletes the rows of expired ones"""
+        from databass.db.models import SearchResultSet
+        start = mock_now.return_value
+        ResultSets.store([1])
+        mock_now.return_value = start + timedelta(seconds=ResultSets.ttl + 1)
+        current = ResultSets.store([2])
+        assert app_db.session.query(SearchResultSet.key).all() == [(current,)]
+
+    def test_evicts_least_recently_used(self, mocker, mock_now):
+        """Test that the least recently used result set is dropped when the store is full"""
+        start = mock_now.return_value
+        mocker.patch.object(ResultSets, 'max_sets', 2)
+        first = ResultSets.store([1])
+        mock_now.return_value = start + timedelta(seconds=1)
+        second = ResultSets.store([2])
+        mock_now.return_value = start + timedelta(seconds=2)
+        ResultSets.get(first)
+        mock_now.return_value = start + timedelta(seconds=3)
+        third = ResultSets.store([3])
+
+        assert ResultSets.get(second) is None
+        assert ResultSets.get(first) == [1]
+        assert ResultSets.get(third) == [3]
+
+    def test_shared_between_workers(self, tmp_path):
+        """Test that a result set stored by one worker can be read by another"""
+        def worker():
+            app = Flask(__name__)
+            app.config.update({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'databass.db'}"})
+            app_db.init_app(app)
+            return app
+
+        with worker().app_context():
+            Base.metadata.create_all(app_db.engine)
+            result_set_id = ResultSets.store([1])
+        with worker().app_context():
+            assert ResultSets.get(result_set_id) == [1]
+
+
+class TestSearchResultsRoute:
+    """Tests for GET /search_results"""
+
+    @pytest.fixture
+    def client(self):
+        app = Flask("databass")
+        app.config.update({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        app_db.init_app(app)
+        register_routes(app)
+        with app.app_context():
+            Base.metadata.create_all(app_db.engine)
+            with app.test_client() as client:
+                yield client
+            app_db.session.remove()
+
+    @staticmethod
+    def results(count):
+        return [
+            {"release": {"name": f"Release {i}"}, "artist": {"name": "Artist"}, "label": {"name": "Label"}}
+            for i in range(count)
+        ]
+
+    def test_pages_through_stored_results(self, client):
+        """Test that each page shows its slice of the stored results"""
+        result_set_id = ResultSets.store(self.results(15))
+
+        first = client.get(f"/search_results?id={result_set_id}&page=1")
+        second = client.get(f"/search_results?id={result_set_id}&page=2")
+
+        assert first.status_code == 200
+        assert b"Release 0<" in first.data and b"Release 9<" in first.data
+        assert b"Release 10<" not in first.data
+        assert second.status_code == 200
+        assert b"Release 10<" in second.data and b"Release 14<" in second.data
+        assert b"Release 9<" not in second.data
+        assert f'value="{result_set_id}"'.encode() in second.data
+
+    def test_expired_results(self, client, mock_now):
+        """Test that an expired result set asks the user to search again"""
+        result_set_id = ResultSets.store(self.results(3))
+        mock_now.return_value += timedelta(seconds=ResultSets.ttl + 1)
+
+        response = client.get(f"/search_results?id={result_set_id}&page=1")
+
+        assert response.status_code == 404
+        assert b"expired" in response.data
+
+    def test_unknown_id(self, client):
+        """Test that an unknown result set id is treated as expired"""
+        response = client.get("/search_results?id=unknown&page=1")
+        assert response.status_code == 404
@@ -126,7 +126,7 @@ class TestSubmit:
 class TestStats:
     # Tests for /stats
     def test_home_page_load_success(self, client, mocker):
-        mock_get_stats = mocker.patch("databass.routes.get_all_stats", return_value={})
+        mock_get_stats = mocker.patch("databass.routes.get_stats", return_value={})
         response = client.get("/stats")
         assert response.status_code == 200
         assert b"stats" in response.data
@@ -0,0 +1,164 @@
+import io
+import os
+import threading
+import pytest
+from PIL import Image
+from databass.image_index import ImageIndex
+from databass.thumbnails import Thumbnails
+
+
+def save_original(item_type, item_id, width=1200, height=1000, image_format="JPEG", ext=".jpg", mode="RGB"):
+    """Save a full-size original image and record it in the index, as Util.get_image does"""
+    directory = os.path.join(ImageIndex.img_dir, item_type)
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, f"{item_id}{ext}")
+    Image.new(mode, (width, height), "red").save(file_path, format=image_format)
+    ImageIndex.record(item_type, item_id, file_path)
+    return file_path
+
+
+class TestThumbnails:
+    """Test suite for Thumbnails"""
+
+    def test_generates_downscaled_webp(self, image_index):
+        """Test that the thumbnail fits the size, keeps the aspect ratio and is named after the original's version"""
+        save_original("release", 1)
+        thumbnail = Thumbnails.get("release", 1, 250)
+        version = ImageIndex.version("release", 1)
+        assert thumbnail == os.path.abspath(f"{ImageIndex.img_dir}/thumbs/250/{version}.webp")
+        with Image.open(thumbnail) as img:
+            assert img.format == "WEBP"
+            assert img.size == (250, 208)
+
+    def test_jpeg_format(self, image_index, monkeypatch):
+        """Test that thumbnails can be generated as JPEG, including from images with transparency"""
+        monkeypatch.setattr(Thumbnails, "image_format", "jpeg")
+        save_original("artist", 1, image_format="PNG", ext=".png", mode="RGBA")
+        with Image.open(Thumbnails.get("artist", 1, 64)) as img:
+            assert img.format == "JPEG"
+            assert max(img.size) == 64
+
+    def test_generated_once(self, image_index, mocker):
+        """Test that an up-to-date thumbnail is reused"""
+        save_original("release", 1)
+        Thumbnails.get("release", 1, 64)
+        mock_generate = mocker.patch.object(Thumbnails, "_generate")
+        Thumbnails.get("release", 1, 64)
+        mock_generate.assert_not_called()
+
+    def test_regenerated_when_original_replaced(self, image_index):
+        """Test that a replaced image gets new thumbnails"""
+        save_original("release", 1)
+        thumbnail = Thumbnails.get("release", 1, 64)
+        save_original("release", 1, width=500, height=1000)
+        replaced = Thumbnails.get("release", 1, 64)
+        assert replaced != thumbnail
+        with Image.open(replaced) as img:
+            assert img.size == (32, 64)
+
+    def test_shared_between_items(self, image_index, mocker):
+        """Test that items with identical images share their thumbnails"""
+        save_original("release", 1)
+        save_original("release", 2)
+        generate = Thumbnails._generate
+        mock_generate = mocker.patch.object(Thumbnails, "_generate", side_effect=generate)
+        assert Thumbnails.get("release", 1, 64) == Thumbnails.get("release", 2, 64)
+        assert mock_generate.call_count == 1
+
+    def test_concurrent_requests_generate_once(self, image_index, mocker):
+        """Test that concurrent requests for the same thumbnail generate it only once"""
+        save_original("release", 1)
+        generate = Thumbnails._generate
+        mock_generate = mocker.patch.object(Thumbnails, "_generate", side_effect=generate)
+        threads = [threading.Thread(target=Thumbnails.get, args=("release", 1, 500)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert mock_generate.call_count == 1
+        assert os.listdir(f"{ImageIndex.img_dir}/thumbs/500") == [f'{ImageIndex.version("release", 1)}.webp']
+
+    def test_locks_are_striped(self, image_index):
+        """Test that thumbnail paths share a fixed set of locks, however many thumbnails are generated"""
+        from databass.thumbnails import LOCK_STRIPES
+        for item_id in range(1, 4):
+            save_original("release", item_id, width=100 + item_id, height=100)
+            Thumbnails.generate_all("release", item_id)
+        assert len(Thumbnails._locks) == LOCK_STRIPES
+        thumbnail = Thumbnails.path(ImageIndex.version("release", 1), 64)
+        assert Thumbnails._lock_for(thumbnail) is Thumbnails._lock_for(thumbnail)
+
+    def test_unreadable_original(self, image_index):
+        """Test that an original that is not a valid image has no thumbnail"""
+        os.makedirs(f"{ImageIndex.img_dir}/label")
+        with open(f"{ImageIndex.img_dir}/label/1.jpg", "wb") as img_file:
+            img_file.write(b"not an image")
+        assert Thumbnails.get("label", 1, 64) is None
+        assert not os.path.exists(Thumbnails.path(ImageIndex.version("label", 1), 64))
+
+    def test_without_image(self, image_index):
+        """Test that items without an image have no thumbnail"""
+        assert Thumbnails.get("artist", 1, 64) is None
+
+    @pytest.mark.parametrize("requested,expected", [(1, 64), (64, 64), (100, 250), (500, 500), (501, None)])
+    def test_fit(self, requested, expected):
+        """Test that requested sizes are rounded up to the next available size"""
+        assert Thumbnails.fit(requested) == expected
+
+    def test_generate_all(self, image_index):
+        """Test that every size is generated, e.g. right after an image is downloaded"""
+        save_original("release", 1)
+        Thumbnails.generate_all("release", 1)
+        for size in Thumbnails.sizes:
+            assert os.path.exists(Thumbnails.path(ImageIndex.version("release", 1), size))
+
+    def test_not_indexed_as_originals(self, image_index):
+        """Test that thumbnails are not mistaken for images"""
+        save_original("release", 1)
+        Thumbnails.generate_all("release", 1)
+        ImageIndex.clear()
+        assert ImageIndex.ids("release") == {1}
+
+
+class TestServeThumbnail:
+    """Test suite for the size parameter of the /img/<type>/<id> route"""
+
+    def test_serves_thumbnail(self, image_client):
+        """Test that the requested size is served instead of the original"""
+        original = save_original("release", 1)
+        response = image_client.get("/img/release/1?size=200")
+        assert response.status_code == 200
+        assert response.mimetype == "image/webp"
+        with Image.open(io.BytesIO(response.data)) as img:
+            assert img.size == (250, 208)
+        assert len(response.data) < os.path.getsize(original)
+
+    def test_thumbnail_etag(self, image_client):
+        """Test that each size has its own ETag and can be revalidated"""
+        save_original("release", 1)
+        etag = image_client.get("/img/release/1?size=64").headers["ETag"]
+        assert etag == f'"{ImageIndex.version("release", 1)}-64"'
+        assert etag != image_client.get("/img/release/1").headers["ETag"]
+        response = image_client.get("/img/release/1?size=64", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_larger_than_available_sizes(self, image_client):
+        """Test that sizes larger than the largest thumbnail get the original"""
+        save_original("release", 1)
+        response = image_client.get("/img/release/1?size=2000")
+        assert response.mimetype == "image/jpeg"
+
+    def test_falls_back_to_original(self, image_client, mocker):
+        """Test that the original is served if the thumbnail cannot be generated"""
+        save_original("release", 1)
+        mocker.patch.object(Thumbnails, "_generate", side_effect=OSError("disk full"))
+        response = image_client.get("/img/release/1?size=64")
+        assert response.status_code == 200
+        assert response.mimetype == "image/jpeg"
+
+    def test_image_url_with_size(self, image_client):
+        """Test that templates can request a size"""
+        image_url = image_client.application.jinja_env.globals["image_url"]
+        save_original("artist", 1)
+        assert image_url("artist", 1, 250) == f'/img/artist/1?v={ImageIndex.version("artist", 1)}&size=250'
+        assert image_url("artist", 2, 250) == "/img/artist/2?size=250"